@@ -0,0 +1,320 @@
+import contextlib
+import copy
+import os
+
+from agent_gateway import Agent
+from agent_gateway.tools.logger import gateway_logger
+from snowflake.snowpark import Session
+
+from analyst_cache import CachedCortexAnalystTool
+from answer_streaming import (
+    AnswerStream,
+    FusionAnswerStreamer,
+    SentenceStreamer,
+    StreamingCortexCompleteAgent,
+)
+from async_python_tool import AsyncPythonTool
+from fixed_pipeline import AGENT_PIPELINE_MODE, FixedPipeline
+from invoice_search import (
+    INVOICE_SEARCH_MODE,
+    LocalInvoiceSearchTool,
+    invoice_search_index,
+)
+from resource_pool import ResourcePool
+from sarvam_ai_async_lang_tools import answer_translator, lang_detect, translate
+from stage_timing import StageTimedProxy, TimedCortexSearchTool, record_stage
+from tool_budget import BudgetedSearchMixin, tool_output_budget
+
+SNOWPARK_POOL_SIZE = int(os.getenv("SNOWPARK_POOL_SIZE", "4"))
+SNOWPARK_POOL_MIN_SIZE = int(os.getenv("SNOWPARK_POOL_MIN_SIZE", "1"))
+SNOWPARK_POOL_ACQUIRE_TIMEOUT_SECONDS = float(
+    os.getenv("SNOWPARK_POOL_ACQUIRE_TIMEOUT_SECONDS", "60")
+)
+SNOWPARK_POOL_HEALTH_CHECK_SECONDS = float(
+    os.getenv("SNOWPARK_POOL_HEALTH_CHECK_SECONDS", "300")
+)
+
+OUTPUT_PROMPT = """
+You are a helpful multi lingual analyst who can answer about customer support tickets. Guidelines for your tasks will be:
+1. Translates the question from detected language to english
+2. Send the translated question to the CortexAnalystTool to get the answer.
+3. Translate the answer back to the original language of the question using the 'answer_translator' tool.
+4. The answer should start with a marker 'Action: Finish' and end with a marker '<END_OF_RESPONSE>' with actual answer between the start and end marker.
+"""
+
+
+class BudgetedCortexSearchTool(BudgetedSearchMixin, TimedCortexSearchTool):
+    """Cortex Search tool whose passages are budgeted for the agent's fusion LLM."""
+
+
+class BudgetedLocalInvoiceSearchTool(BudgetedSearchMixin, LocalInvoiceSearchTool):
+    """Local invoice search tool whose passages, local or from Cortex Search, are budgeted."""
+
+
+def _required_env(name: str) -> str:
+    value = os.getenv(name)
+    if not value:
+        raise ValueError(f"{name} environment variable is not set.")
+    return value
+
+
+def connection_parameters_from_env() -> dict:
+    """Returns the Snowpark connection parameters configured through the environment."""
+    _required_env("PRIVATE_KEY_PASSPHRASE")
+    _required_env("SNOWFLAKE_DEFAULT_CONNECTION_NAME")
+    return {
+        "connection_name": os.getenv("SNOWFLAKE_DEFAULT_CONNECTION_NAME"),
+        "private_key_file_pwd": os.getenv("PRIVATE_KEY_PASSPHRASE"),
+        "database": os.getenv("SNOWFLAKE_DATABASE", "kamesh_llm_demo"),
+        "user": os.getenv("SNOWFLAKE_USER", "kameshs"),
+        "account": os.getenv("SNOWFLAKE_ACCOUNT"),
+        "schema": "DATA",
+        "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE", "COMPUTE_WH"),
+    }
+
+
+def tool_config_from_env() -> dict:
+    """Returns the Cortex tool settings configured through the environment."""
+    return {
+        "model_stage": _required_env("SEMANTIC_MODEL_STAGE"),
+        "semantic_model_file": _required_env("SEMANTIC_MODEL_FILE"),
+        "search_service_name": _required_env("SEARCH_SERVICE_NAME"),
+    }
+
+
+def create_session(connection_parameters: dict) -> Session:
+    """Creates a new Snowpark session with its database, schema and warehouse set."""
+    session = Session.builder.configs(connection_parameters).create()
+    # IMPORTANT: Set the database, schema, and warehouse for the session
+    session.use_database(connection_parameters["database"])
+    session.use_schema(connection_parameters["schema"])
+    session.use_warehouse(connection_parameters["warehouse"])
+    return session
+
+
+def build_tools(session: Session, tool_config: dict) -> list:
+    """Builds the language, Cortex Analyst and Cortex Search tools bound to the given session."""
+    analyst_config = {
+        "semantic_model": tool_config["semantic_model_file"],
+        "stage": tool_config["model_stage"],
+        "service_topic": "Customer support tickets model",
+        "data_description": "a table with customer support tickets",
+        "snowflake_connection": session,
+        "max_results": 5,
+    }
+
+    search_config = {
+        "service_name": tool_config["search_service_name"],
+        "service_topic": "Customer invoice related queries.",
+        "data_description": "Customer invoices and related documents",
+        "retrieval_columns": ["PARSED_TEXT", "URL"],
+        "snowflake_connection": session,
+        "k": 10,
+    }
+
+    if INVOICE_SEARCH_MODE == "local":
+        search_tool = BudgetedLocalInvoiceSearchTool(
+            index=invoice_search_index, **search_config
+        )
+    else:
+        search_tool = BudgetedCortexSearchTool(**search_config)
+
+    __language_identifier_config = {
+        "tool_description": "Identify the language of the question",
+        "output_description": "It should identify the language code and return it for other tools to use.",
+        "python_func": lang_detect,
+    }
+
+    __translator_config = {
+        "tool_description": "Use the identified language from the right tool (e.g., ta-IN for Tamil, hi-IN for Hindi, te-IN for Telugu) as the language code to translate the question to English and then pass the english question to Analyst tool.",
+        "output_description": "Returns English translation of the question",
+        "python_func": translate,
+    }
+
+    __answer_translator_config = {
+        "tool_description": "Translate the answer from English back to the original language of the question.",
+        "output_description": "Returns the answer translated from English to the original question's language.",
+        "python_func": answer_translator,
+    }
+
+    return [
+        AsyncPythonTool(**__language_identifier_config),
+        AsyncPythonTool(**__translator_config),
+        CachedCortexAnalystTool(**analyst_config),
+        search_tool,
+        AsyncPythonTool(**__answer_translator_config),
+    ]
+
+
+def build_agent(session: Session, tools: list, enable_trulens: bool = False):
+    """Builds the agent over the given tools, wrapped for TruLens monitoring when enabled."""
+    if enable_trulens:
+        # TruLens is an optional dependency and slow to import, so it is only loaded when enabled
+        from agent_gateway import TruAgent
+        from trulens.core.database.connector.default import DefaultDBConnector
+
+        connector = DefaultDBConnector()
+        agent = TruAgent(
+            app_name="linguatics_agent_demo",
+            app_version="v0.0.1",
+            trulens_snowflake_connection=connector,
+            snowflake_connection=session,
+            tools=tools,
+            max_retries=3,
+        )
+        # TODO
+        # session = TruSession(connector=connector)
+        # run_dashboard(session, port=8084, force=True)
+    else:
+        agent = Agent(
+            snowflake_connection=session,
+            agent_llm="claude-3-5-sonnet",
+            tools=tools,
+            fusion_prompt=OUTPUT_PROMPT,
+        )
+    return agent
+
+
+class AgentResources:
+    """A warmed Snowpark session together with the tools, agent and fixed pipeline built on it."""
+
+    def __init__(self, session: Session, tools: list, agent):
+        self.session = session
+        self.tools = tools
+        self.agent = agent
+        self.pipeline = FixedPipeline(session, tools)
+
+    @classmethod
+    def create(
+        cls,
+        connection_parameters: dict,
+        tool_config: dict,
+        enable_trulens: bool = False,
+    ) -> "AgentResources":
+        session = create_session(connection_parameters)
+        tools = build_tools(session, tool_config)
+        return cls(session, tools, build_agent(session, tools, enable_trulens))
+
+    def is_healthy(self) -> bool:
+        self.session.sql("SELECT 1").collect()
+        return True
+
+    def close(self):
+        self.session.close()
+
+    def agent_with_memory(self, memory: list, streamer: SentenceStreamer | None = None):
+        """
+        Returns the pooled agent bound to a conversation's memory.
+
+        The agent keeps the previous questions and answers of a conversation in ``memory_context``;
+        a shallow copy shares the planner, LLM and tools but appends to the given list instead, so
+        conversations served by the same pooled agent do not see each other's history.
+        With a ``streamer``, the copy's fusion LLM streams the final answer into it as it is written.
+        The copy's planning and fusion LLM calls are recorded as the "planner" and "fusion" stages.
+        TruAgent wraps its agent for instrumentation and is returned as is.
+        """
+        if not isinstance(self.agent, Agent):
+            return self.agent
+        agent = copy.copy(self.agent)
+        agent.memory_context = memory
+        fusion_agent = self.agent.agent
+        if streamer is not None:
+            fusion_agent = StreamingCortexCompleteAgent(
+                session=self.agent.agent.session,
+                llm=self.agent.agent.llm,
+                on_text=FusionAnswerStreamer(streamer),
+            )
+        agent.planner = StageTimedProxy(self.agent.planner, "plan", "planner")
+        agent.agent = StageTimedProxy(fusion_agent, "arun", "fusion")
+        return agent
+
+
+def create_agent_pool(
+    connection_parameters: dict,
+    tool_config: dict,
+    enable_trulens: bool = False,
+    max_size: int = SNOWPARK_POOL_SIZE,
+) -> ResourcePool:
+    """Creates the process-wide pool of AgentResources sized by the SNOWPARK_POOL_* settings."""
+    return ResourcePool(
+        create=lambda: AgentResources.create(
+            connection_parameters, tool_config, enable_trulens
+        ),
+        close=AgentResources.close,
+        is_healthy=AgentResources.is_healthy,
+        max_size=max_size,
+        min_size=SNOWPARK_POOL_MIN_SIZE,
+        acquire_timeout=SNOWPARK_POOL_ACQUIRE_TIMEOUT_SECONDS,
+        health_check_interval=SNOWPARK_POOL_HEALTH_CHECK_SECONDS,
+    )
+
+
+async def answer_prompt(
+    agent_pool: ResourcePool,
+    prompt: str,
+    memory: list,
+    answer_stream: AnswerStream | None = None,
+    pipeline_mode: str = AGENT_PIPELINE_MODE,
+) -> dict:
+    """
+    Answers a prompt with pooled AgentResources, as done for every prompt of the chat and batch runs.
+
+    In "fixed" mode the fixed pipeline is tried first and the agent answers the prompts it cannot
+    route or fails on. The whole answer is recorded as the "prompt" stage, the root span of the
+    request's trace, with the pool wait and the pipeline and agent runs as stages within it.
+    The Cortex tool outputs of the agent run share one ``tool_output_budget``.
+
+    Args:
+        agent_pool (ResourcePool): The pool created by ``create_agent_pool``.
+        prompt (str): The question, in any supported language.
+        memory (list): The conversation's previous questions and answers, appended to.
+        answer_stream (AnswerStream | None): Receives the answer while it is generated, if given.
+        pipeline_mode (str): "agent" or "fixed", see AGENT_PIPELINE_MODE.
+
+    Returns:
+        dict: The ``{"output", "sources"}`` result of the pipeline or agent.
+    """
+    with record_stage("prompt", input_chars=len(prompt)) as span:
+        response = await _answer_prompt(
+            agent_pool, prompt, memory, answer_stream, pipeline_mode
+        )
+        if span is not None:
+            span.set(output_chars=len(str(response["output"])))
+        return response
+
+
+async def _answer_prompt(
+    agent_pool: ResourcePool,
+    prompt: str,
+    memory: list,
+    answer_stream: AnswerStream | None,
+    pipeline_mode: str,
+) -> dict:
+    async with contextlib.AsyncExitStack() as stack:
+        with record_stage("pool_wait"):
+            resources = await stack.enter_async_context(agent_pool.aacquire())
+
+        if pipeline_mode == "fixed":
+            try:
+                with record_stage("pipeline"):
+                    response = await resources.pipeline.acall(
+                        prompt, memory, answer_stream
+                    )
+                if response is not None:
+                    return response
+            except Exception as e:
+                gateway_logger.log("WARNING", f"Fixed pipeline failed: {e}")
+
+        with record_stage("agent"), tool_output_budget():
+            if answer_stream is None:
+                return await resources.agent_with_memory(memory).acall(prompt)
+
+            answer_stream.reset()
+            streamer = SentenceStreamer(answer_stream)
+            agent = resources.agent_with_memory(memory, streamer)
+            try:
+                response = await agent.acall(prompt)
+                await streamer.aclose()
+            finally:
+                streamer.cancel()
+            return response
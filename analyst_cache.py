@@ -0,0 +1,319 @@
+import asyncio
+import copy
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+from agent_gateway.tools import CortexAnalystTool
+from agent_gateway.tools.logger import gateway_logger
+from agent_gateway.tools.snowflake_tools import SnowflakeError
+from agent_gateway.tools.utils import _determine_runtime, post_cortex_request
+
+from stage_timing import record_stage
+from tool_budget import budget_analyst_result
+from tracing import set_span_attributes
+from translation_cache import normalize_text
+
+ANALYST_CACHE_MAX_ENTRIES = int(os.getenv("ANALYST_CACHE_MAX_ENTRIES", "256"))
+# 0 disables the cache
+ANALYST_CACHE_TTL_SECONDS = float(os.getenv("ANALYST_CACHE_TTL_SECONDS", "3600"))
+# How often the semantic model file and watched tables are checked for changes
+ANALYST_CACHE_FRESHNESS_CHECK_SECONDS = float(
+    os.getenv("ANALYST_CACHE_FRESHNESS_CHECK_SECONDS", "30")
+)
+# Comma separated tables whose changes invalidate cached result sets
+ANALYST_CACHE_WATCH_TABLES = [
+    t.strip().upper()
+    for t in os.getenv("ANALYST_CACHE_WATCH_TABLES", "SUPPORT_TICKETS").split(",")
+    if t.strip()
+]
+
+
+def normalize_question(question: str) -> str:
+    """Normalizes an English question for cache lookups: case, whitespace and end of word punctuation."""
+    return re.sub(r"[?.!,;:]+(?=\s|$)", "", normalize_text(question).lower())
+
+
+class _TTLCache:
+    """Thread-safe in-memory LRU with a per entry TTL."""
+
+    def __init__(self, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class AnalystResultCache:
+    """
+    Process-wide cache of Cortex Analyst answers.
+
+    Two maps are kept: question → the Cortex Analyst message with the generated SQL, keyed on the
+    normalized question, the semantic model file and its stage version, and SQL → result set, keyed
+    on the state of the watched tables. When only the data changed the cached message is replayed,
+    re-running its SQL on the warehouse, and the Cortex Analyst call is still skipped; when the
+    semantic model changed, both are regenerated.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = ANALYST_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = ANALYST_CACHE_TTL_SECONDS,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.ttl_seconds = ttl_seconds
+        self._sql = _TTLCache(max_entries, ttl_seconds)
+        self._results = _TTLCache(max_entries, ttl_seconds)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.sql_hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.ttl_seconds > 0
+
+    def get_message(self, question_key: tuple) -> list | None:
+        message = self._sql.get(question_key)
+        return copy.deepcopy(message) if message is not None else None
+
+    def put_message(self, question_key: tuple, message: list):
+        self._sql.put(question_key, copy.deepcopy(message))
+
+    def get_result(self, result_key: tuple) -> dict | None:
+        result = self._results.get(result_key)
+        return copy.deepcopy(result) if result is not None else None
+
+    def put_result(self, result_key: tuple, result: dict):
+        self._results.put(result_key, copy.deepcopy(result))
+
+    def record(self, outcome: str):
+        with self._lock:
+            setattr(self, outcome, getattr(self, outcome) + 1)
+        set_span_attributes(analyst_cache=outcome)
+
+    def clear(self):
+        self._sql.clear()
+        self._results.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "sql_hits": self.sql_hits,
+                "misses": self.misses,
+                "uncacheable": self.uncacheable,
+                "sql_entries": len(self._sql),
+                "result_entries": len(self._results),
+            }
+
+
+analyst_cache = AnalystResultCache()
+
+
+class CachedCortexAnalystTool(CortexAnalystTool):
+    """
+    CortexAnalystTool that serves repeated questions from ``analyst_cache``.
+
+    The stage version of the semantic model file (its MD5 from ``LIST``) and the row count and
+    last altered time of the watched tables are looked up at most once every
+    ``freshness_check_seconds``, so a cache hit costs no Cortex Analyst call and at most one
+    metadata query. Responses without SQL, such as requests to rephrase, are not cached.
+    The generated SQL runs on the warehouse in a thread, so a slow query does not hold up the other
+    requests sharing the event loop.
+    Within an agent run, result sets are budgeted for the fusion LLM, see ``tool_output_budget``;
+    the cache keeps them whole.
+    """
+
+    def __init__(
+        self,
+        *args,
+        cache: AnalystResultCache = analyst_cache,
+        watch_tables: list[str] = ANALYST_CACHE_WATCH_TABLES,
+        freshness_check_seconds: float = ANALYST_CACHE_FRESHNESS_CHECK_SECONDS,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self.cache = cache
+        self.watch_tables = watch_tables
+        self.freshness_check_seconds = freshness_check_seconds
+        self._versions = None
+        self._versions_checked_at = 0.0
+        self._versions_lock = threading.Lock()
+
+    def _fetch_versions(self) -> tuple[str, tuple]:
+        cursor = self.connection.cursor()
+        stage_rows = cursor.execute(
+            f"LIST @{self.connection.database}.{self.connection.schema}.{self.STAGE}/{self.FILE}"
+        ).fetchall()
+        # name, size, md5, last_modified
+        stage_version = "|".join(str(row[2]) for row in stage_rows)
+
+        table_versions = ()
+        if self.watch_tables:
+            placeholders = ", ".join(["%s"] * len(self.watch_tables))
+            table_versions = tuple(
+                cursor.execute(
+                    "SELECT TABLE_NAME, ROW_COUNT, LAST_ALTERED FROM INFORMATION_SCHEMA.TABLES "
+                    f"WHERE TABLE_SCHEMA = CURRENT_SCHEMA() AND TABLE_NAME IN ({placeholders}) "
+                    "ORDER BY TABLE_NAME",
+                    self.watch_tables,
+                ).fetchall()
+            )
+        return stage_version, table_versions
+
+    def _is_fresh(self) -> bool:
+        return (
+            self._versions is not None
+            and time.monotonic() - self._versions_checked_at
+            < self.freshness_check_seconds
+        )
+
+    def _refresh_versions(self) -> tuple[str, tuple]:
+        with self._versions_lock:
+            if not self._is_fresh():
+                versions = self._fetch_versions()
+                if self._versions is not None and versions != self._versions:
+                    gateway_logger.log(
+                        "INFO", "Semantic model or watched tables changed"
+                    )
+                self._versions = versions
+                self._versions_checked_at = time.monotonic()
+            return self._versions
+
+    async def _current_versions(self) -> tuple[str, tuple]:
+        with self._versions_lock:
+            if self._is_fresh():
+                return self._versions
+        return await asyncio.to_thread(self._refresh_versions)
+
+    def _process_analyst_message(self, response):
+        with record_stage("warehouse_query") as span:
+            result = super()._process_analyst_message(response)
+            if span is not None:
+                span.set(output_chars=len(str(result.get("output", ""))))
+            return result
+
+    @staticmethod
+    def _statement(content) -> str | None:
+        """The SQL of a Cortex Analyst message's content, None when it answered with text."""
+        if not isinstance(content, list):
+            return None
+        return next(
+            (
+                item.get("statement")
+                for item in content
+                if isinstance(item, dict) and item.get("type") == "sql"
+            ),
+            None,
+        )
+
+    async def _run_message(self, content) -> dict:
+        try:
+            return await asyncio.to_thread(self._process_analyst_message, content)
+        except KeyError:
+            # A message without text whose SQL returned no rows
+            raise SnowflakeError(message="Invalid Cortex Analyst Response")
+
+    async def _analyst_query(self, query) -> tuple[dict, list | None]:
+        """
+        ``CortexAnalystTool.query``, with the generated SQL run on the warehouse in a thread so that
+        a slow query does not block the other requests on the event loop.
+
+        Returns:
+            tuple: The result and the content of the Cortex Analyst message when it has SQL, None
+            when it answered with text.
+        """
+        gateway_logger.log("DEBUG", f"Cortex Analyst Prompt:{query}")
+        url, headers, data = self._prepare_analyst_request(prompt=query)
+        response_text = await post_cortex_request(url=url, headers=headers, data=data)
+        json_response = json.loads(response_text)
+        gateway_logger.log("DEBUG", f"Cortex Analyst Raw Response: {json_response}")
+
+        try:
+            if _determine_runtime() and isinstance(json_response["content"], str):
+                content = json.loads(json_response["content"])["message"]["content"]
+            else:
+                content = json_response["message"]["content"]
+        except KeyError:
+            raise SnowflakeError(message=json_response.get("message", "Unknown error"))
+        result = await self._run_message(content)
+        return result, content if self._statement(content) is not None else None
+
+    async def query(self, query):
+        with record_stage("cortex_analyst", input_chars=len(query)) as span:
+            result = await self._cached_query(query)
+            if span is not None:
+                span.set(output_chars=len(str(result.get("output", ""))))
+            return budget_analyst_result(result)
+
+    async def _cached_query(self, query):
+        if not self.cache.enabled:
+            return (await self._analyst_query(query))[0]
+
+        try:
+            stage_version, table_versions = await self._current_versions()
+        except Exception as e:
+            gateway_logger.log("WARNING", f"Cortex Analyst cache check failed: {e}")
+            self.cache.record("uncacheable")
+            return (await self._analyst_query(query))[0]
+
+        question_key = (normalize_question(query), self.STAGE, self.FILE, stage_version)
+        message = self.cache.get_message(question_key)
+        if message is not None:
+            sql = self._statement(message)
+            result_key = (sql, table_versions)
+            result = self.cache.get_result(result_key)
+            if result is not None:
+                self.cache.record("hits")
+                gateway_logger.log("DEBUG", "Cortex Analyst cache hit")
+                return result
+
+            # The data changed but the question still maps to the same SQL
+            self.cache.record("sql_hits")
+            gateway_logger.log("DEBUG", f"Cortex Analyst cached SQL: {sql}")
+            result = await self._run_message(message)
+            self.cache.put_result(result_key, result)
+            return result
+
+        result, message = await self._analyst_query(query)
+        if message is None:
+            self.cache.record("uncacheable")
+            return result
+        self.cache.record("misses")
+        self.cache.put_message(question_key, message)
+        self.cache.put_result((self._statement(message), table_versions), result)
+        return result
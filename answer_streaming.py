@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import re
+import threading
+from typing import Awaitable, Callable
+
+import aiohttp
+from agent_gateway.gateway.gateway import AgentGatewayError, CortexCompleteAgent
+from agent_gateway.tools.logger import gateway_logger
+from agent_gateway.tools.utils import _determine_runtime
+
+# Renders the answer sentence by sentence while it is generated; the final answer is unchanged
+ANSWER_STREAMING = os.getenv("ANSWER_STREAMING", "false").lower() == "true"
+
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?\u0964\u0965])\s+|\n+")
+_FINISH_MARKER = "Action: Finish"
+_END_MARKER = "<END_OF_RESPONSE>"
+_ANSWER_SUFFIX_RE = re.compile(r"(?:\s*\))?\s*$")
+
+
+class AnswerStream:
+    """Partial answer text written on the agent's event loop and read by the Streamlit script thread."""
+
+    def __init__(self):
+        self._parts = []
+        self._lock = threading.Lock()
+
+    def append(self, text: str):
+        with self._lock:
+            self._parts.append(text)
+
+    def reset(self):
+        with self._lock:
+            self._parts.clear()
+
+    def text(self) -> str:
+        with self._lock:
+            return "".join(self._parts)
+
+
+class SentenceStreamer:
+    """
+    Splits streamed text into sentences and publishes each one to an AnswerStream as soon as it is
+    complete, translated with ``translate`` when given.
+
+    Sentences are translated concurrently but published in order. Must be fed on a running event loop;
+    call ``aclose`` once the text is complete to publish the last sentence, or ``cancel`` to drop it.
+    """
+
+    def __init__(
+        self,
+        stream: AnswerStream,
+        translate: Callable[[str], Awaitable[str]] | None = None,
+    ):
+        self.stream = stream
+        self.translate = translate
+        self._buffer = ""
+        self._pending = asyncio.Queue()
+        self._publisher = None
+
+    def feed(self, text: str):
+        self._buffer += text
+        end = 0
+        for match in _SENTENCE_END_RE.finditer(self._buffer):
+            self._emit(self._buffer[end : match.start()], match.group())
+            end = match.end()
+        self._buffer = self._buffer[end:]
+
+    def _emit(self, sentence: str, separator: str):
+        if self._publisher is None:
+            self._publisher = asyncio.create_task(self._publish())
+        self._pending.put_nowait(
+            (asyncio.create_task(self._translate(sentence)), separator)
+        )
+
+    async def _translate(self, sentence: str) -> str:
+        if self.translate is None or not sentence.strip():
+            return sentence
+        try:
+            return await self.translate(sentence.strip())
+        except Exception as e:
+            gateway_logger.log("WARNING", f"Streaming translation failed: {e}")
+            return sentence
+
+    async def _publish(self):
+        while (item := await self._pending.get()) is not None:
+            task, separator = item
+            self.stream.append(await task + separator)
+
+    async def aclose(self):
+        if self._buffer:
+            self._emit(self._buffer, "")
+            self._buffer = ""
+        if self._publisher is not None:
+            self._pending.put_nowait(None)
+            await self._publisher
+
+    def cancel(self):
+        if self._publisher is not None and not self._publisher.done():
+            self._publisher.cancel()
+        while not self._pending.empty():
+            item = self._pending.get_nowait()
+            if item is not None:
+                item[0].cancel()
+
+
+def fusion_answer_prefix(completion: str) -> str:
+    """
+    Returns the part of a partially generated fusion output that is known to belong to the answer.
+
+    The answer follows the ``Action: Finish`` marker and ends at ``<END_OF_RESPONSE>``, see
+    ``Agent._extract_answer``; a trailing fragment that may be the closing parenthesis or the start of
+    the end marker is held back.
+    """
+    start = completion.find(_FINISH_MARKER)
+    if start == -1:
+        return ""
+    answer = completion[start + len(_FINISH_MARKER) :].lstrip("( \n")
+    end = answer.find(_END_MARKER)
+    if end != -1:
+        answer = answer[:end]
+    else:
+        for size in range(len(_END_MARKER) - 1, 0, -1):
+            if answer.endswith(_END_MARKER[:size]):
+                answer = answer[:-size]
+                break
+    # The closing parenthesis of "Action: Finish(...)" is not part of the answer
+    return _ANSWER_SUFFIX_RE.sub("", answer)
+
+
+class FusionAnswerStreamer:
+    """Forwards the answer portion of a streamed fusion output to a SentenceStreamer."""
+
+    def __init__(self, streamer: SentenceStreamer):
+        self.streamer = streamer
+        self._forwarded = ""
+
+    def __call__(self, completion: str):
+        answer = fusion_answer_prefix(completion)
+        if not answer.startswith(self._forwarded):
+            # Another fusion attempt, the final answer replaces what was streamed
+            return
+        self.streamer.feed(answer[len(self._forwarded) :])
+        self._forwarded = answer
+
+
+class StreamingCortexCompleteAgent(CortexCompleteAgent):
+    """
+    CortexCompleteAgent that reads the completion as it is generated and calls ``on_text`` with the
+    text received so far. Returns the same completion as ``CortexCompleteAgent.arun``.
+    """
+
+    def __init__(self, session, llm, on_text: Callable[[str], None]) -> None:
+        super().__init__(session=session, llm=llm)
+        self.on_text = on_text
+
+    async def arun(self, prompt: str) -> str:
+        if _determine_runtime():
+            # Inside Snowflake the request goes through _snowflake and cannot be streamed
+            completion = await super().arun(prompt)
+            self.on_text(completion)
+            return completion
+
+        headers, url, data = self._prepare_llm_request(prompt=prompt)
+        completion = ""
+        raw_lines = []
+        try:
+            async with aiohttp.ClientSession(headers=headers) as session:
+                async with session.post(url=url, json=data) as response:
+                    async for line in response.content:
+                        line = line.decode("utf-8").strip()
+                        raw_lines.append(line)
+                        if not line.startswith("data: "):
+                            continue
+                        try:
+                            delta = json.loads(line[6:])["choices"][0]["delta"]
+                        except (ValueError, KeyError, IndexError):
+                            continue
+                        if delta.get("content"):
+                            completion += delta["content"]
+                            self.on_text(completion)
+        except Exception as e:
+            raise AgentGatewayError(
+                message=f"Failed Cortex LLM Request. See details:{str(e)}"
+            ) from e
+
+        if not completion:
+            response_text = "\n".join(raw_lines)
+            try:
+                return self._parse_snowflake_response(response_text)
+            except Exception:
+                raise AgentGatewayError(
+                    message=f"Failed Cortex LLM Request. Unable to parse response. See details:{response_text}"
+                )
+        return completion
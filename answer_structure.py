@@ -0,0 +1,262 @@
+import os
+import re
+import threading
+from pathlib import Path
+from typing import NamedTuple
+
+from agent_gateway.tools.logger import gateway_logger
+
+# Translate only the prose of answers, passing tables, SQL, IDs, numbers and glossary terms through
+ANSWER_TRANSLATION_STRUCTURED = (
+    os.getenv("ANSWER_TRANSLATION_STRUCTURED", "true").lower() == "true"
+)
+# Semantic model whose table and column names, sample values and identifier-like synonyms are
+# kept verbatim in translated answers; empty disables the glossary
+ANSWER_GLOSSARY_PATH = os.getenv(
+    "ANSWER_GLOSSARY_PATH",
+    str(Path(__file__).resolve().parent / "scripts" / "data" / "support_tickets.yaml"),
+)
+# Sample values longer than this are free text, e.g. ticket requests, and are translated
+ANSWER_GLOSSARY_MAX_TERM_CHARS = int(os.getenv("ANSWER_GLOSSARY_MAX_TERM_CHARS", "40"))
+
+_FENCE_RE = re.compile(r"^\s*(```|~~~)")
+_TABLE_ROW_RE = re.compile(r"^\s*\|")
+# Upper case SQL keywords starting a statement. It continues up to a line ending in ";", a blank
+# line or a line of prose
+_SQL_START_RE = re.compile(
+    r"^\s*(SELECT|WITH\s+\w+\s+AS|INSERT\s+INTO|UPDATE|DELETE\s+FROM|CREATE|SHOW|DESCRIBE)\b"
+)
+_SQL_STRING_RE = re.compile(r"'[^']*'")
+# A lower case word, which SQL written in upper case keywords only has in string literals
+_PROSE_WORD_RE = re.compile(r"\b[a-z]{2,}\b")
+_LETTER_RE = re.compile(r"[^\W\d_]")
+# Bullets, numbering, headings and quotes in front of a line of prose
+_PREFIX_RE = re.compile(r"^\s*(?:(?:[-*+]|\d+[.)]|#{1,6}|>)\s+)*")
+_INLINE_PATTERNS = [
+    r"`[^`\n]+`",
+    r"https?://[^\s)>\]]+",
+    r"[\w.+-]+@[\w-]+(?:\.[\w-]+)+",
+    # Identifiers: ticket and invoice numbers, column names
+    r"\b[A-Z]{1,5}-?\d{2,}\b",
+    r"\b[A-Za-z][A-Za-z0-9]*_[A-Za-z0-9_]+\b",
+    # Amounts, counts, percentages and dates
+    r"[$₹€£]?\d[\d,]*(?:\.\d+)?(?:[-/:]\d+)*%?",
+]
+# Kept in the text sent for translation in place of a protected span, restored afterwards
+_PLACEHOLDER = "{{{}}}"
+_PLACEHOLDER_RE = re.compile(r"\{(\d+)\}")
+_ID_SHAPE_RE = re.compile(r"^([A-Z]+)-?\d+$")
+
+
+def load_glossary(path: str | None = ANSWER_GLOSSARY_PATH) -> list[str]:
+    """
+    Reads the terms of a Cortex Analyst semantic model that must not be translated.
+
+    These are the table and column names, the sample values of the columns up to
+    ``ANSWER_GLOSSARY_MAX_TERM_CHARS`` characters, and the synonyms that are identifiers (contain
+    an underscore); synonyms that are plain words are translated like the rest of the prose.
+    """
+    if not path or not Path(path).is_file():
+        return []
+    import yaml
+
+    model = yaml.safe_load(Path(path).read_text(encoding="utf-8")) or {}
+    terms = set()
+    for table in model.get("tables", []):
+        terms.add(table["name"])
+        for kind in ("dimensions", "time_dimensions", "measures", "facts"):
+            for column in table.get(kind) or []:
+                terms.add(column["name"])
+                terms.update(
+                    str(value)
+                    for value in column.get("sample_values") or []
+                    if len(str(value)) <= ANSWER_GLOSSARY_MAX_TERM_CHARS
+                )
+                terms.update(s for s in column.get("synonyms") or [] if "_" in s)
+    return sorted(t for t in terms if t.strip())
+
+
+def protected_span_pattern(glossary: list[str]) -> re.Pattern:
+    """The pattern of the spans of prose kept verbatim: the built-in patterns and the glossary terms."""
+    patterns = list(_INLINE_PATTERNS)
+    # Values shaped like the glossary's IDs, e.g. any TR<number> for the sample TR483
+    prefixes = sorted(
+        {m.group(1) for m in map(_ID_SHAPE_RE.match, glossary) if m is not None}
+    )
+    if prefixes:
+        patterns.append(rf"\b(?:{'|'.join(prefixes)})-?\d+\b")
+    if glossary:
+        # Longest first, so that "Business Internet" wins over a shorter term it contains
+        terms = sorted(glossary, key=len, reverse=True)
+        patterns.append(rf"(?<![\w@.])(?:{'|'.join(map(re.escape, terms))})(?![\w@])")
+    return re.compile("|".join(f"(?:{p})" for p in patterns))
+
+
+def _is_prose(line: str, pattern: re.Pattern) -> bool:
+    """
+    Whether a line cannot continue an SQL statement: it is blank, starts with markdown list,
+    heading or quote syntax, or has lower case words outside string literals and protected spans.
+    """
+    if not line.strip() or _PREFIX_RE.match(line).group(0).strip():
+        return True
+    return (
+        _PROSE_WORD_RE.search(pattern.sub("", _SQL_STRING_RE.sub("", line))) is not None
+    )
+
+
+class _Line(NamedTuple):
+    # Markdown prefix of prose, or the whole line when it is protected
+    prefix: str
+    # Prose with the protected spans replaced by placeholders, None for protected lines
+    text: str | None
+    # The protected spans of the prose, by placeholder number
+    spans: dict[int, str]
+    # The prose as in the answer
+    source: str = ""
+
+
+class TranslationPlan:
+    """
+    An answer split into lines of translatable prose and protected structure.
+
+    Code blocks, markdown tables, SQL statements and lines without words are protected as a whole.
+    In prose lines, the markdown prefix and the spans matching ``protected_span_pattern`` are
+    protected: the spans are replaced by numbered placeholders, so that the prose is translated as
+    whole sentences, and put back afterwards. Prose lines are batched into requests of at most
+    ``max_chars`` characters, one line per line of the request.
+
+    Translations of batches are accepted with ``accept``; lines whose translation could not be
+    matched back to them (lines merged or split, placeholders lost) are returned so that they can be
+    translated on their own with ``line_text`` and ``accept_line``. ``text`` rebuilds the answer.
+    """
+
+    def __init__(self, answer: str, pattern: re.Pattern, max_chars: int):
+        self.answer = answer
+        self.lines = []
+        counter = 0
+        in_fence = in_sql = False
+        for line in answer.split("\n"):
+            if _FENCE_RE.match(line):
+                in_fence = not in_fence
+                protected = True
+            else:
+                in_sql = bool(_SQL_START_RE.match(line)) or (
+                    in_sql and not _is_prose(line, pattern)
+                )
+                protected = (
+                    in_fence
+                    or in_sql
+                    or _TABLE_ROW_RE.match(line) is not None
+                    or _LETTER_RE.search(pattern.sub("", line)) is None
+                )
+                # The statement ends with its semicolon
+                in_sql = in_sql and not line.rstrip().endswith(";")
+            if protected:
+                self.lines.append(_Line(line, None, {}))
+                continue
+
+            prefix = _PREFIX_RE.match(line).group(0)
+            spans = {}
+
+            def _protect(match):
+                nonlocal counter
+                spans[counter] = match.group(0)
+                counter += 1
+                return _PLACEHOLDER.format(counter - 1)
+
+            source = line[len(prefix) :]
+            text = pattern.sub(_protect, source)
+            self.lines.append(_Line(prefix, text, spans, source))
+
+        self._translations = {}
+        self.batches = []
+        size = 0
+        for index, line in enumerate(self.lines):
+            if line.text is None:
+                continue
+            if self.batches and size + 1 + len(line.text) <= max_chars:
+                self.batches[-1].append(index)
+                size += 1 + len(line.text)
+            else:
+                self.batches.append([index])
+                size = len(line.text)
+
+    @property
+    def translated_chars(self) -> int:
+        """Characters of the answer sent for translation."""
+        return sum(len(line.text) for line in self.lines if line.text is not None)
+
+    def batch_text(self, batch: list[int]) -> str:
+        return "\n".join(self.lines[i].text for i in batch)
+
+    def line_text(self, index: int, protected: bool = True) -> str:
+        """The prose of a line, with placeholders or, when ``protected`` is False, as in the answer."""
+        line = self.lines[index]
+        return line.text if protected else line.source
+
+    @staticmethod
+    def _restore(text: str, spans: dict[int, str]) -> str | None:
+        found = [int(n) for n in _PLACEHOLDER_RE.findall(text)]
+        if sorted(found) != sorted(spans):
+            return None
+        return _PLACEHOLDER_RE.sub(lambda m: spans[int(m.group(1))], text)
+
+    def accept_line(self, index: int, translation: str, protected: bool = True) -> bool:
+        """Takes the translation of ``line_text``; False when its placeholders do not match the line's."""
+        line = self.lines[index]
+        if not protected:
+            self._translations[index] = translation
+            return True
+        restored = self._restore(translation.strip(), line.spans)
+        if restored is None:
+            return False
+        self._translations[index] = restored
+        return True
+
+    def accept(self, batch: list[int], translation: str) -> list[int]:
+        """Takes the translation of ``batch_text`` and returns the lines that must be translated on their own."""
+        translated = translation.strip("\n").split("\n")
+        if len(translated) != len(batch):
+            return list(batch)
+        return [
+            index
+            for index, text in zip(batch, translated)
+            if not self.accept_line(index, text)
+        ]
+
+    def text(self) -> str:
+        return "\n".join(
+            line.prefix + self._translations.get(index, "")
+            if line.text is not None
+            else line.prefix
+            for index, line in enumerate(self.lines)
+        )
+
+
+class AnswerStructure:
+    """Plans structure-aware answer translations with the glossary, loaded on first use."""
+
+    def __init__(self, glossary_path: str | None = ANSWER_GLOSSARY_PATH):
+        self.glossary_path = glossary_path
+        self._pattern = None
+        self._lock = threading.Lock()
+
+    def _span_pattern(self) -> re.Pattern:
+        with self._lock:
+            if self._pattern is None:
+                try:
+                    glossary = load_glossary(self.glossary_path)
+                except Exception as e:
+                    gateway_logger.log(
+                        "WARNING",
+                        f"Unable to load the answer glossary {self.glossary_path}: {e}",
+                    )
+                    glossary = []
+                self._pattern = protected_span_pattern(glossary)
+            return self._pattern
+
+    def plan(self, answer: str, max_chars: int) -> TranslationPlan:
+        return TranslationPlan(answer, self._span_pattern(), max_chars)
+
+
+answer_structure = AnswerStructure()
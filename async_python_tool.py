@@ -0,0 +1,63 @@
+import contextvars
+import functools
+import inspect
+
+from agent_gateway.tools import PythonTool
+
+from stage_timing import record_stage
+
+
+def _set_payload_sizes(span, args: tuple, kwargs: dict, output):
+    span.set(
+        input_chars=sum(len(str(a)) for a in (*args, *kwargs.values())),
+        output_chars=len(str(output)) if output is not None else 0,
+    )
+
+
+class AsyncPythonTool(PythonTool):
+    """
+    PythonTool that accepts coroutine functions.
+
+    ``PythonTool`` runs its function in the event loop's default thread pool. Coroutine functions
+    are instead awaited directly on the agent's event loop, so async I/O does not occupy a thread.
+    The result has the same shape as the one of ``PythonTool``. Calls are recorded as a stage named
+    after the function, with the size of their arguments and output when tracing is enabled.
+    """
+
+    def asyncify(self, func):
+        if not inspect.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            def run_in_context(context, *args, **kwargs):
+                return context.run(func, *args, **kwargs)
+
+            run_in_executor = super().asyncify(run_in_context)
+
+            async def timed_func(*args, **kwargs):
+                with record_stage(func.__name__) as span:
+                    # The executor thread does not inherit the task's context, so the request id,
+                    # timings and span are passed to it explicitly
+                    result = await run_in_executor(
+                        contextvars.copy_context(), *args, **kwargs
+                    )
+                    if span is not None:
+                        _set_payload_sizes(span, args, kwargs, result["output"])
+                    return result
+
+            return timed_func
+
+        async def async_func(*args, **kwargs):
+            with record_stage(func.__name__) as span:
+                result = await func(*args, **kwargs)
+                if span is not None:
+                    _set_payload_sizes(span, args, kwargs, result)
+            return {
+                "output": result,
+                "sources": {
+                    "tool_type": "custom_tool",
+                    "tool_name": func.__name__,
+                    "metadata": [{"python_tool": f"{func.__name__} tool"}],
+                },
+            }
+
+        return async_func
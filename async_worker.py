@@ -0,0 +1,208 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable
+
+from agent_gateway.tools.logger import gateway_logger
+
+AGENT_WORKER_LOOPS = int(os.getenv("AGENT_WORKER_LOOPS", "1"))
+AGENT_MAX_CONCURRENT_JOBS = int(os.getenv("AGENT_MAX_CONCURRENT_JOBS", "8"))
+AGENT_MAX_QUEUED_JOBS = int(os.getenv("AGENT_MAX_QUEUED_JOBS", "32"))
+AGENT_JOB_TIMEOUT_SECONDS = float(os.getenv("AGENT_JOB_TIMEOUT_SECONDS", "300"))
+
+
+class SchedulerBusyError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class _WorkerLoop:
+    """An event loop running forever on its own daemon thread."""
+
+    def __init__(self, name: str, max_concurrency: int):
+        self.loop = asyncio.new_event_loop()
+        self.max_concurrency = max_concurrency
+        self.semaphore = None
+        ready = threading.Event()
+        self.thread = threading.Thread(
+            target=self._run, args=(ready,), name=name, daemon=True
+        )
+        self.thread.start()
+        ready.wait()
+
+    def _run(self, ready: threading.Event):
+        asyncio.set_event_loop(self.loop)
+        # Created on the loop's own thread so it binds to this loop
+        self.semaphore = asyncio.Semaphore(self.max_concurrency)
+        self.loop.call_soon(ready.set)
+        self.loop.run_forever()
+        self.loop.close()
+
+
+class AsyncJobScheduler:
+    """
+    Runs coroutine jobs on a small pool of long-lived background event loops.
+
+    Jobs are spread round-robin over ``loops`` event loops, each running at most
+    ``max_concurrency / loops`` jobs at a time; further jobs wait in the loop until a slot frees up.
+    ``submit`` rejects jobs with ``SchedulerBusyError`` once ``max_queue_depth`` jobs are waiting and
+    returns a ``concurrent.futures.Future`` that completes as soon as the job does. Cancelling the
+    future cancels the job, and jobs running longer than ``job_timeout`` raise ``TimeoutError``.
+
+    Example:
+        >>> scheduler = AsyncJobScheduler()
+        >>> future = scheduler.submit(lambda: agent.acall("How many tickets are there?"))
+        >>> future.result()
+    """
+
+    def __init__(
+        self,
+        loops: int = AGENT_WORKER_LOOPS,
+        max_concurrency: int = AGENT_MAX_CONCURRENT_JOBS,
+        max_queue_depth: int = AGENT_MAX_QUEUED_JOBS,
+        job_timeout: float = AGENT_JOB_TIMEOUT_SECONDS,
+        on_shutdown: Callable[[], Awaitable[Any]] | None = None,
+    ):
+        loops = max(1, loops)
+        self.max_queue_depth = max_queue_depth
+        self.job_timeout = job_timeout
+        self._on_shutdown = on_shutdown
+        self._workers = [
+            _WorkerLoop(f"agent-worker-{i}", max(1, max_concurrency // loops))
+            for i in range(loops)
+        ]
+        self._next_worker = itertools.cycle(self._workers)
+        self._lock = threading.Lock()
+
+        self.queued = 0
+        self.running = 0
+        self.submitted = 0
+        self.started = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.timed_out = 0
+        self.rejected = 0
+        self.queue_wait_seconds_total = 0.0
+        self.queue_wait_seconds_max = 0.0
+
+    def submit(self, job: Callable[[], Awaitable[Any]]) -> Future:
+        """
+        Schedules a job on one of the background loops.
+
+        Args:
+            job: A callable returning the coroutine to run, called on the background loop.
+
+        Returns:
+            Future: Completes with the job's result or exception.
+        """
+        with self._lock:
+            if self.queued >= self.max_queue_depth:
+                self.rejected += 1
+                raise SchedulerBusyError(
+                    f"Too many requests are waiting ({self.queued}), please try again shortly."
+                )
+            self.queued += 1
+            self.submitted += 1
+            worker = next(self._next_worker)
+
+        # Set by whichever of _run and _on_done first takes over the job's bookkeeping
+        ticket = {"claimed": False}
+
+        def _on_done(future: Future):
+            # A job cancelled before its loop ran it never enters _run, which would dequeue it
+            if not future.cancelled():
+                return
+            with self._lock:
+                if ticket["claimed"]:
+                    return
+                ticket["claimed"] = True
+                self.queued -= 1
+                self.cancelled += 1
+
+        future = asyncio.run_coroutine_threadsafe(
+            self._run(worker, job, time.monotonic(), ticket), worker.loop
+        )
+        future.add_done_callback(_on_done)
+        return future
+
+    async def _run(
+        self,
+        worker: _WorkerLoop,
+        job: Callable[[], Awaitable[Any]],
+        submitted_at: float,
+        ticket: dict,
+    ):
+        with self._lock:
+            if ticket["claimed"]:
+                raise asyncio.CancelledError()
+            ticket["claimed"] = True
+        started = False
+        outcome = "failed"
+        try:
+            async with worker.semaphore:
+                waited = time.monotonic() - submitted_at
+                with self._lock:
+                    started = True
+                    self.started += 1
+                    self.queued -= 1
+                    self.running += 1
+                    self.queue_wait_seconds_total += waited
+                    self.queue_wait_seconds_max = max(
+                        self.queue_wait_seconds_max, waited
+                    )
+                result = await asyncio.wait_for(job(), timeout=self.job_timeout)
+            outcome = "completed"
+            return result
+        except asyncio.CancelledError:
+            outcome = "cancelled"
+            raise
+        except TimeoutError:
+            outcome = "timed_out"
+            raise
+        finally:
+            with self._lock:
+                if started:
+                    self.running -= 1
+                else:
+                    self.queued -= 1
+                setattr(self, outcome, getattr(self, outcome) + 1)
+            gateway_logger.log("DEBUG", f"Agent job {outcome}: {self.stats()}")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "running": self.running,
+                "submitted": self.submitted,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "timed_out": self.timed_out,
+                "rejected": self.rejected,
+                "queue_wait_seconds_avg": (
+                    self.queue_wait_seconds_total / self.started
+                    if self.started
+                    else 0.0
+                ),
+                "queue_wait_seconds_max": self.queue_wait_seconds_max,
+            }
+
+    def shutdown(self, timeout: float = 5.0):
+        """Runs the ``on_shutdown`` hook on every loop and stops the loops."""
+        for worker in self._workers:
+            if self._on_shutdown is not None:
+                try:
+                    asyncio.run_coroutine_threadsafe(
+                        self._on_shutdown(), worker.loop
+                    ).result(timeout)
+                except Exception as e:
+                    gateway_logger.log(
+                        "WARNING", f"Worker loop shutdown hook failed: {e}"
+                    )
+            worker.loop.call_soon_threadsafe(worker.loop.stop)
+            worker.thread.join(timeout)
@@ -0,0 +1,337 @@
+"""
+Headless batch runner for question sets.
+
+Runs questions from text or JSONL files through the same pooled tools and agent as the Streamlit app
+and streams one JSON line per question, with per stage timings, to the output file. Questions already
+answered in the output file are skipped, so an interrupted run can be restarted with the same command.
+
+Example:
+    python batch_runner.py samples/*_questions.txt --output results.jsonl --concurrency 4 --rate 2
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sys
+import time
+from pathlib import Path
+
+from agent_gateway.tools.logger import gateway_logger
+from dotenv import load_dotenv
+
+from agent_factory import (
+    SNOWPARK_POOL_SIZE,
+    answer_prompt,
+    connection_parameters_from_env,
+    create_agent_pool,
+    tool_config_from_env,
+)
+from async_worker import AGENT_JOB_TIMEOUT_SECONDS
+from fixed_pipeline import AGENT_PIPELINE_MODE
+from logging_util import bind_log_request
+from question_index import read_sample_pairs
+from sarvam_clients import aclose_async_client
+from stage_timing import collect_stage_timings
+
+DEFAULT_QUESTION_FIELDS = ("question", "prompt", "body")
+DEFAULT_ID_FIELDS = ("id", "request_id")
+
+
+def _item_id(source: str, question: str) -> str:
+    digest = hashlib.sha1(question.encode("utf-8")).hexdigest()[:16]
+    return f"{source}:{digest}"
+
+
+def read_text_questions(path: Path) -> list[dict]:
+    """
+    Reads questions from a text file.
+
+    Files in the ``samples/`` format of ``Question: <English>`` / ``Answer: <translation>`` pairs
+    yield the translated question, with the English one kept as ``reference``. Any other file yields
+    one question per non-empty line.
+    """
+    lines = [line.strip() for line in path.read_text(encoding="utf-8").splitlines()]
+    if any(line.startswith("Question:") for line in lines):
+        items = [
+            {"question": question, "reference": reference}
+            for reference, question in read_sample_pairs(path)
+        ]
+    else:
+        items = [{"question": line} for line in lines if line]
+
+    return [
+        {"id": _item_id(path.name, item["question"]), "source": path.name, **item}
+        for item in items
+    ]
+
+
+def read_jsonl_questions(
+    path: Path,
+    question_fields: tuple[str, ...] = DEFAULT_QUESTION_FIELDS,
+    id_fields: tuple[str, ...] = DEFAULT_ID_FIELDS,
+) -> list[dict]:
+    """Reads questions from a JSONL file, one object per line, using the first field that is present."""
+    items = []
+    with path.open(encoding="utf-8") as f:
+        for line_number, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            question = next((record[k] for k in question_fields if record.get(k)), None)
+            if question is None:
+                raise ValueError(
+                    f"{path}:{line_number} has none of the fields {', '.join(question_fields)}."
+                )
+            item_id = next((str(record[k]) for k in id_fields if record.get(k)), None)
+            items.append(
+                {
+                    "id": item_id or _item_id(path.name, question),
+                    "source": path.name,
+                    "question": question,
+                }
+            )
+    return items
+
+
+def read_questions(paths: list[Path], **jsonl_options) -> list[dict]:
+    """Reads and de-duplicates the questions of all input files, keeping the first occurrence."""
+    items = {}
+    for path in paths:
+        if path.suffix == ".jsonl":
+            file_items = read_jsonl_questions(path, **jsonl_options)
+        else:
+            file_items = read_text_questions(path)
+        for item in file_items:
+            items.setdefault(item["id"], item)
+    return list(items.values())
+
+
+def finished_ids(output: Path, retry_failed: bool = False) -> set[str]:
+    """Returns the ids already recorded in the output file, ignoring a partially written last line."""
+    if not output.exists():
+        return set()
+    done = set()
+    with output.open(encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue
+            if record.get("status") == "ok" or not retry_failed:
+                done.add(record["id"])
+    return done
+
+
+class RateLimiter:
+    """Spaces out the start of requests to at most ``rate`` per second; 0 disables the limit."""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self._next_start = 0.0
+        self._lock = asyncio.Lock()
+
+    async def wait(self):
+        if not self.interval:
+            return
+        async with self._lock:
+            now = time.monotonic()
+            delay = self._next_start - now
+            self._next_start = max(now, self._next_start) + self.interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+class BatchRunner:
+    """
+    Runs question items through pooled AgentResources with bounded concurrency and a rate limit.
+
+    Every item gets its own empty conversation memory, so results do not depend on the order in
+    which questions are answered.
+    """
+
+    def __init__(
+        self,
+        agent_pool,
+        output: Path,
+        concurrency: int = SNOWPARK_POOL_SIZE,
+        rate: float = 0.0,
+        timeout: float = AGENT_JOB_TIMEOUT_SECONDS,
+        pipeline_mode: str = AGENT_PIPELINE_MODE,
+    ):
+        self.agent_pool = agent_pool
+        self.output = output
+        self.concurrency = max(1, concurrency)
+        self.rate_limiter = RateLimiter(rate)
+        self.timeout = timeout
+        self.pipeline_mode = pipeline_mode
+        self._write_lock = asyncio.Lock()
+
+        self.succeeded = 0
+        self.failed = 0
+
+    async def _run_item(self, item: dict) -> dict:
+        await self.rate_limiter.wait()
+        bind_log_request(item["id"])
+        started_at = time.time()
+        start = time.perf_counter()
+        record = {**item, "started_at": started_at}
+        with collect_stage_timings() as timings:
+            try:
+                response = await asyncio.wait_for(
+                    answer_prompt(
+                        self.agent_pool,
+                        item["question"],
+                        [],
+                        pipeline_mode=self.pipeline_mode,
+                    ),
+                    timeout=self.timeout,
+                )
+                record.update(
+                    status="ok",
+                    mode="agent" if "agent" in timings else "fixed",
+                    answer=response["output"],
+                    sources=response["sources"],
+                )
+            except Exception as e:
+                record.update(status="error", error=f"{type(e).__name__}: {e}")
+        timings["total"] = time.perf_counter() - start
+        record["timings"] = {stage: round(s, 4) for stage, s in timings.items()}
+        return record
+
+    async def _write(self, f, record: dict):
+        async with self._write_lock:
+            f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+            f.flush()
+            if record["status"] == "ok":
+                self.succeeded += 1
+            else:
+                self.failed += 1
+
+    async def run(self, items: list[dict]):
+        queue = asyncio.Queue()
+        for item in items:
+            queue.put_nowait(item)
+
+        with self.output.open("a", encoding="utf-8") as f:
+
+            async def worker():
+                while not queue.empty():
+                    item = queue.get_nowait()
+                    record = await self._run_item(item)
+                    await self._write(f, record)
+                    gateway_logger.log(
+                        "INFO",
+                        f"[{self.succeeded + self.failed}/{len(items)}] {item['id']} "
+                        f"{record['status']} in {record['timings']['total']:.2f}s",
+                    )
+
+            async with asyncio.TaskGroup() as tg:
+                for _ in range(min(self.concurrency, len(items))):
+                    tg.create_task(worker())
+
+
+async def _main(args) -> int:
+    items = read_questions(
+        [Path(p) for p in args.inputs],
+        question_fields=tuple(args.question_field or DEFAULT_QUESTION_FIELDS),
+        id_fields=tuple(args.id_field or DEFAULT_ID_FIELDS),
+    )
+    output = Path(args.output)
+    done = finished_ids(output, retry_failed=args.retry_failed)
+    pending = [item for item in items if item["id"] not in done]
+    gateway_logger.log(
+        "INFO",
+        f"{len(items)} questions, {len(items) - len(pending)} already done, {len(pending)} to run",
+    )
+    if not pending:
+        return 0
+
+    agent_pool = create_agent_pool(
+        connection_parameters=connection_parameters_from_env(),
+        tool_config=tool_config_from_env(),
+        max_size=args.concurrency,
+    )
+    runner = BatchRunner(
+        agent_pool,
+        output,
+        concurrency=args.concurrency,
+        rate=args.rate,
+        timeout=args.timeout,
+        pipeline_mode=args.mode,
+    )
+    start = time.perf_counter()
+    try:
+        await runner.run(pending)
+    finally:
+        agent_pool.close()
+        await aclose_async_client()
+    gateway_logger.log(
+        "INFO",
+        f"Finished {runner.succeeded} ok, {runner.failed} failed in {time.perf_counter() - start:.1f}s",
+    )
+    return 1 if runner.failed else 0
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="Run question files through the multilingual agent and write JSONL results."
+    )
+    parser.add_argument(
+        "inputs", nargs="+", help="Question files (.txt or .jsonl) to run"
+    )
+    parser.add_argument(
+        "-o", "--output", required=True, help="JSONL file results are appended to"
+    )
+    parser.add_argument(
+        "-c",
+        "--concurrency",
+        type=int,
+        default=SNOWPARK_POOL_SIZE,
+        help="Questions answered at the same time, also the Snowpark pool size (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-r",
+        "--rate",
+        type=float,
+        default=0.0,
+        help="Maximum questions started per second, 0 for no limit (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=AGENT_JOB_TIMEOUT_SECONDS,
+        help="Seconds allowed per question (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["agent", "fixed"],
+        default=AGENT_PIPELINE_MODE,
+        help="Use the agent or try the fixed pipeline first (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--retry-failed",
+        action="store_true",
+        help="Run questions again whose previous result was an error",
+    )
+    parser.add_argument(
+        "--question-field",
+        action="append",
+        help=f"JSONL field holding the question, may be repeated (default: {', '.join(DEFAULT_QUESTION_FIELDS)})",
+    )
+    parser.add_argument(
+        "--id-field",
+        action="append",
+        help=f"JSONL field holding the item id, may be repeated (default: {', '.join(DEFAULT_ID_FIELDS)})",
+    )
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if not os.getenv("SARVAM_API_KEY"):
+        parser.error("SARVAM_API_KEY environment variable is not set.")
+    return asyncio.run(_main(args))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
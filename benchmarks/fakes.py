@@ -0,0 +1,324 @@
+"""
+Local stand-ins for SarvamAI, Snowpark and the Cortex tools, with configurable latency and errors.
+
+SarvamAI is replaced by a loopback HTTP server speaking the ``/translate`` and ``/text-lid`` endpoints,
+so the real SDK, connection pools and retries are exercised. The Snowpark session, the Cortex tools,
+the completion LLM and the agent's planning and fusion calls are replaced in process.
+"""
+
+import asyncio
+import random
+import socket
+import threading
+import uuid
+from typing import NamedTuple
+
+from aiohttp import web
+from agent_gateway.tools import CortexAnalystTool, CortexSearchTool
+
+from agent_factory import AgentResources, build_tools
+from async_python_tool import AsyncPythonTool
+from fixed_pipeline import classify_question
+from lang_script_detect import detect_script_language
+from resource_pool import ResourcePool
+from stage_timing import record_stage
+
+
+class LatencyProfile(NamedTuple):
+    """Lognormal latency around ``median_ms`` with failures at ``error_rate`` and throttling at ``throttle_rate``."""
+
+    median_ms: float
+    sigma: float = 0.3
+    error_rate: float = 0.0
+    throttle_rate: float = 0.0
+
+    def sample_seconds(self, rng: random.Random) -> float:
+        return self.median_ms * rng.lognormvariate(0.0, self.sigma) / 1000.0
+
+    def sample_status(self, rng: random.Random) -> int:
+        roll = rng.random()
+        if roll < self.error_rate:
+            return 500
+        if roll < self.error_rate + self.throttle_rate:
+            return 429
+        return 200
+
+
+class FakeError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class FakeSarvamServer:
+    """
+    SarvamAI REST API stand-in on a loopback port, running on its own thread.
+
+    Translations are the input text tagged with the target language code; language identification
+    uses the local script detector and answers ``en-IN`` for Latin text.
+    """
+
+    def __init__(self, profile: LatencyProfile, seed: int = 0):
+        self.profile = profile
+        self.rng = random.Random(seed)
+        self.requests = 0
+        self.url = None
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._started = threading.Event()
+        self._thread = threading.Thread(
+            target=self._run, name="fake-sarvam", daemon=True
+        )
+
+    async def _respond(self, request: web.Request, body: dict) -> web.Response:
+        self.requests += 1
+        await asyncio.sleep(self.profile.sample_seconds(self.rng))
+        status = self.profile.sample_status(self.rng)
+        if status != 200:
+            return web.json_response(
+                {"error": {"message": "fake failure", "code": str(status)}},
+                status=status,
+            )
+        return web.json_response({"request_id": uuid.uuid4().hex, **body})
+
+    async def _translate(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        return await self._respond(
+            request,
+            {
+                "translated_text": f"[{payload['target_language_code']}] {payload['input']}",
+                "source_language_code": payload["source_language_code"],
+            },
+        )
+
+    async def _identify_language(self, request: web.Request) -> web.Response:
+        payload = await request.json()
+        detection = detect_script_language(payload["input"], min_confidence=0.0)
+        return await self._respond(
+            request,
+            {
+                "language_code": detection.lang_code or "en-IN",
+                "script_code": None,
+            },
+        )
+
+    def _run(self):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application()
+        app.router.add_post("/translate", self._translate)
+        app.router.add_post("/text-lid", self._identify_language)
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        sock = socket.socket()
+        sock.bind(("127.0.0.1", 0))
+        self.url = "http://{}:{}".format(*sock.getsockname())
+        self._loop.run_until_complete(web.SockSite(self._runner, sock).start())
+        self._started.set()
+        self._loop.run_forever()
+
+    def start(self) -> "FakeSarvamServer":
+        self._thread.start()
+        self._started.wait()
+        return self
+
+    def stop(self):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+
+
+class _FakeResult:
+    def __init__(self, rows: list):
+        self.rows = rows
+
+    def collect(self) -> list:
+        return self.rows
+
+
+class FakeSession:
+    """The parts of a Snowpark session and connection that the tools and pool touch."""
+
+    database = "BENCHMARK"
+    schema = "DATA"
+
+    def sql(self, query: str) -> _FakeResult:
+        return _FakeResult([(1,)])
+
+    def close(self):
+        pass
+
+
+async def _simulate(profile: LatencyProfile, rng: random.Random, what: str):
+    await asyncio.sleep(profile.sample_seconds(rng))
+    if profile.sample_status(rng) != 200:
+        raise FakeError(f"Simulated {what} failure")
+
+
+class FakeCortexAnalystTool(CortexAnalystTool):
+    """Cortex Analyst stand-in returning a small result set after a simulated delay."""
+
+    def __init__(self, profile: LatencyProfile, rng: random.Random, **kwargs):
+        super().__init__(**kwargs)
+        self.profile = profile
+        self.rng = rng
+
+    async def query(self, query):
+        with record_stage("cortex_analyst"):
+            await _simulate(self.profile, self.rng, "Cortex Analyst")
+            return {
+                "output": str(
+                    {
+                        "SERVICE_TYPE": ["Cellular", "Business Internet"],
+                        "TICKET_COUNT": [114, 86],
+                    }
+                ),
+                "sources": {
+                    "tool_type": "cortex_analyst",
+                    "tool_name": self.name,
+                    "metadata": [{"Table": "SUPPORT_TICKETS"}],
+                },
+            }
+
+
+class FakeCortexSearchTool(CortexSearchTool):
+    """Cortex Search stand-in returning ``k`` invoice passages after a simulated delay."""
+
+    def __init__(self, profile: LatencyProfile, rng: random.Random, **kwargs):
+        super().__init__(**kwargs)
+        self.profile = profile
+        self.rng = rng
+
+    async def asearch(self, query: str):
+        with record_stage("cortex_search"):
+            await _simulate(self.profile, self.rng, "Cortex Search")
+            results = [
+                {
+                    "PARSED_TEXT": f"Invoice {8900 + i}: total amount due is {120 + i * 15}.00 USD. "
+                    "Due date is the 15th of the month.",
+                    "URL": f"https://example.com/invoices/{8900 + i}.pdf",
+                }
+                for i in range(self.k)
+            ]
+            return {
+                "output": results,
+                "sources": {
+                    "tool_type": "cortex_search",
+                    "tool_name": self.name,
+                    "metadata": [{"URL": r["URL"]} for r in results],
+                },
+            }
+
+
+class FakeCompletion:
+    """CortexCompleteAgent stand-in that answers after a simulated generation delay."""
+
+    def __init__(self, profile: LatencyProfile, rng: random.Random):
+        self.profile = profile
+        self.rng = rng
+
+    async def arun(self, prompt: str) -> str:
+        await _simulate(self.profile, self.rng, "Cortex completion")
+        return (
+            "The total amount due on the invoice is 135.00 USD. "
+            "It is due on the 15th of the month."
+        )
+
+
+class FakeAgent:
+    """
+    Agent stand-in that runs the OUTPUT_PROMPT recipe through the real tools, with simulated
+    planner and fusion LLM calls around them.
+    """
+
+    def __init__(self, tools: list, llm_profile: LatencyProfile, rng: random.Random):
+        self.tools = {tool.name: tool for tool in tools}
+        self.analyst = next(t for t in tools if isinstance(t, CortexAnalystTool))
+        self.search = next(t for t in tools if isinstance(t, CortexSearchTool))
+        self.llm_profile = llm_profile
+        self.rng = rng
+        self.memory_context = []
+
+    async def acall(self, input: str) -> dict:
+        with record_stage("planner"):
+            await _simulate(self.llm_profile, self.rng, "planner")
+
+        lang_code = (await self.tools["lang_detect"].func(input))["output"]
+        is_english = lang_code is None or lang_code.startswith("en")
+        question = input
+        if not is_english:
+            question = (await self.tools["translate"].func(lang_code, input))["output"]
+
+        tool = self.search if classify_question(question) == "search" else self.analyst
+        result = await tool.func(question)
+        answer = str(result["output"])
+        if not is_english:
+            answer = (await self.tools["answer_translator"].func(answer, lang_code))[
+                "output"
+            ]
+
+        with record_stage("fusion"):
+            await _simulate(self.llm_profile, self.rng, "fusion")
+        return {"output": answer, "sources": [result["sources"]]}
+
+
+def create_fake_agent_pool(
+    max_size: int,
+    cortex_profile: LatencyProfile,
+    llm_profile: LatencyProfile,
+    seed: int = 0,
+) -> ResourcePool:
+    """
+    Creates a pool of AgentResources built like ``agent_factory.create_agent_pool`` on a fake session.
+
+    The language tools are the real ones; the Cortex tools, the fixed pipeline's completion LLM and
+    the agent are stand-ins.
+    """
+    rng = random.Random(seed)
+    tool_config = {
+        "model_stage": "BENCHMARK_STAGE",
+        "semantic_model_file": "support_tickets.yaml",
+        "search_service_name": "INVOICE_SEARCH_SERVICE",
+    }
+
+    def create():
+        session = FakeSession()
+        tools = []
+        for tool in build_tools(session, tool_config):
+            if isinstance(tool, AsyncPythonTool):
+                tools.append(tool)
+            elif isinstance(tool, CortexAnalystTool):
+                tools.append(
+                    FakeCortexAnalystTool(
+                        cortex_profile,
+                        rng,
+                        semantic_model=tool.FILE,
+                        stage=tool.STAGE,
+                        service_topic="Customer support tickets model",
+                        data_description="a table with customer support tickets",
+                        snowflake_connection=session,
+                        max_results=tool.max_results,
+                    )
+                )
+            else:
+                tools.append(
+                    FakeCortexSearchTool(
+                        cortex_profile,
+                        rng,
+                        service_name=tool.service_name,
+                        service_topic="Customer invoice related queries.",
+                        data_description="Customer invoices and related documents",
+                        retrieval_columns=tool.retrieval_columns,
+                        snowflake_connection=session,
+                        k=tool.k,
+                    )
+                )
+        resources = AgentResources(session, tools, FakeAgent(tools, llm_profile, rng))
+        resources.pipeline.completion = FakeCompletion(llm_profile, rng)
+        return resources
+
+    return ResourcePool(
+        create=create,
+        close=AgentResources.close,
+        is_healthy=AgentResources.is_healthy,
+        max_size=max_size,
+    )
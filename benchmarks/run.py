@@ -0,0 +1,519 @@
+"""
+Offline benchmark of the language tools, log handling and the prompt flow under concurrent load.
+
+SarvamAI, Snowpark and the Cortex tools are replaced by the stand-ins in ``benchmarks.fakes``; no
+network access is needed. Reports throughput, p50/p95/p99 latency per stage and peak memory, and can
+save the results as a baseline and compare a run against one.
+
+Example:
+    python -m benchmarks.run --save benchmarks/baselines/local.json
+    python -m benchmarks.run --compare benchmarks/baselines/local.json
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import resource
+import sys
+import threading
+import time
+import tracemalloc
+import uuid
+from concurrent.futures import ThreadPoolExecutor, wait
+from pathlib import Path
+
+from agent_gateway.tools.logger import gateway_logger
+
+import sarvam_ai_async_lang_tools
+import sarvam_ai_lang_tools
+import sarvam_clients
+from agent_factory import answer_prompt
+from async_worker import AsyncJobScheduler
+from batch_runner import read_text_questions
+from benchmarks.fakes import FakeSarvamServer, LatencyProfile, create_fake_agent_pool
+from lang_script_detect import detect_script_language
+from logging_util import StreamlitLogHandler, bind_log_request, request_logging
+from question_index import question_index
+from stage_timing import collect_stage_timings
+from translation_cache import translation_cache
+
+SAMPLES_DIR = Path(__file__).resolve().parent.parent / "samples"
+SCENARIOS = [
+    "chunk_text",
+    "log_handler",
+    "sync_tools",
+    "async_tools",
+    "process_message",
+]
+# Same as main.LOG_REFRESH_SECONDS
+LOG_REFRESH_SECONDS = 0.25
+
+
+class StageRecorder:
+    """Thread-safe collection of latencies and errors per stage."""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, stage: str, seconds: float, error: bool = False):
+        with self._lock:
+            self.latencies.setdefault(stage, []).append(seconds)
+            if error:
+                self.errors[stage] = self.errors.get(stage, 0) + 1
+
+    def time(self, stage: str, func, *args):
+        start = time.perf_counter()
+        try:
+            result = func(*args)
+        except Exception:
+            self.add(stage, time.perf_counter() - start, error=True)
+            return None
+        self.add(stage, time.perf_counter() - start)
+        return result
+
+    async def atime(self, stage: str, coro):
+        start = time.perf_counter()
+        try:
+            result = await coro
+        except Exception:
+            self.add(stage, time.perf_counter() - start, error=True)
+            return None
+        self.add(stage, time.perf_counter() - start)
+        return result
+
+
+def percentile(values: list[float], p: float) -> float:
+    """Nearest-rank percentile of ``values``."""
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, round(p / 100 * len(ordered)) - 1))]
+
+
+def summarize(recorder: StageRecorder, wall_seconds: float, operations: int) -> dict:
+    stages = {}
+    for stage, values in sorted(recorder.latencies.items()):
+        stages[stage] = {
+            "count": len(values),
+            "errors": recorder.errors.get(stage, 0),
+            "p50_ms": round(percentile(values, 50) * 1000, 3),
+            "p95_ms": round(percentile(values, 95) * 1000, 3),
+            "p99_ms": round(percentile(values, 99) * 1000, 3),
+        }
+    return {
+        "operations": operations,
+        "wall_seconds": round(wall_seconds, 3),
+        "throughput_per_second": round(operations / wall_seconds, 3)
+        if wall_seconds
+        else 0.0,
+        "stages": stages,
+    }
+
+
+def load_corpus() -> list[dict]:
+    """The sample questions, each with its English ``reference``, plus the English questions alone."""
+    items = []
+    for path in sorted(SAMPLES_DIR.glob("*_questions.txt")):
+        items.extend(read_text_questions(path))
+    english = [
+        {"question": item["reference"], "reference": item["reference"]}
+        for item in items
+        if item.get("reference")
+    ]
+    return items + english
+
+
+def _lang_code(question: str) -> str:
+    return detect_script_language(question).lang_code or "en-IN"
+
+
+def bench_chunk_text(corpus: list[dict], args) -> dict:
+    recorder = StageRecorder()
+    answers = [" ".join(item["reference"] + "." for item in corpus) * n for n in (1, 4)]
+    start = time.perf_counter()
+    for i in range(args.requests * 10):
+        recorder.time("chunk_text", sarvam_ai_lang_tools.chunk_text, answers[i % 2])
+    return summarize(recorder, time.perf_counter() - start, args.requests * 10)
+
+
+def bench_log_handler(corpus: list[dict], args) -> dict:
+    recorder = StageRecorder()
+    request_id = str(uuid.uuid4())
+    handler = StreamlitLogHandler(request_id=request_id)
+    handler.setFormatter(
+        logging.Formatter("%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+    )
+    bind_log_request(request_id)
+    records = [
+        logging.LogRecord(
+            "AgentGatewayLogger",
+            logging.INFO,
+            __file__,
+            0,
+            f"Running {tool} tool with input {item['question']}",
+            None,
+            None,
+        )
+        for item in corpus
+        for tool in ("lang_detect", "translate", "answer_translator")
+    ]
+    operations = args.requests * 50
+    start = time.perf_counter()
+    for i in range(operations):
+        recorder.time("emit", handler.handle, records[i % len(records)])
+        if i % 20 == 19:
+            recorder.time("process_logs", handler.process_logs)
+    wall = time.perf_counter() - start
+    bind_log_request(None)
+    return summarize(recorder, wall, operations)
+
+
+def bench_sync_tools(corpus: list[dict], args) -> dict:
+    recorder = StageRecorder()
+
+    def run(item: dict):
+        question = item["question"]
+        lang_code = recorder.time(
+            "lang_detect", sarvam_ai_lang_tools.lang_detect, question
+        )
+        lang_code = lang_code or _lang_code(question)
+        if not lang_code.startswith("en"):
+            recorder.time(
+                "translate", sarvam_ai_lang_tools.translate, lang_code, question
+            )
+            recorder.time(
+                "answer_translator",
+                sarvam_ai_lang_tools.answer_translator,
+                item["reference"],
+                lang_code,
+            )
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+        list(executor.map(run, (corpus[i % len(corpus)] for i in range(args.requests))))
+    return summarize(recorder, time.perf_counter() - start, args.requests)
+
+
+def bench_async_tools(corpus: list[dict], args) -> dict:
+    recorder = StageRecorder()
+
+    async def run(item: dict, semaphore: asyncio.Semaphore):
+        async with semaphore:
+            question = item["question"]
+            lang_code = await recorder.atime(
+                "lang_detect", sarvam_ai_async_lang_tools.lang_detect(question)
+            )
+            lang_code = lang_code or _lang_code(question)
+            if not lang_code.startswith("en"):
+                await recorder.atime(
+                    "translate",
+                    sarvam_ai_async_lang_tools.translate(lang_code, question),
+                )
+                await recorder.atime(
+                    "answer_translator",
+                    sarvam_ai_async_lang_tools.answer_translator(
+                        item["reference"], lang_code
+                    ),
+                )
+
+    async def main():
+        semaphore = asyncio.Semaphore(args.concurrency)
+        try:
+            async with asyncio.TaskGroup() as tg:
+                for i in range(args.requests):
+                    tg.create_task(run(corpus[i % len(corpus)], semaphore))
+        finally:
+            await sarvam_clients.aclose_async_client()
+
+    start = time.perf_counter()
+    asyncio.run(main())
+    return summarize(recorder, time.perf_counter() - start, args.requests)
+
+
+def bench_process_message(corpus: list[dict], args) -> dict:
+    """
+    The flow of ``main.process_message`` without the Streamlit rendering: each simulated browser
+    session submits its prompts to the scheduler and polls for the result and the request's logs.
+    """
+    recorder = StageRecorder()
+    profile = args.profiles
+    agent_pool = create_fake_agent_pool(
+        args.concurrency, profile["cortex"], profile["llm"], seed=args.seed
+    )
+    scheduler = AsyncJobScheduler(
+        max_concurrency=args.concurrency,
+        max_queue_depth=args.requests,
+        on_shutdown=sarvam_clients.aclose_async_client,
+    )
+    agent_logger = logging.getLogger("AgentGatewayLogger")
+    propagate = agent_logger.propagate
+    agent_logger.propagate = True
+
+    def session(prompts: list[dict]):
+        memory = []
+        for item in prompts:
+            prompt_id = str(uuid.uuid4())
+
+            async def run_analysis(prompt=item["question"]):
+                bind_log_request(prompt_id)
+                with collect_stage_timings() as timings:
+                    try:
+                        return await answer_prompt(
+                            agent_pool, prompt, memory, pipeline_mode=args.mode
+                        )
+                    finally:
+                        for stage, seconds in timings.items():
+                            recorder.add(stage, seconds)
+
+            start = time.perf_counter()
+            with request_logging(prompt_id) as log_handler:
+                future = scheduler.submit(run_analysis)
+                # As in main.py; a job that timed out is done and recorded as an error
+                while not wait([future], timeout=LOG_REFRESH_SECONDS)[0]:
+                    log_handler.process_logs()
+                error = future.cancelled() or future.exception() is not None
+                log_handler.process_logs()
+            recorder.add("process_message", time.perf_counter() - start, error)
+
+    prompts = [corpus[i % len(corpus)] for i in range(args.requests)]
+    start = time.perf_counter()
+    try:
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            list(
+                executor.map(
+                    session,
+                    (prompts[i :: args.concurrency] for i in range(args.concurrency)),
+                )
+            )
+    finally:
+        wall = time.perf_counter() - start
+        scheduler.shutdown()
+        agent_pool.close()
+        agent_logger.propagate = propagate
+    return summarize(recorder, wall, args.requests)
+
+
+BENCHMARKS = {
+    "chunk_text": bench_chunk_text,
+    "log_handler": bench_log_handler,
+    "sync_tools": bench_sync_tools,
+    "async_tools": bench_async_tools,
+    "process_message": bench_process_message,
+}
+
+
+def run_scenario(name: str, corpus: list[dict], args) -> dict:
+    translation_cache.clear()
+    if args.trace_memory:
+        tracemalloc.start()
+    result = BENCHMARKS[name](corpus, args)
+    if args.trace_memory:
+        result["peak_traced_mb"] = round(tracemalloc.get_traced_memory()[1] / 2**20, 2)
+        tracemalloc.stop()
+    # ru_maxrss is in kilobytes on Linux
+    result["peak_rss_mb"] = round(
+        resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 2
+    )
+    return result
+
+
+def compare(
+    results: dict, baseline: dict, threshold: float, min_delta_ms: float
+) -> list[str]:
+    """
+    Prints the change against a baseline and returns the regressions beyond ``threshold``.
+
+    Latency changes smaller than ``min_delta_ms`` are not reported as regressions, as sub-millisecond
+    stages vary by more than any reasonable threshold from run to run.
+    """
+    regressions = []
+    for name, result in results["scenarios"].items():
+        base = baseline.get("scenarios", {}).get(name)
+        if base is None:
+            continue
+        change = (
+            result["throughput_per_second"] / base["throughput_per_second"] - 1
+            if base["throughput_per_second"]
+            else 0.0
+        )
+        print(f"{name}: throughput {change:+.1%}")
+        if change < -threshold:
+            regressions.append(f"{name} throughput {change:+.1%}")
+        for stage, stats in result["stages"].items():
+            base_stats = base["stages"].get(stage)
+            if base_stats is None:
+                continue
+            for key in ("p50_ms", "p95_ms", "p99_ms"):
+                if not base_stats[key]:
+                    continue
+                change = stats[key] / base_stats[key] - 1
+                print(
+                    f"  {stage} {key}: {base_stats[key]:.2f} -> {stats[key]:.2f} ({change:+.1%})"
+                )
+                if change > threshold and stats[key] - base_stats[key] > min_delta_ms:
+                    regressions.append(f"{name}.{stage} {key} {change:+.1%}")
+    return regressions
+
+
+def print_results(results: dict):
+    for name, result in results["scenarios"].items():
+        print(
+            f"\n{name}: {result['operations']} ops in {result['wall_seconds']}s, "
+            f"{result['throughput_per_second']}/s, peak RSS {result['peak_rss_mb']} MB"
+            + (
+                f", peak traced {result['peak_traced_mb']} MB"
+                if "peak_traced_mb" in result
+                else ""
+            )
+        )
+        print(
+            f"  {'stage':<20}{'count':>8}{'errors':>8}{'p50 ms':>12}{'p95 ms':>12}{'p99 ms':>12}"
+        )
+        for stage, stats in result["stages"].items():
+            print(
+                f"  {stage:<20}{stats['count']:>8}{stats['errors']:>8}"
+                f"{stats['p50_ms']:>12.2f}{stats['p95_ms']:>12.2f}{stats['p99_ms']:>12.2f}"
+            )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--scenarios",
+        default=",".join(SCENARIOS),
+        help="Comma separated scenarios to run (default: %(default)s)",
+    )
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--mode", choices=["agent", "fixed"], default="agent")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--latency-scale",
+        type=float,
+        default=1.0,
+        help="Multiplier applied to every simulated latency, e.g. 0.1 for a quick run",
+    )
+    parser.add_argument(
+        "--sigma", type=float, default=0.3, help="Lognormal spread of the latencies"
+    )
+    parser.add_argument("--sarvam-latency-ms", type=float, default=150)
+    parser.add_argument("--sarvam-error-rate", type=float, default=0.0)
+    parser.add_argument("--sarvam-throttle-rate", type=float, default=0.0)
+    parser.add_argument("--cortex-latency-ms", type=float, default=600)
+    parser.add_argument("--cortex-error-rate", type=float, default=0.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=900)
+    parser.add_argument("--llm-error-rate", type=float, default=0.0)
+    parser.add_argument(
+        "--no-translation-cache",
+        action="store_true",
+        help="Measure every translation against the stand-in instead of the cache",
+    )
+    parser.add_argument(
+        "--no-question-index",
+        action="store_true",
+        help="Translate the sample questions instead of answering them from the question index",
+    )
+    parser.add_argument(
+        "--trace-memory",
+        action="store_true",
+        help="Also report the peak of Python allocations, at the cost of slower runs",
+    )
+    parser.add_argument("--save", help="Write the results as a baseline JSON file")
+    parser.add_argument("--compare", help="Baseline JSON file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.2,
+        help="Relative slowdown reported as a regression (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--min-delta-ms",
+        type=float,
+        default=1.0,
+        help="Smallest latency increase reported as a regression (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    scale = args.latency_scale
+    args.profiles = {
+        "sarvam": LatencyProfile(
+            args.sarvam_latency_ms * scale,
+            args.sigma,
+            args.sarvam_error_rate,
+            args.sarvam_throttle_rate,
+        ),
+        "cortex": LatencyProfile(
+            args.cortex_latency_ms * scale, args.sigma, args.cortex_error_rate
+        ),
+        "llm": LatencyProfile(
+            args.llm_latency_ms * scale, args.sigma, args.llm_error_rate
+        ),
+    }
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(BENCHMARKS)
+    if unknown:
+        parser.error(f"Unknown scenarios: {', '.join(sorted(unknown))}")
+
+    # Benchmark output goes to stdout; the agent's own log lines are only kept for the log handlers
+    if hasattr(gateway_logger, "stream_handler"):
+        gateway_logger.stream_handler.setLevel(logging.WARNING)
+    if args.no_translation_cache:
+        translation_cache.ttl_seconds = 0
+    if args.no_question_index:
+        question_index.paths = []
+
+    server = FakeSarvamServer(args.profiles["sarvam"], seed=args.seed).start()
+    os.environ.setdefault("SARVAM_API_KEY", "benchmark")
+    sarvam_clients.SARVAM_BASE_URL = server.url
+    sarvam_clients.close_client()
+
+    corpus = load_corpus()
+    results = {
+        "environment": {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "cpus": os.cpu_count(),
+        },
+        "settings": {
+            key: value
+            for key, value in vars(args).items()
+            if key
+            not in (
+                "profiles",
+                "save",
+                "compare",
+                "scenarios",
+                "threshold",
+                "min_delta_ms",
+            )
+        },
+        "scenarios": {},
+    }
+    try:
+        for name in scenarios:
+            print(f"Running {name}...", file=sys.stderr)
+            results["scenarios"][name] = run_scenario(name, corpus, args)
+    finally:
+        sarvam_clients.close_client()
+        server.stop()
+    results["sarvam_requests"] = server.requests
+
+    print_results(results)
+    if args.save:
+        Path(args.save).parent.mkdir(parents=True, exist_ok=True)
+        Path(args.save).write_text(json.dumps(results, indent=2, sort_keys=True) + "\n")
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        print(f"\nCompared to {args.compare}:")
+        regressions = compare(results, baseline, args.threshold, args.min_delta_ms)
+        if regressions:
+            print("\nRegressions:\n  " + "\n  ".join(regressions))
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,141 @@
+"""
+Import time report for the app's entry modules.
+
+Each module is imported in a fresh interpreter with ``python -X importtime``. The report lists the
+import time of every module, the packages that take the most of it, and any modules that should
+only be loaded on first use but were imported. With ``--budget-ms`` the run fails when a module
+takes longer to import than the budget, so slow imports can be caught in CI.
+
+Example:
+    python -m benchmarks.startup
+    python -m benchmarks.startup --budget-ms 3000 agent_factory batch_runner
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import NamedTuple
+
+REPO_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_MODULES = [
+    "agent_factory",
+    "batch_runner",
+    "fixed_pipeline",
+    "sarvam_ai_lang_tools",
+    "sarvam_ai_async_lang_tools",
+]
+# Optional or on demand subsystems that must not be loaded by importing the app
+DEFAULT_LAZY_MODULES = ["trulens", "sarvamai.client"]
+
+
+class ImportReport(NamedTuple):
+    module: str
+    total_ms: float
+    # Milliseconds spent importing each top level package, excluding its dependencies
+    packages_ms: dict[str, float]
+    imported: list[str]
+
+
+def measure_import(module: str) -> ImportReport:
+    """Imports ``module`` in a fresh interpreter and parses its ``-X importtime`` output."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=REPO_DIR,
+        env={**os.environ, "PYTHONDONTWRITEBYTECODE": "1"},
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(
+            f"Importing {module} failed:\n{result.stderr.splitlines()[-1]}"
+        )
+
+    total_us = 0
+    packages_us = {}
+    imported = []
+    for line in result.stderr.splitlines():
+        # import time: <self us> | <cumulative us> | <indented module name>
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cumulative_us, name = line.removeprefix("import time:").split("|")
+        if not self_us.strip().isdigit():
+            continue
+        name = name.strip()
+        imported.append(name)
+        package = name.split(".")[0]
+        packages_us[package] = packages_us.get(package, 0) + int(self_us)
+        if name == module:
+            total_us = int(cumulative_us)
+    return ImportReport(
+        module,
+        total_us / 1000,
+        {package: us / 1000 for package, us in packages_us.items()},
+        imported,
+    )
+
+
+def lazy_violations(report: ImportReport, lazy_modules: list[str]) -> list[str]:
+    """Returns the imported modules that are, or are within, one of ``lazy_modules``."""
+    return [
+        name
+        for name in report.imported
+        if any(name == lazy or name.startswith(f"{lazy}.") for lazy in lazy_modules)
+    ]
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "modules",
+        nargs="*",
+        default=DEFAULT_MODULES,
+        help=f"Modules to import (default: {' '.join(DEFAULT_MODULES)})",
+    )
+    parser.add_argument(
+        "--repeat",
+        type=int,
+        default=3,
+        help="Imports per module, the fastest one is reported (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--budget-ms",
+        type=float,
+        help="Fail when a module takes longer than this to import",
+    )
+    parser.add_argument(
+        "--lazy",
+        action="append",
+        help=f"Module that must not be imported at startup, may be repeated (default: {', '.join(DEFAULT_LAZY_MODULES)})",
+    )
+    parser.add_argument(
+        "--top", type=int, default=8, help="Slowest packages listed per module"
+    )
+    args = parser.parse_args(argv)
+    lazy_modules = args.lazy or DEFAULT_LAZY_MODULES
+
+    failed = False
+    for module in args.modules:
+        report = min(
+            (measure_import(module) for _ in range(max(1, args.repeat))),
+            key=lambda r: r.total_ms,
+        )
+        over_budget = args.budget_ms is not None and report.total_ms > args.budget_ms
+        print(
+            f"\n{module}: {report.total_ms:.1f} ms"
+            + (f"  OVER BUDGET ({args.budget_ms:.0f} ms)" if over_budget else "")
+        )
+        slowest = sorted(report.packages_ms.items(), key=lambda p: -p[1])
+        for package, ms in slowest[: args.top]:
+            print(f"  {package:<28}{ms:>10.1f} ms")
+
+        violations = lazy_violations(report, lazy_modules)
+        if violations:
+            print(f"  Imported at startup, should be lazy: {', '.join(violations)}")
+        failed = failed or over_budget or bool(violations)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,165 @@
+import html
+import json
+import os
+import threading
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+
+# Most recent turns rendered on every rerun; older ones are shown on request, a page at a time
+CONVERSATION_WINDOW_TURNS = int(os.getenv("CONVERSATION_WINDOW_TURNS", "10"))
+# Turns kept in full; older turns are compacted to a summary of their answer
+CONVERSATION_MAX_FULL_TURNS = int(os.getenv("CONVERSATION_MAX_FULL_TURNS", "50"))
+# Compacted turns kept in memory; older ones are dropped, after being spilled if a spill dir is set
+CONVERSATION_MAX_TURNS = int(os.getenv("CONVERSATION_MAX_TURNS", "500"))
+CONVERSATION_SUMMARY_CHARS = int(os.getenv("CONVERSATION_SUMMARY_CHARS", "200"))
+# Optional directory compacted turns are written to in full, one JSONL file per conversation
+CONVERSATION_SPILL_DIR = os.getenv("CONVERSATION_SPILL_DIR")
+
+WAITING = "waiting"
+
+
+def citation_sources(sources: list | None) -> list[str]:
+    """Returns the first metadata value of each tool's sources, e.g. the table or document URL."""
+    values = []
+    for source in sources or []:
+        metadata = source.get("metadata") if isinstance(source, dict) else None
+        if isinstance(metadata, list) and metadata:
+            first_element = metadata[0]
+            if isinstance(first_element, dict) and first_element:
+                value = next(iter(first_element.values()))
+                if value is not None:
+                    values.append(str(value))
+    return values
+
+
+def citation_html(sources: list | None) -> str:
+    """Renders the right aligned sources line shown under an answer."""
+    values = citation_sources(sources)
+    sources_display = html.escape(", ".join(values)) if values else "N/A"
+    return f"""
+        <div style="text-align: right; font-size: 0.8em; font-style: italic; margin-top: 5px;">
+            <b>Sources</b>: {sources_display}
+        </div>
+        """
+
+
+def summarize_answer(answer: str, max_chars: int = CONVERSATION_SUMMARY_CHARS) -> str:
+    """Shortens an answer to its first ``max_chars`` characters, cut at a word boundary."""
+    text = " ".join(answer.split())
+    if len(text) <= max_chars:
+        return text
+    cut = text.rfind(" ", 0, max_chars)
+    return text[: cut if cut > 0 else max_chars] + " …"
+
+
+class ConversationStore:
+    """
+    Bounded history of a chat session's turns.
+
+    A turn holds the prompt, the answer and the sources of the answer. When a turn is finished its
+    sources line is rendered once and kept, so reruns only write cached fragments. Beyond
+    ``max_full_turns`` the oldest finished turns are compacted: the answer is replaced by a summary
+    and the sources are dropped, after the full turn is appended to ``spill_dir`` if one is set.
+    Beyond ``max_turns`` the oldest compacted turns are dropped altogether.
+
+    The store is a mapping from turn id to turn, so it can be used like the ``prompt_history`` dict
+    it replaces.
+    """
+
+    def __init__(
+        self,
+        max_full_turns: int = CONVERSATION_MAX_FULL_TURNS,
+        max_turns: int = CONVERSATION_MAX_TURNS,
+        summary_chars: int = CONVERSATION_SUMMARY_CHARS,
+        spill_dir: str | None = CONVERSATION_SPILL_DIR,
+    ):
+        self.conversation_id = uuid.uuid4().hex
+        self.max_full_turns = max(1, max_full_turns)
+        self.max_turns = max(self.max_full_turns, max_turns)
+        self.summary_chars = summary_chars
+        self.spill_path = (
+            Path(spill_dir) / f"{self.conversation_id}.jsonl" if spill_dir else None
+        )
+        self._turns = OrderedDict()
+        self._full_turns = 0
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def __getitem__(self, turn_id: str) -> dict:
+        return self._turns[turn_id]
+
+    def __contains__(self, turn_id: str) -> bool:
+        return turn_id in self._turns
+
+    def __iter__(self):
+        return iter(list(self._turns))
+
+    def __len__(self) -> int:
+        return len(self._turns)
+
+    def get(self, turn_id: str, default=None):
+        return self._turns.get(turn_id, default)
+
+    def add(self, prompt: str) -> str:
+        """Adds a turn waiting for its answer and returns its id."""
+        turn_id = str(uuid.uuid4())
+        with self._lock:
+            self._turns[turn_id] = {"prompt": prompt, "response": WAITING}
+            self._full_turns += 1
+        return turn_id
+
+    def finish(self, turn_id: str, response: str, sources: list | None):
+        """Records a turn's answer, renders its sources line and compacts older turns."""
+        with self._lock:
+            turn = self._turns[turn_id]
+            turn["response"] = response
+            turn["sources"] = sources
+            turn["sources_html"] = (
+                citation_html(sources) if sources is not None else None
+            )
+            self._compact()
+
+    def _compact(self):
+        finished = (
+            (turn_id, turn)
+            for turn_id, turn in self._turns.items()
+            if not turn.get("compacted") and turn["response"] != WAITING
+        )
+        spilled = []
+        while self._full_turns > self.max_full_turns:
+            turn_id, turn = next(finished, (None, None))
+            if turn is None:
+                break
+            spilled.append({"id": turn_id, **turn})
+            turn["response"] = summarize_answer(turn["response"], self.summary_chars)
+            turn["sources"] = None
+            turn["sources_html"] = None
+            turn["compacted"] = True
+            self._full_turns -= 1
+        while len(self._turns) > self.max_turns:
+            turn_id, turn = next(iter(self._turns.items()))
+            if turn["response"] == WAITING:
+                break
+            del self._turns[turn_id]
+            self.dropped += 1
+        if spilled and self.spill_path is not None:
+            self.spill_path.parent.mkdir(parents=True, exist_ok=True)
+            with self.spill_path.open("a", encoding="utf-8") as f:
+                for turn in spilled:
+                    turn.pop("sources_html", None)
+                    f.write(json.dumps(turn, ensure_ascii=False, default=str) + "\n")
+
+    def window(self, size: int) -> list[tuple[str, dict]]:
+        """Returns the ``size`` most recent turns, oldest first."""
+        turn_ids = list(self._turns)[-size:] if size > 0 else []
+        return [(turn_id, self._turns[turn_id]) for turn_id in turn_ids]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "turns": len(self._turns),
+                "full_turns": self._full_turns,
+                "compacted_turns": len(self._turns) - self._full_turns,
+                "dropped_turns": self.dropped,
+            }
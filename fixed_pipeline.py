@@ -0,0 +1,378 @@
+import ast
+import asyncio
+import os
+import re
+import time
+
+from agent_gateway.gateway.gateway import CortexCompleteAgent
+from agent_gateway.tools import CortexAnalystTool, CortexSearchTool
+from agent_gateway.tools.logger import gateway_logger
+
+from answer_streaming import (
+    AnswerStream,
+    SentenceStreamer,
+    StreamingCortexCompleteAgent,
+)
+from lang_script_detect import (
+    ScriptDetection,
+    detect_script_language,
+    guess_script_language,
+)
+from sarvam_ai_async_lang_tools import (
+    answer_translator,
+    lang_detect,
+    resolve_language,
+    translate,
+)
+from speculation import PIPELINE_SPECULATIVE, preferred_usable, speculation_stats
+from stage_timing import record_stage
+from tool_budget import TOOL_BUDGET_ENABLED, ToolOutputBudget
+
+# "agent" always uses the LLM planner, "fixed" tries the deterministic pipeline first
+AGENT_PIPELINE_MODE = os.getenv("AGENT_PIPELINE_MODE", "agent").lower()
+PIPELINE_SEARCH_LLM = os.getenv("PIPELINE_SEARCH_LLM", "claude-3-5-sonnet")
+# Same as the agent's memory, see Agent.acall
+PIPELINE_MAX_MEMORY = 3
+
+_SEARCH_PATTERNS = [
+    r"\binvoices?\b",
+    r"\bbill(s|ed|ing)?\b",
+    r"\bamount (due|paid)\b",
+    r"\bdue date\b",
+    r"\bplans?\b",
+    r"\bpric(e|es|ing)\b",
+    r"\btariffs?\b",
+    r"\bpdf\b",
+]
+_ANALYST_PATTERNS = [
+    r"\btickets?\b",
+    r"\bsupport (requests?|cases?)\b",
+    r"\bservice types?\b",
+    r"\bcontact preferences?\b",
+    r"\bcustomers?\b",
+    r"\bbreakdown\b",
+    r"\bhow many\b",
+    r"\bcount\b",
+    r"\broaming\b",
+    r"\brefunds?\b",
+    r"\bTR\d+\b",
+]
+# Follow-up questions depend on the conversation and are left to the agent
+_FOLLOW_UP_PATTERNS = [
+    r"^(and|also|what about|how about)\b",
+    r"\b(he|she|they|him|her|them|those|these|same)\b",
+]
+
+SEARCH_ANSWER_PROMPT = """Answer the question using only the passages below. If the passages do not contain the answer, say so.
+Question: {question}
+Passages:
+{passages}
+Answer:"""
+
+
+def _match_routes(question: str) -> tuple[bool, bool] | None:
+    """Returns whether the question matches the search and the analyst patterns, or None for a follow-up."""
+    text = question.lower()
+    if any(re.search(p, text) for p in _FOLLOW_UP_PATTERNS):
+        return None
+    is_search = any(re.search(p, text) for p in _SEARCH_PATTERNS)
+    is_analyst = any(re.search(p, text, re.IGNORECASE) for p in _ANALYST_PATTERNS)
+    return is_search, is_analyst
+
+
+def classify_question(question: str) -> str | None:
+    """
+    Route an English question to a Cortex tool with keyword rules.
+
+    Args:
+        question (str): The question in English.
+
+    Returns:
+        str | None: 'analyst' for support ticket analytics, 'search' for invoice and plan documents,
+        or None when the question matches both, neither, or looks like a follow-up question.
+
+    Example:
+        >>> classify_question("Can you show me a breakdown of customer support tickets by service type?")
+        'analyst'
+        >>> classify_question("What was the total on Invoice 8921?")
+        'search'
+    """
+    routes = _match_routes(question)
+    if routes is None or routes[0] == routes[1]:
+        return None
+    return "search" if routes[0] else "analyst"
+
+
+def is_ambiguous_question(question: str) -> bool:
+    """True when a question that is not a follow-up matches both the search and the analyst patterns."""
+    return _match_routes(question) == (True, True)
+
+
+def rank_routes(question: str) -> list[str]:
+    """
+    The tools for a question, the one whose patterns it matches most first.
+
+    Cortex Analyst comes first on a tie: it only returns rows for questions about its semantic
+    model, while Cortex Search returns passages for nearly any question.
+    """
+    text = question.lower()
+    search = sum(bool(re.search(p, text)) for p in _SEARCH_PATTERNS)
+    analyst = sum(bool(re.search(p, text, re.IGNORECASE)) for p in _ANALYST_PATTERNS)
+    return ["search", "analyst"] if search > analyst else ["analyst", "search"]
+
+
+def _has_rows(route: str, result: dict) -> bool:
+    """Whether a Cortex Analyst result set or Cortex Search result has any rows."""
+    output = result["output"]
+    if route == "search":
+        return bool(output)
+    # A text-only answer, e.g. when the question is not about the semantic model, is a tuple
+    if isinstance(output, tuple):
+        return False
+    try:
+        columns = ast.literal_eval(output)
+    except (ValueError, SyntaxError):
+        return False
+    return isinstance(columns, dict) and any(len(v) for v in columns.values())
+
+
+def format_analyst_output(output) -> str:
+    """Renders a Cortex Analyst result set (a stringified column dict) as a markdown table."""
+    if isinstance(output, tuple):
+        return " ".join(str(o) for o in output)
+    try:
+        columns = ast.literal_eval(output)
+    except (ValueError, SyntaxError):
+        return str(output)
+    if not isinstance(columns, dict) or not columns:
+        return str(output)
+
+    names = list(columns)
+    rows = zip(*(columns[name] for name in names))
+    lines = [
+        "| " + " | ".join(names) + " |",
+        "| " + " | ".join("---" for _ in names) + " |",
+    ]
+    lines.extend("| " + " | ".join(str(v) for v in row) + " |" for row in rows)
+    return "\n".join(lines)
+
+
+class FixedPipeline:
+    """
+    Runs the lang_detect → translate → Cortex Analyst/Search → answer_translator recipe of
+    OUTPUT_PROMPT directly, without the agent's planning and fusion LLM calls.
+
+    Cortex Analyst results are rendered as a markdown table; Cortex Search passages are turned into
+    an answer with a single completion call. Returns the same ``{"output", "sources"}`` shape as
+    ``Agent.acall``, or None when the question cannot be routed and the agent should be used.
+
+    With PIPELINE_SPECULATIVE, questions are translated from a guessed language while their language
+    is detected, and questions that could be for either tool are sent to both, keeping the result
+    of the tool ranked first by ``rank_routes`` unless it has no rows; see ``speculation_stats`` for
+    how often this pays off.
+    """
+
+    def __init__(self, session, tools: list, llm: str = PIPELINE_SEARCH_LLM):
+        self.session = session
+        self.llm = llm
+        self.analyst = next(t for t in tools if isinstance(t, CortexAnalystTool))
+        self.search = next(t for t in tools if isinstance(t, CortexSearchTool))
+        self.completion = CortexCompleteAgent(session=session, llm=llm)
+
+    async def _answer_from_search(
+        self,
+        question: str,
+        streamer: SentenceStreamer | None = None,
+        result: dict | None = None,
+    ) -> tuple[str, dict]:
+        if result is None:
+            result = await self.search.asearch(question)
+        if TOOL_BUDGET_ENABLED:
+            # The passages are read by the completion as they would be by the agent's fusion LLM
+            result = ToolOutputBudget().search_result(
+                question, result, self.search.retrieval_columns[0]
+            )
+        passages = "\n\n".join(
+            "\n".join(str(v) for v in passage.values()) for passage in result["output"]
+        )
+        completion = self.completion
+        if streamer is not None:
+            fed = 0
+
+            def on_text(text: str):
+                nonlocal fed
+                streamer.feed(text[fed:])
+                fed = len(text)
+
+            completion = StreamingCortexCompleteAgent(self.session, self.llm, on_text)
+        with record_stage("search_answer"):
+            answer = await completion.arun(
+                SEARCH_ANSWER_PROMPT.format(question=question, passages=passages)
+            )
+        return answer.strip(), result["sources"]
+
+    async def _answer_from_analyst(
+        self, question: str, result: dict | None = None
+    ) -> tuple[str, dict]:
+        if result is None:
+            result = await self.analyst(question)
+        return format_analyst_output(result["output"]), result["sources"]
+
+    async def _detect_and_translate(
+        self, question: str, detection: ScriptDetection | None = None
+    ) -> tuple[str | None, str]:
+        with record_stage("lang_detect"):
+            if detection is None:
+                lang_code = await lang_detect(question)
+            else:
+                lang_code = await resolve_language(question, detection)
+        if lang_code is None or lang_code.startswith("en"):
+            return lang_code, question
+        with record_stage("translate"):
+            return lang_code, await translate(lang_code, question)
+
+    async def _speculative_detect_and_translate(
+        self, question: str
+    ) -> tuple[str | None, str]:
+        """
+        Translates the question from a guessed language while its language is detected.
+
+        Only Indic questions whose language is not certain from their script, and so are sent to
+        SarvamAI for detection, are speculated on. The guess is the most likely language of the
+        script; the translation is kept when detection confirms it and thrown away otherwise.
+        """
+        detection = detect_script_language(question)
+        guess = guess_script_language(question)
+        if guess is None or detection.lang_code is not None:
+            return await self._detect_and_translate(question, detection)
+
+        start = time.perf_counter()
+
+        async def speculate():
+            with record_stage("translate", speculative=True):
+                translation = await translate(guess, question)
+            return translation, time.perf_counter() - start
+
+        translation = asyncio.ensure_future(speculate())
+        try:
+            with record_stage("lang_detect"):
+                lang_code = await resolve_language(question, detection)
+            detect_seconds = time.perf_counter() - start
+            if lang_code == guess:
+                english_question, translate_seconds = await translation
+                speculation_stats.record(
+                    "translate", True, min(detect_seconds, translate_seconds)
+                )
+                return lang_code, english_question
+            speculation_stats.record("translate", False)
+        finally:
+            if not translation.done():
+                translation.cancel()
+                await asyncio.gather(translation, return_exceptions=True)
+
+        if lang_code is None or lang_code.startswith("en"):
+            return lang_code, question
+        with record_stage("translate"):
+            return lang_code, await translate(lang_code, question)
+
+    async def _race_tools(self, question: str) -> tuple[str | None, dict | None]:
+        """
+        Runs Cortex Analyst and Cortex Search at the same time for a question that could be for
+        either, keeping the result of the tool ranked first by ``rank_routes`` when it has rows and
+        the other tool's otherwise.
+        """
+        ran = {}
+
+        async def timed(route: str, call):
+            started = time.perf_counter()
+            try:
+                return await call
+            finally:
+                ran[route] = time.perf_counter() - started
+
+        start = time.perf_counter()
+        calls = {
+            "analyst": lambda: self.analyst(question),
+            "search": lambda: self.search.asearch(question),
+        }
+        ranking = rank_routes(question)
+        with record_stage("tool_race", ranking=",".join(ranking)) as span:
+            route, result, _ = await preferred_usable(
+                {r: timed(r, calls[r]()) for r in ranking}, _has_rows
+            )
+            if span is not None:
+                span.set(winner=route or "none")
+        # The speculation is the call to the second ranked tool: it wins only when its result is
+        # used, and is lost when the first ranked tool had rows or neither tool had any
+        won = route is not None and route != ranking[0]
+        saved = 0.0
+        if won:
+            # Without the race, it would only have started once the first ranked tool was done
+            saved = max(
+                ran[ranking[0]] + ran[route] - (time.perf_counter() - start), 0.0
+            )
+        speculation_stats.record("route", won, saved)
+        return route, result
+
+    async def acall(
+        self,
+        question: str,
+        memory: list | None = None,
+        stream: AnswerStream | None = None,
+    ) -> dict | None:
+        """
+        Answers a question, or returns None when it should be left to the agent.
+
+        When ``stream`` is given, the English search answer is written to it sentence by sentence
+        while it is generated, each sentence translated as soon as it is complete. The returned answer
+        is translated as a whole, exactly as without streaming.
+        """
+        if PIPELINE_SPECULATIVE:
+            lang_code, english_question = await self._speculative_detect_and_translate(
+                question
+            )
+        else:
+            lang_code, english_question = await self._detect_and_translate(question)
+        is_english = lang_code is None or lang_code.startswith("en")
+
+        route = classify_question(english_question)
+        result = None
+        if (
+            route is None
+            and PIPELINE_SPECULATIVE
+            and is_ambiguous_question(english_question)
+        ):
+            route, result = await self._race_tools(english_question)
+        gateway_logger.log("INFO", f"Fixed pipeline route: {route}")
+        if route is None:
+            return None
+
+        if route == "analyst":
+            answer, sources = await self._answer_from_analyst(english_question, result)
+        elif stream is None:
+            answer, sources = await self._answer_from_search(
+                english_question, result=result
+            )
+        else:
+            streamer = SentenceStreamer(
+                stream,
+                translate=None
+                if is_english
+                else lambda sentence: answer_translator(sentence, lang_code),
+            )
+            try:
+                answer, sources = await self._answer_from_search(
+                    english_question, streamer, result
+                )
+                await streamer.aclose()
+            finally:
+                streamer.cancel()
+
+        if not is_english:
+            with record_stage("answer_translator"):
+                answer = await answer_translator(answer, lang_code)
+
+        if memory is not None and len(memory) <= PIPELINE_MAX_MEMORY:
+            memory.append({"Question:": question, "Answer": answer})
+
+        return {"output": answer, "sources": [sources]}
@@ -0,0 +1,538 @@
+"""
+Incremental ingestion of the invoice documents into the Cortex Search chunk table.
+
+Documents are compared with what the sink already holds: files whose size and modification time
+are unchanged are skipped without being read, the others are hashed and only documents whose
+content changed are parsed and chunked, in a process pool. The chunks of changed documents replace
+their previous chunks in bulk, and documents that no longer exist are removed, so a re-sync takes
+time proportional to what changed and not to the size of the corpus.
+
+Chunks are split the way ``SYNC_DOC_CHUNKS`` in ``scripts/setup.sql`` splits them, with a markdown
+aware recursive character splitter of 1800 characters and 250 characters of overlap.
+
+Example:
+    python invoice_ingest.py scripts/data --sink sqlite --sqlite-path invoice_chunks.sqlite
+    python invoice_ingest.py scripts/data --sink snowflake
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path, PurePosixPath
+from typing import NamedTuple
+
+from agent_gateway.tools.logger import gateway_logger
+from dotenv import load_dotenv
+
+# Same parameters as SPLIT_TEXT_RECURSIVE_CHARACTER in SYNC_DOC_CHUNKS
+INGEST_CHUNK_SIZE = int(os.getenv("INGEST_CHUNK_SIZE", "1800"))
+INGEST_CHUNK_OVERLAP = int(os.getenv("INGEST_CHUNK_OVERLAP", "250"))
+INGEST_MAX_WORKERS = int(os.getenv("INGEST_MAX_WORKERS", str(os.cpu_count() or 1)))
+# Chunks collected before they are written to the sink in one bulk upload
+INGEST_UPLOAD_BATCH_CHUNKS = int(os.getenv("INGEST_UPLOAD_BATCH_CHUNKS", "5000"))
+INGEST_SINK = os.getenv("INGEST_SINK", "sqlite")
+INGEST_SQLITE_PATH = os.getenv("INGEST_SQLITE_PATH", "invoice_chunks.sqlite")
+INGEST_CHUNK_TABLE = os.getenv("INGEST_CHUNK_TABLE", "CHUNKED_INVOICE_CONTENT")
+INGEST_DOCUMENT_TABLE = os.getenv("INGEST_DOCUMENT_TABLE", "INGESTED_INVOICE_DOCUMENTS")
+
+DEFAULT_DATA_DIR = Path(__file__).resolve().parent / "scripts" / "data"
+
+# Separators of the markdown format of SPLIT_TEXT_RECURSIVE_CHARACTER, tried in order
+MARKDOWN_SEPARATORS = [
+    r"\n#{1,6} ",
+    r"```\n",
+    r"\n\*\*\*+\n",
+    r"\n---+\n",
+    r"\n___+\n",
+    r"\n\n",
+    r"\n",
+    r" ",
+    r"",
+]
+
+
+class DocumentState(NamedTuple):
+    content_hash: str
+    size: int
+    mtime_ns: int
+
+
+class IngestedDocument(NamedTuple):
+    file_name: str
+    state: DocumentState
+    chunks: list[str]
+
+
+class IngestReport(NamedTuple):
+    scanned: int
+    unchanged: int
+    # Documents whose file was touched but whose content is the same
+    touched: int
+    changed: int
+    removed: int
+    failed: int
+    chunks: int
+    seconds: float
+
+
+def _merge_splits(splits: list[str], chunk_size: int, chunk_overlap: int) -> list[str]:
+    chunks = []
+    current = []
+    total = 0
+    for split in splits:
+        if total + len(split) > chunk_size and current:
+            chunk = "".join(current).strip()
+            if chunk:
+                chunks.append(chunk)
+            # Keep the tail of the previous chunk, up to chunk_overlap characters, as overlap
+            while total > chunk_overlap or (
+                total + len(split) > chunk_size and total > 0
+            ):
+                total -= len(current.pop(0))
+        current.append(split)
+        total += len(split)
+    chunk = "".join(current).strip()
+    if chunk:
+        chunks.append(chunk)
+    return chunks
+
+
+def split_text(
+    text: str,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    chunk_overlap: int = INGEST_CHUNK_OVERLAP,
+    separators: list[str] = MARKDOWN_SEPARATORS,
+) -> list[str]:
+    """
+    Splits text into chunks of at most ``chunk_size`` characters that overlap by up to
+    ``chunk_overlap`` characters.
+
+    The text is split on the first separator it contains, each separator kept at the start of the
+    piece that follows it, and the pieces are merged back into chunks. Pieces that are still too
+    long are split again on the next separators, like Snowflake's SPLIT_TEXT_RECURSIVE_CHARACTER.
+    """
+    separator, remaining = separators[-1], []
+    for i, candidate in enumerate(separators):
+        if candidate == "" or re.search(candidate, text):
+            separator, remaining = candidate, separators[i + 1 :]
+            break
+
+    if separator:
+        pieces = re.split(f"({separator})", text)
+        splits = [pieces[0]] + [
+            pieces[i] + pieces[i + 1] for i in range(1, len(pieces), 2)
+        ]
+    else:
+        splits = list(text)
+
+    chunks = []
+    short = []
+    for split in filter(None, splits):
+        if len(split) < chunk_size:
+            short.append(split)
+            continue
+        if short:
+            chunks.extend(_merge_splits(short, chunk_size, chunk_overlap))
+            short = []
+        if remaining:
+            chunks.extend(split_text(split, chunk_size, chunk_overlap, remaining))
+        else:
+            chunks.append(split)
+    if short:
+        chunks.extend(_merge_splits(short, chunk_size, chunk_overlap))
+    return chunks
+
+
+def extract_text(path: Path) -> str:
+    """Returns the text of a PDF, one paragraph per page, or the contents of a text file."""
+    if path.suffix.lower() != ".pdf":
+        return path.read_text(encoding="utf-8")
+    # pypdf is only needed for ingestion, so it is not a dependency of the app
+    from pypdf import PdfReader
+
+    reader = PdfReader(path)
+    return "\n\n".join((page.extract_text() or "").strip() for page in reader.pages)
+
+
+def file_digest(path: Path) -> str:
+    with path.open("rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def parse_and_chunk(
+    path: Path, chunk_size: int, chunk_overlap: int
+) -> tuple[str, list[str]]:
+    """Hashes and chunks a document; runs in the worker processes."""
+    return file_digest(path), split_text(extract_text(path), chunk_size, chunk_overlap)
+
+
+class ChunkSink:
+    """
+    Destination of the chunks, which also keeps the state of every document it holds chunks of.
+
+    A document's state is only written together with its chunks, so a run that fails part way
+    ingests the remaining documents again the next time.
+    """
+
+    def documents(self) -> dict[str, DocumentState]:
+        """Returns the state of every ingested document by file name."""
+        raise NotImplementedError
+
+    def replace(self, documents: list[IngestedDocument]):
+        """Replaces the chunks and state of the given documents."""
+        raise NotImplementedError
+
+    def update_states(self, states: dict[str, DocumentState]):
+        """Records new states for documents whose content is unchanged."""
+        raise NotImplementedError
+
+    def remove(self, file_names: list[str]):
+        """Removes the chunks and state of the given documents."""
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SQLiteChunkSink(ChunkSink):
+    """Keeps chunks in a local SQLite database, for testing and local search."""
+
+    def __init__(self, path: str = INGEST_SQLITE_PATH):
+        self.connection = sqlite3.connect(path)
+        with self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS documents (file_name TEXT PRIMARY KEY, "
+                "content_hash TEXT, size INTEGER, mtime_ns INTEGER, chunks INTEGER, ingested_at TEXT)"
+            )
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS chunks (file_name TEXT, chunk_index INTEGER, chunk TEXT)"
+            )
+            self.connection.execute(
+                "CREATE INDEX IF NOT EXISTS chunks_file_name ON chunks (file_name)"
+            )
+
+    def documents(self) -> dict[str, DocumentState]:
+        rows = self.connection.execute(
+            "SELECT file_name, content_hash, size, mtime_ns FROM documents"
+        )
+        return {name: DocumentState(*state) for name, *state in rows}
+
+    def replace(self, documents: list[IngestedDocument]):
+        now = datetime.now(timezone.utc).isoformat()
+        with self.connection:
+            self.connection.executemany(
+                "DELETE FROM chunks WHERE file_name = ?",
+                [(d.file_name,) for d in documents],
+            )
+            self.connection.executemany(
+                "INSERT INTO chunks (file_name, chunk_index, chunk) VALUES (?, ?, ?)",
+                [
+                    (d.file_name, i, chunk)
+                    for d in documents
+                    for i, chunk in enumerate(d.chunks)
+                ],
+            )
+            self.connection.executemany(
+                "INSERT OR REPLACE INTO documents VALUES (?, ?, ?, ?, ?, ?)",
+                [(d.file_name, *d.state, len(d.chunks), now) for d in documents],
+            )
+
+    def update_states(self, states: dict[str, DocumentState]):
+        with self.connection:
+            self.connection.executemany(
+                "UPDATE documents SET content_hash = ?, size = ?, mtime_ns = ? WHERE file_name = ?",
+                [(*state, name) for name, state in states.items()],
+            )
+
+    def remove(self, file_names: list[str]):
+        with self.connection:
+            for table in ("chunks", "documents"):
+                self.connection.executemany(
+                    f"DELETE FROM {table} WHERE file_name = ?",
+                    [(name,) for name in file_names],
+                )
+
+    def close(self):
+        self.connection.close()
+
+
+class SnowflakeChunkSink(ChunkSink):
+    """
+    Writes chunks to the table the Cortex Search service is built on.
+
+    The document states are kept in a separate table, created if it does not exist. Documents
+    ingested this way should not also be copied to the ``docs`` stage, or ``SYNC_DOC_CHUNKS`` would
+    chunk them a second time.
+    """
+
+    def __init__(
+        self,
+        session,
+        chunk_table: str = INGEST_CHUNK_TABLE,
+        document_table: str = INGEST_DOCUMENT_TABLE,
+    ):
+        self.session = session
+        self.chunk_table = chunk_table
+        self.document_table = document_table
+        session.sql(
+            f"CREATE TABLE IF NOT EXISTS {document_table} (FILE_NAME VARCHAR, CONTENT_HASH VARCHAR, "
+            "SIZE NUMBER, MTIME_NS NUMBER, CHUNKS NUMBER, INGESTED_AT TIMESTAMP_TZ)"
+        ).collect()
+
+    def documents(self) -> dict[str, DocumentState]:
+        rows = self.session.table(self.document_table).collect()
+        return {
+            row["FILE_NAME"]: DocumentState(
+                row["CONTENT_HASH"], int(row["SIZE"]), int(row["MTIME_NS"])
+            )
+            for row in rows
+        }
+
+    def _delete(self, table: str, file_names: list[str]):
+        from snowflake.snowpark.functions import col
+
+        self.session.table(table).delete(col("FILE_NAME").in_(file_names))
+
+    def _append(self, table: str, rows: list[tuple], columns: list[str]):
+        if rows:
+            self.session.create_dataframe(rows, schema=columns).write.mode(
+                "append"
+            ).save_as_table(table)
+
+    def replace(self, documents: list[IngestedDocument]):
+        file_names = [d.file_name for d in documents]
+        now = datetime.now(timezone.utc)
+        self._delete(self.chunk_table, file_names)
+        self._append(
+            self.chunk_table,
+            [(d.file_name, chunk) for d in documents for chunk in d.chunks],
+            ["FILE_NAME", "CHUNK"],
+        )
+        self._delete(self.document_table, file_names)
+        self._append(
+            self.document_table,
+            [(d.file_name, *d.state, len(d.chunks), now) for d in documents],
+            ["FILE_NAME", "CONTENT_HASH", "SIZE", "MTIME_NS", "CHUNKS", "INGESTED_AT"],
+        )
+
+    def update_states(self, states: dict[str, DocumentState]):
+        from snowflake.snowpark.functions import col, lit
+
+        table = self.session.table(self.document_table)
+        for name, state in states.items():
+            table.update(
+                {
+                    "CONTENT_HASH": lit(state.content_hash),
+                    "SIZE": lit(state.size),
+                    "MTIME_NS": lit(state.mtime_ns),
+                },
+                col("FILE_NAME") == name,
+            )
+
+    def remove(self, file_names: list[str]):
+        self._delete(self.chunk_table, file_names)
+        self._delete(self.document_table, file_names)
+
+    def close(self):
+        self.session.close()
+
+
+def scan_documents(data_dir: Path, pattern: str = "*.pdf") -> dict[str, Path]:
+    """Returns the documents under ``data_dir`` by their path relative to it, as on the stage."""
+    return {
+        path.relative_to(data_dir).as_posix(): path
+        for path in sorted(data_dir.rglob(pattern))
+        if path.is_file()
+    }
+
+
+def ingest(
+    data_dir: Path,
+    sink: ChunkSink,
+    pattern: str = "*.pdf",
+    max_workers: int = INGEST_MAX_WORKERS,
+    chunk_size: int = INGEST_CHUNK_SIZE,
+    chunk_overlap: int = INGEST_CHUNK_OVERLAP,
+    upload_batch_chunks: int = INGEST_UPLOAD_BATCH_CHUNKS,
+    force: bool = False,
+) -> IngestReport:
+    """
+    Brings the sink up to date with the documents under ``data_dir`` matching ``pattern``.
+
+    Args:
+        data_dir (Path): Directory of the documents.
+        sink (ChunkSink): Where the chunks and document states are written.
+        pattern (str): Glob pattern of the documents, matched recursively.
+        max_workers (int): Processes hashing and chunking documents.
+        chunk_size (int): Maximum characters per chunk.
+        chunk_overlap (int): Characters shared by consecutive chunks.
+        upload_batch_chunks (int): Chunks collected before they are written to the sink.
+        force (bool): Re-ingest every document, even unchanged ones.
+
+    Returns:
+        IngestReport: Counts of the documents scanned, skipped, ingested, removed and failed.
+    """
+    start = time.perf_counter()
+    files = scan_documents(data_dir, pattern)
+    known = sink.documents()
+
+    removed = [
+        name
+        for name in known
+        if name not in files and PurePosixPath(name).match(pattern)
+    ]
+    if removed:
+        sink.remove(removed)
+
+    stats = {
+        name: DocumentState("", path.stat().st_size, path.stat().st_mtime_ns)
+        for name, path in files.items()
+    }
+    # Files with the same size and modification time are taken as unchanged without reading them
+    candidates = [
+        name
+        for name, state in stats.items()
+        if force
+        or name not in known
+        or (known[name].size, known[name].mtime_ns) != (state.size, state.mtime_ns)
+    ]
+
+    touched = {}
+    changed = 0
+    failed = 0
+    chunks = 0
+    batch = []
+    batch_chunks = 0
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as pool:
+        digests = dict(
+            zip(candidates, pool.map(file_digest, [files[n] for n in candidates]))
+        )
+        for name, digest in digests.items():
+            state = stats[name]._replace(content_hash=digest)
+            if not force and name in known and known[name].content_hash == digest:
+                touched[name] = state
+        if touched:
+            sink.update_states(touched)
+
+        pending = {
+            name: pool.submit(parse_and_chunk, files[name], chunk_size, chunk_overlap)
+            for name in digests
+            if name not in touched
+        }
+        for name, future in pending.items():
+            try:
+                digest, document_chunks = future.result()
+            except Exception as e:
+                gateway_logger.log("WARNING", f"Unable to ingest {name}: {e}")
+                failed += 1
+                continue
+            # The file may have been rewritten since it was first hashed
+            state = stats[name]._replace(content_hash=digest)
+            batch.append(IngestedDocument(name, state, document_chunks))
+            batch_chunks += len(document_chunks)
+            changed += 1
+            chunks += len(document_chunks)
+            if batch_chunks >= upload_batch_chunks:
+                sink.replace(batch)
+                batch, batch_chunks = [], 0
+    if batch:
+        sink.replace(batch)
+
+    return IngestReport(
+        scanned=len(files),
+        unchanged=len(files) - len(candidates),
+        touched=len(touched),
+        changed=changed,
+        removed=len(removed),
+        failed=failed,
+        chunks=chunks,
+        seconds=round(time.perf_counter() - start, 3),
+    )
+
+
+def create_sink(args) -> ChunkSink:
+    if args.sink == "sqlite":
+        return SQLiteChunkSink(args.sqlite_path)
+    from agent_factory import connection_parameters_from_env, create_session
+
+    return SnowflakeChunkSink(
+        create_session(connection_parameters_from_env()),
+        chunk_table=args.chunk_table,
+        document_table=args.document_table,
+    )
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "data_dir",
+        nargs="?",
+        default=str(DEFAULT_DATA_DIR),
+        help="Directory of the documents (default: scripts/data)",
+    )
+    parser.add_argument(
+        "--pattern",
+        default="*.pdf",
+        help="Glob pattern of the documents (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sink",
+        choices=["sqlite", "snowflake"],
+        default=INGEST_SINK,
+        help="Where the chunks are written (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--sqlite-path",
+        default=INGEST_SQLITE_PATH,
+        help="Database of the sqlite sink (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--chunk-table",
+        default=INGEST_CHUNK_TABLE,
+        help="Chunk table of the snowflake sink (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--document-table",
+        default=INGEST_DOCUMENT_TABLE,
+        help="Document state table of the snowflake sink (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        default=INGEST_MAX_WORKERS,
+        help="Processes chunking documents (default: %(default)s)",
+    )
+    parser.add_argument("--chunk-size", type=int, default=INGEST_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=INGEST_CHUNK_OVERLAP)
+    parser.add_argument(
+        "--force", action="store_true", help="Re-ingest unchanged documents too"
+    )
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    sink = create_sink(args)
+    try:
+        report = ingest(
+            Path(args.data_dir),
+            sink,
+            pattern=args.pattern,
+            max_workers=args.workers,
+            chunk_size=args.chunk_size,
+            chunk_overlap=args.chunk_overlap,
+            force=args.force,
+        )
+    finally:
+        sink.close()
+    gateway_logger.log("INFO", f"Ingestion finished: {report._asdict()}")
+    return 1 if report.failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,399 @@
+import asyncio
+import json
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Callable, NamedTuple
+
+import numpy as np
+from agent_gateway.tools.logger import gateway_logger
+
+from invoice_ingest import INGEST_SQLITE_PATH
+from stage_timing import TimedCortexSearchTool, record_stage
+
+# "cortex" searches the Cortex Search service, "local" searches the in-process index first
+INVOICE_SEARCH_MODE = os.getenv("INVOICE_SEARCH_MODE", "cortex")
+# SQLite database written by invoice_ingest.py that the local index is built from
+INVOICE_SEARCH_INDEX_PATH = os.getenv("INVOICE_SEARCH_INDEX_PATH", INGEST_SQLITE_PATH)
+# Optional .npy matrix of chunk embeddings, one row per key in the "<path>.keys.json" list
+INVOICE_SEARCH_EMBEDDINGS_PATH = os.getenv("INVOICE_SEARCH_EMBEDDINGS_PATH")
+# Share of the question's terms the local results must contain; below it Cortex Search is used
+INVOICE_SEARCH_MIN_COVERAGE = float(os.getenv("INVOICE_SEARCH_MIN_COVERAGE", "0.6"))
+# Weight of the embedding similarity against the normalized BM25 score, when embeddings are used
+INVOICE_SEARCH_VECTOR_WEIGHT = float(os.getenv("INVOICE_SEARCH_VECTOR_WEIGHT", "0.5"))
+# How often the database is checked for changed documents; 0 checks on every search
+INVOICE_SEARCH_REFRESH_SECONDS = float(
+    os.getenv("INVOICE_SEARCH_REFRESH_SECONDS", "30")
+)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+_INVOICE_NUMBER_RE = re.compile(r"invoice\s*(?:#|no\.?|number)?\s*(\d{3,})", re.I)
+# Words that do not count towards the coverage of a question
+_STOPWORDS = frozenset(
+    "a an and are as at be by can did do does for from give has have how i in is it me my of on or "
+    "please show tell that the this to was what when where which who why with".split()
+)
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def invoice_numbers(text: str) -> set[str]:
+    """Returns the invoice numbers mentioned in a text, e.g. "8921" in "the total on Invoice 8921"."""
+    return set(_INVOICE_NUMBER_RE.findall(text))
+
+
+class SearchHit(NamedTuple):
+    file_name: str
+    chunk: str
+    score: float
+
+
+class SearchResult(NamedTuple):
+    hits: list[SearchHit]
+    # Share of the question's terms found in the hits
+    coverage: float
+
+
+class _Chunk(NamedTuple):
+    file_name: str
+    chunk_index: int
+    text: str
+    length: int
+    fields: dict
+
+
+class InvoiceSearchIndex:
+    """
+    In-process BM25 index over the invoice chunks.
+
+    Chunks are kept in an inverted index from term to the chunks containing it, so a search only
+    scores the chunks sharing a term with the question; scores are accumulated with NumPy over the
+    posting arrays of the question's terms. Documents are added, replaced and removed one at a time,
+    so the index follows the ingestion database without being rebuilt. Each chunk has fields, such
+    as the invoice number of its document, that searches can be filtered on.
+
+    With an embedding matrix and a query embedder, the BM25 scores of the candidates are combined
+    with their cosine similarity. The matrix is memory-mapped, so only the rows of the candidates
+    are read.
+    """
+
+    def __init__(
+        self,
+        path: str | None = None,
+        embeddings_path: str | None = None,
+        embed_query: Callable[[str], np.ndarray] | None = None,
+        vector_weight: float = INVOICE_SEARCH_VECTOR_WEIGHT,
+        refresh_seconds: float = INVOICE_SEARCH_REFRESH_SECONDS,
+    ):
+        self.path = Path(path) if path else None
+        self.embeddings_path = Path(embeddings_path) if embeddings_path else None
+        self.embed_query = embed_query
+        self.vector_weight = vector_weight
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._chunks = {}
+        self._documents = {}
+        self._postings = {}
+        # Posting arrays of a term, built on first use and dropped when the term's postings change
+        self._arrays = {}
+        self._fields = {}
+        self._lengths = np.zeros(1024, dtype=np.float32)
+        self._next_id = 0
+        self._total_length = 0
+        self._hashes = {}
+        self._checked_at = None
+        self._embeddings = None
+        self._embedding_rows = {}
+
+    @classmethod
+    def from_env(cls) -> "InvoiceSearchIndex":
+        return cls(INVOICE_SEARCH_INDEX_PATH, INVOICE_SEARCH_EMBEDDINGS_PATH)
+
+    def __len__(self) -> int:
+        return len(self._chunks)
+
+    def _remove_locked(self, file_name: str):
+        for chunk_id in self._documents.pop(file_name, []):
+            chunk = self._chunks.pop(chunk_id)
+            self._total_length -= chunk.length
+            self._lengths[chunk_id] = 0
+            for field in chunk.fields.items():
+                self._fields[field].discard(chunk_id)
+            for term in set(tokenize(chunk.text)):
+                postings = self._postings[term]
+                del postings[chunk_id]
+                if not postings:
+                    del self._postings[term]
+                self._arrays.pop(term, None)
+
+    def replace(self, file_name: str, chunks: list[str]):
+        """Adds a document's chunks, replacing the chunks it had before."""
+        fields = {"file_name": file_name}
+        numbers = invoice_numbers(file_name) or invoice_numbers(" ".join(chunks[:1]))
+        if numbers:
+            fields["invoice_number"] = min(numbers)
+        with self._lock:
+            self._remove_locked(file_name)
+            chunk_ids = []
+            for chunk_index, text in enumerate(chunks):
+                chunk_id = self._next_id
+                self._next_id += 1
+                counts = Counter(tokenize(text))
+                length = sum(counts.values())
+                self._chunks[chunk_id] = _Chunk(
+                    file_name, chunk_index, text, length, fields
+                )
+                if chunk_id >= len(self._lengths):
+                    self._lengths = np.concatenate(
+                        [self._lengths, np.zeros_like(self._lengths)]
+                    )
+                self._lengths[chunk_id] = length
+                self._total_length += length
+                for field in fields.items():
+                    self._fields.setdefault(field, set()).add(chunk_id)
+                for term, count in counts.items():
+                    self._postings.setdefault(term, {})[chunk_id] = count
+                    self._arrays.pop(term, None)
+                chunk_ids.append(chunk_id)
+            self._documents[file_name] = chunk_ids
+
+    def remove(self, file_name: str):
+        """Removes a document's chunks."""
+        with self._lock:
+            self._remove_locked(file_name)
+
+    def _posting_arrays(self, term: str) -> tuple[np.ndarray, np.ndarray] | None:
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            postings = self._postings.get(term)
+            if not postings:
+                return None
+            arrays = (
+                np.fromiter(postings.keys(), dtype=np.int64, count=len(postings)),
+                np.fromiter(postings.values(), dtype=np.float32, count=len(postings)),
+            )
+            self._arrays[term] = arrays
+        return arrays
+
+    def _load_embeddings(self):
+        if self.embeddings_path is None or self._embeddings is not None:
+            return
+        keys_path = Path(f"{self.embeddings_path}.keys.json")
+        try:
+            keys = json.loads(keys_path.read_text(encoding="utf-8"))
+            self._embeddings = np.load(self.embeddings_path, mmap_mode="r")
+        except (OSError, ValueError) as e:
+            gateway_logger.log("WARNING", f"Invoice embeddings not loaded: {e}")
+            self.embeddings_path = None
+            return
+        # Keys are "<file name>#<chunk index>"
+        self._embedding_rows = {key: row for row, key in enumerate(keys)}
+
+    def refresh(self, force: bool = False):
+        """Applies the documents added, changed or removed in the ingestion database since the last refresh."""
+        if self.path is None or not self.path.exists():
+            return
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self._checked_at is not None
+                and now - self._checked_at < self.refresh_seconds
+            ):
+                return
+            self._checked_at = now
+        try:
+            with sqlite3.connect(f"file:{self.path}?mode=ro", uri=True) as connection:
+                hashes = dict(
+                    connection.execute("SELECT file_name, content_hash FROM documents")
+                )
+                changed = [
+                    name
+                    for name, digest in hashes.items()
+                    if self._hashes.get(name) != digest
+                ]
+                documents = {name: [] for name in changed}
+                for name, chunk in connection.execute(
+                    "SELECT file_name, chunk FROM chunks WHERE file_name IN "
+                    f"({', '.join('?' * len(changed))}) ORDER BY file_name, chunk_index",
+                    changed,
+                ):
+                    documents[name].append(chunk)
+        except sqlite3.Error as e:
+            gateway_logger.log("WARNING", f"Invoice search index not refreshed: {e}")
+            return
+
+        for name in set(self._hashes) - set(hashes):
+            self.remove(name)
+        for name, chunks in documents.items():
+            self.replace(name, chunks)
+        self._hashes = hashes
+        self._load_embeddings()
+        if changed:
+            gateway_logger.log(
+                "INFO",
+                f"Invoice search index updated {len(changed)} documents, {len(self)} chunks",
+            )
+
+    def search(
+        self, query: str, k: int = 10, filters: dict | None = None
+    ) -> SearchResult:
+        """
+        Returns the ``k`` chunks that best match ``query``.
+
+        Args:
+            query (str): The question.
+            k (int): Maximum number of chunks returned.
+            filters (dict | None): Field values the chunks must have, e.g. ``{"invoice_number": "8921"}``.
+
+        Returns:
+            SearchResult: The chunks, best first, and the share of the question's terms they contain.
+        """
+        self.refresh()
+        terms = list(dict.fromkeys(tokenize(query)))
+        with self._lock:
+            if not self._chunks or not terms:
+                return SearchResult([], 0.0)
+            scores = np.zeros(self._next_id, dtype=np.float32)
+            n = len(self._chunks)
+            average_length = self._total_length / n
+            lengths = self._lengths
+            for term in terms:
+                arrays = self._posting_arrays(term)
+                if arrays is None:
+                    continue
+                ids, tfs = arrays
+                idf = math.log(1 + (n - len(ids) + 0.5) / (len(ids) + 0.5))
+                norm = BM25_K1 * (1 - BM25_B + BM25_B * lengths[ids] / average_length)
+                scores[ids] += idf * tfs * (BM25_K1 + 1) / (tfs + norm)
+
+            if filters:
+                allowed = set.intersection(
+                    *(self._fields.get(field, set()) for field in filters.items())
+                )
+                mask = np.ones(self._next_id, dtype=bool)
+                mask[list(allowed)] = False
+                scores[mask] = 0
+
+            candidates = np.flatnonzero(scores)
+            if (
+                self._embeddings is not None
+                and self.embed_query is not None
+                and candidates.size
+            ):
+                scores = self._combine_vector_scores(query, scores, candidates)
+            top = candidates[np.argsort(-scores[candidates], kind="stable")[:k]]
+            hits = [
+                SearchHit(
+                    self._chunks[i].file_name, self._chunks[i].text, float(scores[i])
+                )
+                for i in top
+            ]
+
+        found = set()
+        for hit in hits:
+            found.update(tokenize(hit.chunk))
+        content_terms = [t for t in terms if t not in _STOPWORDS] or terms
+        coverage = sum(t in found for t in content_terms) / len(content_terms)
+        return SearchResult(hits, round(coverage, 4))
+
+    def _combine_vector_scores(
+        self, query: str, scores: np.ndarray, candidates: np.ndarray
+    ) -> np.ndarray:
+        rows = np.array(
+            [
+                self._embedding_rows.get(
+                    f"{self._chunks[i].file_name}#{self._chunks[i].chunk_index}", -1
+                )
+                for i in candidates
+            ],
+            dtype=np.int64,
+        )
+        embedded = rows >= 0
+        if not embedded.any():
+            return scores
+        query_vector = np.asarray(self.embed_query(query), dtype=np.float32)
+        query_vector /= np.linalg.norm(query_vector) or 1.0
+        matrix = np.asarray(self._embeddings[rows[embedded]], dtype=np.float32)
+        similarity = matrix @ query_vector / (np.linalg.norm(matrix, axis=1) + 1e-9)
+
+        combined = scores.copy()
+        combined[candidates] = (
+            (1 - self.vector_weight) * scores[candidates] / scores[candidates].max()
+        )
+        combined[candidates[embedded]] += self.vector_weight * similarity
+        return combined
+
+
+class LocalInvoiceSearchTool(TimedCortexSearchTool):
+    """
+    Cortex Search tool that answers from the in-process ``InvoiceSearchIndex`` when it can.
+
+    Results have the shape of the Cortex Search results, with the chunk in the first retrieval
+    column and the document's file name in the second. Questions that mention an invoice number are
+    only matched against that invoice. When the local results contain less than ``min_coverage`` of
+    the question's terms, e.g. because the document is not ingested locally, the question is sent
+    to the Cortex Search service instead.
+    """
+
+    def __init__(
+        self,
+        *args,
+        index: "InvoiceSearchIndex",
+        min_coverage: float = INVOICE_SEARCH_MIN_COVERAGE,
+        **kwargs,
+    ):
+        super().__init__(*args, **kwargs)
+        self._index = index
+        self._min_coverage = min_coverage
+
+    async def asearch(self, query: str):
+        text_column, source_column = self.retrieval_columns[:2]
+        numbers = invoice_numbers(query)
+        filters = {"invoice_number": min(numbers)} if len(numbers) == 1 else None
+        with record_stage("local_search", input_chars=len(query)) as span:
+            # Refreshes from SQLite and rebuilds changed documents, off the shared event loop
+            result = await asyncio.to_thread(
+                self._index.search, query, k=self.k, filters=filters
+            )
+            fallback = not result.hits or result.coverage < self._min_coverage
+            if span is not None:
+                span.set(
+                    results=len(result.hits),
+                    coverage=result.coverage,
+                    fallback=fallback,
+                )
+        if fallback:
+            gateway_logger.log(
+                "DEBUG",
+                f"Local search coverage {result.coverage} too low, using Cortex Search",
+            )
+            return await super().asearch(query)
+
+        output = [
+            {text_column: hit.chunk, source_column: hit.file_name}
+            for hit in result.hits
+        ]
+        citations = list({hit.file_name: None for hit in result.hits})
+        gateway_logger.log("DEBUG", f"Local Search Response: {output}")
+        result = {
+            "output": output,
+            "sources": {
+                "tool_type": "cortex_search",
+                "tool_name": self.name,
+                "metadata": [{source_column: name} for name in citations],
+            },
+        }
+        return result
+
+
+invoice_search_index = InvoiceSearchIndex.from_env()
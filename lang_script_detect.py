@@ -0,0 +1,209 @@
+import os
+import string
+import threading
+from collections import Counter
+from typing import NamedTuple
+
+# Minimum share of letters in the dominant script for a local answer to be trusted
+LANG_DETECT_MIN_CONFIDENCE = float(os.getenv("LANG_DETECT_MIN_CONFIDENCE", "0.8"))
+
+# Unicode blocks of the scripts that map to exactly one supported language code.
+# Devanagari and Latin are shared by several languages and are handled separately.
+SCRIPT_BLOCKS = {
+    "devanagari": (0x0900, 0x097F),
+    "bengali": (0x0980, 0x09FF),
+    "gurmukhi": (0x0A00, 0x0A7F),
+    "gujarati": (0x0A80, 0x0AFF),
+    "odia": (0x0B00, 0x0B7F),
+    "tamil": (0x0B80, 0x0BFF),
+    "telugu": (0x0C00, 0x0C7F),
+    "kannada": (0x0C80, 0x0CFF),
+    "malayalam": (0x0D00, 0x0D7F),
+}
+
+SCRIPT_LANG_CODES = {
+    "devanagari": "hi-IN",
+    "bengali": "bn-IN",
+    "gurmukhi": "pa-IN",
+    "gujarati": "gu-IN",
+    "odia": "od-IN",
+    "tamil": "ta-IN",
+    "telugu": "te-IN",
+    "kannada": "kn-IN",
+    "malayalam": "ml-IN",
+    "latin": "en-IN",
+}
+
+# Frequent Hindi function words; Devanagari text without any of them may be Marathi,
+# Nepali, Konkani etc. and is left to the remote detector.
+_HINDI_MARKERS = frozenset(
+    [
+        "है",
+        "हैं",
+        "था",
+        "थे",
+        "थी",
+        "का",
+        "की",
+        "के",
+        "में",
+        "को",
+        "से",
+        "क्या",
+        "कितने",
+        "कौन",
+        "और",
+        "ने",
+    ]
+)
+# Letters/words that are common in Marathi but not in Hindi
+_NON_HINDI_DEVANAGARI_MARKERS = frozenset(["आहे", "आहेत", "काय", "नाही", "आणि", "च्या"])
+_MARATHI_LLA = "ळ"
+
+_ENGLISH_MARKERS = frozenset(
+    "a an and are as at be by can did do does for from give had has have how i in is it list me my "
+    "of on or show tell that the their there these this to was were what when where which who why "
+    "with you your".split()
+)
+# Romanized Hindi/Hinglish words that would otherwise look like English
+_ROMANIZED_MARKERS = frozenset(
+    "hai hain kya kitne kitna kaun kaise kyun mein mera meri mujhe nahi kab kahan batao ka ki ke ko "
+    "se aur tha thi".split()
+)
+
+_PUNCTUATION = string.punctuation + "।॥“”‘’"
+
+
+def _words(text: str) -> list[str]:
+    # str.split rather than \w+ as Indic vowel signs and viramas are not word characters
+    return [w for w in (w.strip(_PUNCTUATION) for w in text.split()) if w]
+
+
+class ScriptDetection(NamedTuple):
+    lang_code: str | None
+    confidence: float
+    # Why the local detector declined to answer, None when lang_code is set
+    fallback_reason: str | None = None
+
+
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _script_of(char: str) -> str | None:
+    code_point = ord(char)
+    if code_point < 0x0250:
+        return "latin" if char.isalpha() else None
+    for script, (start, end) in SCRIPT_BLOCKS.items():
+        if start <= code_point <= end:
+            return script
+    return "other" if char.isalpha() else None
+
+
+def _record(detection: ScriptDetection) -> ScriptDetection:
+    with _stats_lock:
+        _stats["total"] += 1
+        if detection.lang_code is None:
+            _stats["fallback"] += 1
+            _stats[f"fallback_{detection.fallback_reason}"] += 1
+        else:
+            _stats["local"] += 1
+    return detection
+
+
+def _detect_latin(text: str, confidence: float) -> ScriptDetection:
+    words = [w.lower() for w in _words(text) if not w.isdigit()]
+    if any(w in _ROMANIZED_MARKERS for w in words):
+        return ScriptDetection(None, confidence, "romanized")
+    english_words = sum(w in _ENGLISH_MARKERS for w in words)
+    if not words or english_words / len(words) < 0.15:
+        return ScriptDetection(None, confidence, "romanized")
+    return ScriptDetection(SCRIPT_LANG_CODES["latin"], confidence)
+
+
+def _detect_devanagari(text: str, confidence: float) -> ScriptDetection:
+    words = set(_words(text))
+    if _MARATHI_LLA in text or words & _NON_HINDI_DEVANAGARI_MARKERS:
+        return ScriptDetection(None, confidence, "devanagari_ambiguous")
+    if not words & _HINDI_MARKERS:
+        return ScriptDetection(None, confidence, "devanagari_ambiguous")
+    return ScriptDetection(SCRIPT_LANG_CODES["devanagari"], confidence)
+
+
+def detect_script_language(
+    text: str, min_confidence: float = LANG_DETECT_MIN_CONFIDENCE
+) -> ScriptDetection:
+    """
+    Detect the language of text from the Unicode script blocks of its letters.
+
+    Scripts that belong to a single supported language (Tamil, Telugu, Kannada, Malayalam, ...)
+    are answered directly. Devanagari is only answered as Hindi when Hindi function words are
+    present, and Latin text only as English when English function words are present and no
+    romanized Hindi is found. Everything else, including mixed-script text, returns a
+    ``lang_code`` of None so the caller can fall back to the remote detector.
+
+    Args:
+        text (str): The input text/question.
+        min_confidence (float): Minimum share of letters in the dominant script.
+
+    Returns:
+        ScriptDetection: The detected ``xx-IN`` language code (or None), the share of letters in the
+        dominant script as confidence, and the reason for falling back.
+
+    Example:
+        >>> detect_script_language("இன்று வானிலை எப்படி இருக்கிறது?")
+        ScriptDetection(lang_code='ta-IN', confidence=1.0, fallback_reason=None)
+
+        >>> detect_script_language("aaj mausam kaisa hai?")
+        ScriptDetection(lang_code=None, confidence=1.0, fallback_reason='romanized')
+    """
+    counts = Counter(script for script in map(_script_of, text) if script is not None)
+    letters = sum(counts.values())
+    if not letters:
+        return _record(ScriptDetection(None, 0.0, "no_letters"))
+
+    script, dominant = counts.most_common(1)[0]
+    # The share of all letters, so that English words in Indic text count against the Indic script
+    confidence = round(dominant / letters, 3)
+    indic_letters = letters - counts["latin"] - counts["other"]
+    if script == "latin" and indic_letters:
+        # Code-mixed text with more English than Indic letters is not answered as English
+        return _record(ScriptDetection(None, confidence, "mixed_scripts"))
+    if script == "other" or confidence < min_confidence:
+        return _record(ScriptDetection(None, confidence, "mixed_scripts"))
+    if script == "latin":
+        return _record(_detect_latin(text, confidence))
+    if script == "devanagari":
+        return _record(_detect_devanagari(text, confidence))
+    return _record(ScriptDetection(SCRIPT_LANG_CODES[script], confidence))
+
+
+def guess_script_language(text: str) -> str | None:
+    """
+    Returns the most likely language of the text's dominant Indic script, for speculative work that
+    is checked against the actual detection later.
+
+    Unlike ``detect_script_language`` it always guesses: Devanagari is guessed as Marathi when
+    Marathi markers are present and as Hindi otherwise. Text without Indic letters returns None.
+    Guesses are not counted in ``detection_stats``.
+    """
+    counts = Counter(
+        script for script in map(_script_of, text) if script in SCRIPT_BLOCKS
+    )
+    if not counts:
+        return None
+    script = counts.most_common(1)[0][0]
+    if script == "devanagari" and (
+        _MARATHI_LLA in text or set(_words(text)) & _NON_HINDI_DEVANAGARI_MARKERS
+    ):
+        return "mr-IN"
+    return SCRIPT_LANG_CODES[script]
+
+
+def detection_stats() -> dict:
+    """Returns counters of local detections and remote fallbacks (per reason)."""
+    with _stats_lock:
+        stats = dict(_stats)
+    total = stats.get("total", 0)
+    stats["fallback_rate"] = stats.get("fallback", 0) / total if total else 0.0
+    return stats
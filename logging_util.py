@@ -1,39 +1,116 @@
-import io
+import contextvars
+import itertools
 import logging
+import os
 import re
+from collections import deque
+from contextlib import contextmanager
 
 from agent_gateway.tools.utils import parse_log_message
 
+# Per request caps on the log lines kept in memory, oldest lines are dropped first
+LOG_BUFFER_MAX_LINES = int(os.getenv("LOG_BUFFER_MAX_LINES", "2000"))
+LOG_BUFFER_MAX_CHARS = int(os.getenv("LOG_BUFFER_MAX_CHARS", "500000"))
+
+# Id of the request the current task is working on, used to route records to its handler
+_log_request_id = contextvars.ContextVar("log_request_id", default=None)
+
+
+def bind_log_request(request_id: str):
+    """Marks the log records emitted by the current task (and its child tasks) as belonging to request_id."""
+    return _log_request_id.set(request_id)
+
+
+def current_log_request() -> str | None:
+    """Returns the id of the request the current task is working on, if any."""
+    return _log_request_id.get()
+
 
 class StreamlitLogHandler(logging.Handler):
-    def __init__(self):
+    def __init__(
+        self,
+        request_id: str | None = None,
+        max_lines: int = LOG_BUFFER_MAX_LINES,
+        max_chars: int = LOG_BUFFER_MAX_CHARS,
+    ):
         super().__init__()
-        self.log_buffer = io.StringIO()
+        self.request_id = request_id
+        self.max_chars = max_chars
         self.ansi_escape = re.compile(r"\x1B(?:[@-Z\\-_]|\[[0-?]*[ -/]*[@-~])")
+        # Ring buffer of raw lines and the parsed lines of the records already processed
+        self.log_lines = deque(maxlen=max_lines)
+        self.parsed_lines = deque(maxlen=max_lines)
+        self._chars = 0
+        self._parsed_chars = 0
+        self._parsed_text = ""
+        # Sequence number of the next line to be written and of the next line to be parsed
+        self._written = 0
+        self._read = 0
+
+    def filter(self, record):
+        if self.request_id is not None and _log_request_id.get() != self.request_id:
+            return False
+        return super().filter(record)
 
     def emit(self, record):
         msg = self.format(record)
         clean_msg = self.ansi_escape.sub("", msg)
-        self.log_buffer.write(clean_msg + "\n")
+        with self.lock:
+            for line in clean_msg.split("\n"):
+                if len(self.log_lines) == self.log_lines.maxlen:
+                    self._chars -= len(self.log_lines[0])
+                self.log_lines.append(line)
+                self._chars += len(line)
+                self._written += 1
+            while self._chars > self.max_chars and self.log_lines:
+                self._chars -= len(self.log_lines.popleft())
 
     def get_logs(self):
-        return self.log_buffer.getvalue()
+        with self.lock:
+            return "\n".join(self.log_lines) + "\n" if self.log_lines else ""
 
     def process_logs(self):
-        raw_logs = self.get_logs()
-        lines = raw_logs.strip().split("\n")
-        log_output = [parse_log_message(line.strip()) for line in lines if line.strip()]
-        cleaned_output = [line for line in log_output if line is not None]
-        all_logs = "\n".join(cleaned_output)
-        return all_logs
+        """Parses only the lines written since the previous call and returns all parsed logs."""
+        with self.lock:
+            # Lines that were dropped from the ring buffer before being read are skipped
+            first_buffered = self._written - len(self.log_lines)
+            start = max(self._read, first_buffered)
+            new_lines = list(
+                itertools.islice(self.log_lines, start - first_buffered, None)
+            )
+            self._read = self._written
+
+        log_output = [
+            parse_log_message(line.strip()) for line in new_lines if line.strip()
+        ]
+        parsed = [line for line in log_output if line is not None]
+        with self.lock:
+            if not parsed:
+                return self._parsed_text
+            # The parsed lines are capped like the raw lines, in lines and characters
+            for line in parsed:
+                if len(self.parsed_lines) == self.parsed_lines.maxlen:
+                    self._parsed_chars -= len(self.parsed_lines[0])
+                self.parsed_lines.append(line)
+                self._parsed_chars += len(line)
+            while self._parsed_chars > self.max_chars and self.parsed_lines:
+                self._parsed_chars -= len(self.parsed_lines.popleft())
+            self._parsed_text = "\n".join(self.parsed_lines)
+            return self._parsed_text
 
     def clear_logs(self):
-        self.log_buffer = io.StringIO()
+        with self.lock:
+            self.log_lines.clear()
+            self.parsed_lines.clear()
+            self._chars = 0
+            self._parsed_chars = 0
+            self._parsed_text = ""
+            self._read = self._written
 
 
-def setup_logging():
+def setup_logging(request_id: str | None = None):
     root_logger = logging.getLogger()
-    handler = StreamlitLogHandler()
+    handler = StreamlitLogHandler(request_id=request_id)
     handler.setLevel(logging.INFO)
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
@@ -41,3 +118,14 @@ def setup_logging():
     handler.setFormatter(formatter)
     root_logger.addHandler(handler)
     return handler
+
+
+@contextmanager
+def request_logging(request_id: str):
+    """Attaches a StreamlitLogHandler for the records of request_id and detaches it afterwards."""
+    handler = setup_logging(request_id=request_id)
+    try:
+        yield handler
+    finally:
+        logging.getLogger().removeHandler(handler)
+        handler.close()
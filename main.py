@@ -11,29 +11,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-import asyncio
+import concurrent.futures
 import logging
 import os
-import queue
-import threading
-import uuid
 import warnings
 
 import streamlit as st
 
-# Agent Gateway imports
-from agent_gateway import Agent, TruAgent
-from agent_gateway.tools import CortexAnalystTool, CortexSearchTool, PythonTool
+from agent_gateway.tools.logger import gateway_logger
 from dotenv import load_dotenv
 
-# Snowflake imports
-from snowflake.snowpark import Session
-
-# Trulens imports
-from trulens.core.database.connector.default import DefaultDBConnector
-
-from logging_util import setup_logging
-from sarvam_ai_lang_tools import answer_translator, lang_detect, translate
+from agent_factory import (
+    answer_prompt,
+    connection_parameters_from_env,
+    create_agent_pool,
+    tool_config_from_env,
+)
+from answer_streaming import ANSWER_STREAMING, AnswerStream
+from async_worker import AsyncJobScheduler
+from conversation_store import CONVERSATION_WINDOW_TURNS, WAITING, ConversationStore
+from logging_util import bind_log_request, request_logging
+from sarvam_clients import aclose_async_client
+from sarvam_guard import sarvam_guard
+from speculation import PIPELINE_SPECULATIVE, speculation_stats
+from tool_budget import TOOL_BUDGET_ENABLED, tool_budget_stats
 
 load_dotenv()
 
@@ -52,33 +53,10 @@ st.markdown(
     "You can ask questions in your preferred language, and the agent will respond accordingly."
 )
 
-OUTPUT_PROMPT = """
-You are a helpful multi lingual analyst who can answer about customer support tickets. Guidelines for your tasks will be:
-1. Translates the question from detected language to english
-2. Send the translated question to the CortexAnalystTool to get the answer.
-3. Translate the answer back to the original language of the question using the 'answer_translator' tool.
-4. The answer should start with a marker 'Action: Finish' and end with a marker '<END_OF_RESPONSE>' with actual answer between the start and end marker.
-"""
+# How often the debug logs are refreshed while a prompt is processed
+LOG_REFRESH_SECONDS = 0.25
 
 # Initialize session state variables with defaults if not already set
-if "model_stage" not in st.session_state:
-    __model_stage = os.getenv("SEMANTIC_MODEL_STAGE")
-    if not __model_stage:
-        raise ValueError("SEMANTIC_MODEL_FILE environment variable is not set.")
-    st.session_state.model_stage = __model_stage
-
-if "semantic_model_file" not in st.session_state:
-    __semantic_model_file = os.getenv("SEMANTIC_MODEL_FILE")
-    if not __semantic_model_file:
-        raise ValueError("SEMANTIC_MODEL_FILE environment variable is not set.")
-    st.session_state.semantic_model_file = __semantic_model_file
-
-if "search_service_name" not in st.session_state:
-    __search_service_name = os.getenv("SEARCH_SERVICE_NAME")
-    if not __search_service_name:
-        raise ValueError("SEARCH_SERVICE_NAME environment variable is not set.")
-    st.session_state.search_service_name = __search_service_name
-
 if "debug_mode" not in st.session_state:
     # Default debug mode is True for this demo
     st.session_state.debug_mode = True
@@ -100,119 +78,33 @@ if "target_lang" not in st.session_state:
 
 # Set up logging
 if "logging_setup" not in st.session_state:
-    st.session_state.logging_setup = setup_logging()
+    # Log handlers are attached per prompt in process_message
+    st.session_state.logging_setup = True
     st.logger = logging.getLogger("AgentGatewayLogger")  # type: ignore
     st.logger.propagate = True  # type: ignore
 
 
-def build_agent():
-    if st.session_state.enable_truelens:
-        connector = DefaultDBConnector()
-        agent = TruAgent(
-            app_name="linguatics_agent_demo",
-            app_version="v0.0.1",
-            trulens_snowflake_connection=connector,
-            snowflake_connection=st.session_state.snowpark,
-            tools=st.session_state.snowflake_tools,
-            max_retries=3,
-        )
-        # TODO
-        # session = TruSession(connector=connector)
-        # run_dashboard(session, port=8084, force=True)
-    else:
-        agent = Agent(
-            snowflake_connection=st.session_state.snowpark,
-            agent_llm="claude-3-5-sonnet",
-            tools=st.session_state.snowflake_tools,
-            fusion_prompt=OUTPUT_PROMPT,
-        )
-    return agent
+@st.cache_resource
+def get_agent_pool(enable_trulens: bool):
+    """Process-wide pool of warmed Snowpark sessions, tools and agents shared by all browser sessions."""
+    return create_agent_pool(
+        connection_parameters=connection_parameters_from_env(),
+        tool_config=tool_config_from_env(),
+        enable_trulens=enable_trulens,
+    )
 
 
-## Snowflake Connection
-if not os.getenv("PRIVATE_KEY_PASSPHRASE"):
-    raise ValueError("PRIVATE_KEY_PASSPHRASE environment variable is not set.")
+@st.cache_resource
+def get_scheduler():
+    """Process-wide background event loops that run the agent for all browser sessions."""
+    return AsyncJobScheduler(on_shutdown=aclose_async_client)
 
 
-if not os.getenv("SNOWFLAKE_DEFAULT_CONNECTION_NAME"):
-    raise ValueError(
-        "SNOWFLAKE_DEFAULT_CONNECTION_NAME environment variable is not set."
-    )
+get_agent_pool(st.session_state.enable_truelens)
 
-connection_parameters = {
-    "connection_name": os.getenv("SNOWFLAKE_DEFAULT_CONNECTION_NAME"),
-    "private_key_file_pwd": os.getenv("PRIVATE_KEY_PASSPHRASE"),
-    "database": os.getenv("SNOWFLAKE_DATABASE", "kamesh_llm_demo"),
-    "user": os.getenv("SNOWFLAKE_USER", "kameshs"),
-    "account": os.getenv("SNOWFLAKE_ACCOUNT"),
-    "schema": "DATA",
-    "warehouse": os.getenv("SNOWFLAKE_WAREHOUSE", "COMPUTE_WH"),
-}
-
-if "snowpark" not in st.session_state or st.session_state.snowpark is None:
-    st.session_state.snowpark = Session.builder.configs(
-        connection_parameters
-    ).getOrCreate()
-    # IMPORTANT: Set the database, schema, and warehouse for the session
-    st.session_state.snowpark.use_database(connection_parameters["database"])
-    st.session_state.snowpark.use_schema(connection_parameters["schema"])
-    st.session_state.snowpark.use_warehouse(connection_parameters["warehouse"])
-
-    analyst_config = {
-        "semantic_model": st.session_state.semantic_model_file,
-        "stage": st.session_state.model_stage,
-        "service_topic": "Customer support tickets model",
-        "data_description": "a table with customer support tickets",
-        "snowflake_connection": st.session_state.snowpark,
-        "max_results": 5,
-    }
-
-    search_config = {
-        "service_name": st.session_state.search_service_name,
-        "service_topic": "Customer invoice related queries.",
-        "data_description": "Customer invoices and related documents",
-        "retrieval_columns": ["PARSED_TEXT", "URL"],
-        "snowflake_connection": st.session_state.snowpark,
-        "k": 10,
-    }
-
-    __language_identifier_config = {
-        "tool_description": "Identify the language of the question",
-        "output_description": "It should identify the language code and return it for other tools to use.",
-        "python_func": lang_detect,
-    }
-
-    __translator_config = {
-        "tool_description": "Use the identified language from the right tool (e.g., ta-IN for Tamil, hi-IN for Hindi, te-IN for Telugu) as the language code to translate the question to English and then pass the english question to Analyst tool.",
-        "output_description": "Returns English translation of the question",
-        "python_func": translate,
-    }
-
-    __answer_translator_config = {
-        "tool_description": "Translate the answer from English back to the original language of the question.",
-        "output_description": "Returns the answer translated from English to the original question's language.",
-        "python_func": answer_translator,
-    }
-
-    # Tools Config
-    st.session_state.language_identifier = PythonTool(**__language_identifier_config)
-    st.session_state.translator = PythonTool(**__translator_config)
-    st.session_state.answer_translator = PythonTool(**__answer_translator_config)
-    st.session_state.analyst = CortexAnalystTool(**analyst_config)
-    st.session_state.search_config = CortexSearchTool(**search_config)
-
-    st.session_state.snowflake_tools = [
-        st.session_state.language_identifier,
-        st.session_state.translator,
-        st.session_state.analyst,
-        st.session_state.search_config,
-        st.session_state.answer_translator,
-    ]
-
-
-if "agent" not in st.session_state:
-    connector = DefaultDBConnector()
-    st.session_state.agent = build_agent()
+if "agent_memory" not in st.session_state:
+    # Previous questions and answers of this browser session, used by the pooled agents
+    st.session_state.agent_memory = []
 
 
 # Sidebar settings
@@ -257,47 +149,62 @@ if "agent" not in st.session_state:
 def process_message(prompt_id: str):
     prompt = st.session_state["prompt_history"][prompt_id].get("prompt")
 
-    message_queue = queue.Queue()
-    agent = st.session_state.agent
+    agent_pool = get_agent_pool(st.session_state.enable_truelens)
+    agent_memory = st.session_state.agent_memory
     log_container = st.empty()
-    log_handler = setup_logging()
-
-    def run_analysis():
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        response = loop.run_until_complete(agent.acall(prompt))
-        loop.close()
-        message_queue.put(response)
+    # Partial answer rendered while the final answer is generated, when streaming is enabled
+    answer_stream = AnswerStream() if ANSWER_STREAMING else None
 
-    thread = threading.Thread(target=run_analysis)
-    thread.start()
-
-    while True:
+    async def run_analysis():
+        bind_log_request(prompt_id)
+        response = await answer_prompt(
+            agent_pool, prompt, agent_memory, answer_stream=answer_stream
+        )
+        gateway_logger.log("DEBUG", f"Snowpark pool: {agent_pool.stats()}")
+        gateway_logger.log("DEBUG", f"SarvamAI: {sarvam_guard.stats()}")
+        if PIPELINE_SPECULATIVE:
+            gateway_logger.log("DEBUG", f"Speculation: {speculation_stats.stats()}")
+        if TOOL_BUDGET_ENABLED:
+            gateway_logger.log("DEBUG", f"Tool budget: {tool_budget_stats.stats()}")
+        return response
+
+    future = None
+    streamed = ""
+    with request_logging(prompt_id) as log_handler:
         try:
-            response = message_queue.get(timeout=1)
-            if isinstance(response, dict) and "output" in response:
-                final_response = response
-                st.session_state["prompt_history"][prompt_id]["response"] = (
-                    final_response["output"]
-                )
-                st.session_state["prompt_history"][prompt_id]["sources"] = (
-                    final_response["sources"]
-                )
-                logs = log_handler.process_logs()
-                if logs:
-                    log_container.code(logs)
-                log_container.empty()
-                yield final_response
-                break
-            else:
+            future = get_scheduler().submit(run_analysis)
+            # Returns as soon as the job completes; the timeout only paces log updates. The
+            # job's own TimeoutError is raised by future.result() once it is done.
+            while not concurrent.futures.wait([future], timeout=LOG_REFRESH_SECONDS)[0]:
                 logs = log_handler.process_logs()
                 if logs:
                     log_container.code(logs)
-
-        except queue.Empty:
-            logs = log_handler.process_logs()
-            if logs:
-                log_container.code(logs)
+                if answer_stream is not None:
+                    partial = answer_stream.text()
+                    if partial != streamed:
+                        streamed = partial
+                        yield partial
+            final_response = future.result()
+        except Exception as e:
+            gateway_logger.log("ERROR", f"Unable to process prompt: {e}")
+            final_response = {
+                "output": f"Unable to process your request: {e}",
+                "sources": None,
+            }
+        finally:
+            # Cancel the job when Streamlit stops this script run, e.g. the user left the page
+            if future is not None and not future.done():
+                future.cancel()
+
+        logs = log_handler.process_logs()
+        if logs:
+            log_container.code(logs)
+
+    st.session_state["prompt_history"].finish(
+        prompt_id, final_response["output"], final_response["sources"]
+    )
+    log_container.empty()
+    yield final_response["output"]
     st.rerun()
 
 
@@ -308,71 +215,58 @@ def extract_tool_name(statement):
 
 
 if "prompt_history" not in st.session_state:
-    st.session_state["prompt_history"] = {}
+    st.session_state["prompt_history"] = ConversationStore()
+if "history_pages" not in st.session_state:
+    st.session_state["history_pages"] = 1
 
 
 def create_prompt(prompt_key: str):
     if prompt_key in st.session_state:
-        prompt_record = dict(prompt=st.session_state[prompt_key], response="waiting")
-        st.session_state["prompt_history"][str(uuid.uuid4())] = prompt_record
+        st.session_state["prompt_history"].add(st.session_state[prompt_key])
+        # A new prompt returns the view to the latest turns
+        st.session_state["history_pages"] = 1
+
+
+def show_earlier_turns():
+    st.session_state["history_pages"] += 1
 
 
 with st.container(border=False):
-    for id in st.session_state.prompt_history:
-        current_prompt = st.session_state.prompt_history.get(id)
+    prompt_history = st.session_state.prompt_history
+    # Only the latest turns are rendered, so reruns cost the same however long the conversation is
+    turns = prompt_history.window(
+        CONVERSATION_WINDOW_TURNS * st.session_state.history_pages
+    )
+    hidden_turns = len(prompt_history) - len(turns) + prompt_history.dropped
+    if hidden_turns:
+        st.button(
+            f"Show earlier messages ({hidden_turns} hidden)",
+            on_click=show_earlier_turns,
+            disabled=len(prompt_history) == len(turns),
+        )
 
+    for id, current_prompt in turns:
         with st.chat_message("user"):
             st.write(current_prompt.get("prompt"))
 
         with st.chat_message("assistant"):
             response_container = st.empty()
-            if current_prompt.get("response") == "waiting":
+            if current_prompt.get("response") == WAITING:
                 # Start processing messages
                 message_generator = process_message(prompt_id=id)
 
                 with st.spinner("Awaiting Response..."):
                     for response in message_generator:
-                        response_container.text(response)
+                        response_container.markdown(response)
             else:
                 # Display the final response
                 response_container.markdown(
                     current_prompt["response"],
                     unsafe_allow_html=True,
                 )
-                # Add sources section aligned to the right
-                if current_prompt.get("sources") is not None:
-                    citations_metadata = [
-                        source["metadata"] for source in current_prompt.get("sources")
-                    ]
-
-                    sources = []
-                    for item in citations_metadata:
-                        if (
-                            item is not None
-                            and isinstance(item, list)
-                            and len(item) > 0
-                        ):
-                            first_element = item[0]
-                            if (
-                                isinstance(first_element, dict)
-                                and len(first_element) > 0
-                            ):
-                                sources.append(next(iter(first_element.values())))
-
-                    # Filter out None values in sources list
-                    sources = [source for source in sources if source is not None]
-
-                    # Determine the sources to display
-                    sources_display = ", ".join(sources) if sources else "N/A"
-
-                    st.markdown(
-                        f"""
-                        <div style="text-align: right; font-size: 0.8em; font-style: italic; margin-top: 5px;">
-                            <b>Sources</b>: {sources_display}
-                        </div>
-                        """,
-                        unsafe_allow_html=True,
-                    )
+                # Sources section aligned to the right, rendered when the turn finished
+                if current_prompt.get("sources_html") is not None:
+                    st.markdown(current_prompt["sources_html"], unsafe_allow_html=True)
 
 st.chat_input(
     "Ask Anything",
@@ -0,0 +1,334 @@
+"""
+Headless MCP and HTTP server for the multilingual analyst pipeline.
+
+Exposes language detection, translation, Cortex Analyst, invoice search and the full multilingual
+answer as MCP tools (streamable HTTP at ``/mcp``) and as JSON endpoints (``POST /api/<tool>``).
+All clients share one process-wide pool of Snowpark sessions and the SarvamAI clients of the
+background event loops; requests run on an ``AsyncJobScheduler``, which bounds how many run and
+wait at a time and how long each may take. ``GET /health`` reports liveness and ``GET /ready``
+whether the process can serve requests, for load balancer health checks.
+
+Example:
+    python mcp_server.py --host 0.0.0.0 --port 8000
+    curl -X POST localhost:8000/api/ask -d '{"question": "कितने टिकट हैं?"}'
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import uuid
+from collections import OrderedDict
+
+from agent_gateway.tools.logger import gateway_logger
+from dotenv import load_dotenv
+from fastmcp import FastMCP
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+
+from agent_factory import (
+    SNOWPARK_POOL_SIZE,
+    answer_prompt,
+    connection_parameters_from_env,
+    create_agent_pool,
+    tool_config_from_env,
+)
+from async_worker import (
+    AGENT_JOB_TIMEOUT_SECONDS,
+    AGENT_MAX_CONCURRENT_JOBS,
+    AGENT_MAX_QUEUED_JOBS,
+    AGENT_WORKER_LOOPS,
+    AsyncJobScheduler,
+    SchedulerBusyError,
+)
+from fixed_pipeline import AGENT_PIPELINE_MODE, format_analyst_output
+from logging_util import bind_log_request
+from resource_pool import PoolTimeoutError, ResourcePool
+from sarvam_ai_async_lang_tools import answer_translator, lang_detect, translate
+from sarvam_clients import aclose_async_client
+from sarvam_guard import SarvamUnavailableError, sarvam_guard
+
+MCP_SERVER_HOST = os.getenv("MCP_SERVER_HOST", "127.0.0.1")
+MCP_SERVER_PORT = int(os.getenv("MCP_SERVER_PORT", "8000"))
+# Conversations whose previous questions and answers are kept for follow-up questions
+MCP_MAX_CONVERSATIONS = int(os.getenv("MCP_MAX_CONVERSATIONS", "1000"))
+MCP_MAX_CONVERSATION_TURNS = int(os.getenv("MCP_MAX_CONVERSATION_TURNS", "20"))
+
+ENGLISH = "en-IN"
+
+
+class PipelineService:
+    """
+    The pipeline operations served to MCP and HTTP clients.
+
+    Every operation runs as a job on the scheduler, so the number of operations running and waiting
+    is bounded and each one is cancelled after the scheduler's job timeout. Operations that need
+    Snowflake check out pooled resources for as long as they run.
+    """
+
+    def __init__(
+        self,
+        agent_pool: ResourcePool,
+        scheduler: AsyncJobScheduler,
+        pipeline_mode: str = AGENT_PIPELINE_MODE,
+        max_conversations: int = MCP_MAX_CONVERSATIONS,
+    ):
+        self.agent_pool = agent_pool
+        self.scheduler = scheduler
+        self.pipeline_mode = pipeline_mode
+        self.max_conversations = max_conversations
+        self._conversations = OrderedDict()
+
+    async def _run(self, job):
+        request_id = uuid.uuid4().hex
+
+        async def traced():
+            bind_log_request(request_id)
+            return await job()
+
+        return await asyncio.wrap_future(self.scheduler.submit(traced))
+
+    def _conversation(self, conversation_id: str) -> tuple[asyncio.Lock, list]:
+        conversation = self._conversations.pop(conversation_id, None)
+        if conversation is None:
+            conversation = (asyncio.Lock(), [])
+            while len(self._conversations) >= self.max_conversations:
+                self._conversations.popitem(last=False)
+        self._conversations[conversation_id] = conversation
+        return conversation
+
+    async def detect_language(self, text: str) -> dict:
+        language_code = await self._run(lambda: lang_detect(text))
+        return {"language_code": language_code}
+
+    async def translate(
+        self,
+        text: str,
+        target_language: str = ENGLISH,
+        source_language: str | None = None,
+    ) -> dict:
+        async def job():
+            source = source_language or await lang_detect(text)
+            if source is None:
+                raise ValueError(
+                    "Unable to detect the language of the text, set source_language."
+                )
+            if source == target_language:
+                return text
+            english = text if source == ENGLISH else await translate(source, text)
+            if target_language == ENGLISH:
+                return english
+            return await answer_translator(english, target_language)
+
+        return {
+            "translation": await self._run(job),
+            "target_language": target_language,
+        }
+
+    async def ask_analyst(self, question: str) -> dict:
+        async def job():
+            async with self.agent_pool.aacquire() as resources:
+                return await resources.pipeline.analyst(question)
+
+        result = await self._run(job)
+        return {
+            "output": format_analyst_output(result["output"]),
+            "sources": result["sources"],
+        }
+
+    async def search_invoices(self, query: str) -> dict:
+        async def job():
+            async with self.agent_pool.aacquire() as resources:
+                return await resources.pipeline.search.asearch(query)
+
+        return await self._run(job)
+
+    async def ask(self, question: str, conversation_id: str | None = None) -> dict:
+        if conversation_id is None:
+            return await self._answer(question, [])
+        # Turns of a conversation are answered one at a time, each with the previous ones in memory
+        lock, memory = self._conversation(conversation_id)
+        async with lock:
+            # Only the latest turns are kept; the agent sees the last few of them
+            del memory[:-MCP_MAX_CONVERSATION_TURNS]
+            return await self._answer(question, memory)
+
+    async def _answer(self, question: str, memory: list) -> dict:
+        return await self._run(
+            lambda: answer_prompt(
+                self.agent_pool, question, memory, pipeline_mode=self.pipeline_mode
+            )
+        )
+
+    def readiness(self) -> tuple[bool, dict]:
+        pool = self.agent_pool.stats()
+        scheduler = self.scheduler.stats()
+        sarvam = sarvam_guard.stats()
+        ready = (
+            scheduler["queued"] < self.scheduler.max_queue_depth
+            and sarvam["breaker_state"] != "open"
+        )
+        return ready, {"pool": pool, "scheduler": scheduler, "sarvam": sarvam}
+
+
+def _error_status(error: Exception) -> int:
+    if isinstance(error, SchedulerBusyError):
+        return 429
+    if isinstance(error, (PoolTimeoutError, SarvamUnavailableError)):
+        return 503
+    if isinstance(error, TimeoutError):
+        return 504
+    if isinstance(error, (TypeError, ValueError)):
+        return 400
+    return 500
+
+
+def create_server(service: PipelineService) -> FastMCP:
+    """Registers the service's operations as MCP tools and HTTP endpoints."""
+    server = FastMCP(
+        "linguatics-agents",
+        instructions="Answers questions about customer support tickets and invoices in Indic languages.",
+    )
+
+    @server.tool
+    async def detect_language(text: str) -> dict:
+        """Detects the language of a text and returns its language code, e.g. hi-IN."""
+        return await service.detect_language(text)
+
+    @server.tool
+    async def translate_text(
+        text: str, target_language: str = ENGLISH, source_language: str | None = None
+    ) -> dict:
+        """Translates a text to the target language code, detecting its language when not given."""
+        return await service.translate(text, target_language, source_language)
+
+    @server.tool
+    async def ask_analyst(question: str) -> dict:
+        """Answers an English question about customer support tickets with Cortex Analyst."""
+        return await service.ask_analyst(question)
+
+    @server.tool
+    async def search_invoices(query: str) -> dict:
+        """Returns passages of customer invoices and plan documents relevant to an English query."""
+        return await service.search_invoices(query)
+
+    @server.tool
+    async def ask(question: str, conversation_id: str | None = None) -> dict:
+        """
+        Answers a question in any supported language, in the language of the question.
+
+        Questions with the same conversation_id are answered with the previous ones as context.
+        """
+        return await service.ask(question, conversation_id)
+
+    operations = {
+        "detect_language": service.detect_language,
+        "translate_text": service.translate,
+        "ask_analyst": service.ask_analyst,
+        "search_invoices": service.search_invoices,
+        "ask": service.ask,
+    }
+
+    @server.custom_route("/api/{operation}", methods=["POST"])
+    async def api(request: Request) -> JSONResponse:
+        operation = operations.get(request.path_params["operation"])
+        if operation is None:
+            return JSONResponse({"error": "Unknown operation"}, status_code=404)
+        try:
+            arguments = await request.json()
+            if not isinstance(arguments, dict):
+                raise ValueError("The request body must be a JSON object.")
+            return JSONResponse(await operation(**arguments))
+        except Exception as e:
+            status = _error_status(e)
+            if status == 500:
+                gateway_logger.log("ERROR", f"Unable to process request: {e}")
+            return JSONResponse({"error": str(e) or type(e).__name__}, status)
+
+    @server.custom_route("/health", methods=["GET"])
+    async def health(request: Request) -> JSONResponse:
+        return JSONResponse({"status": "ok"})
+
+    @server.custom_route("/ready", methods=["GET"])
+    async def ready(request: Request) -> JSONResponse:
+        is_ready, stats = service.readiness()
+        return JSONResponse(
+            {"status": "ready" if is_ready else "unavailable", **stats},
+            status_code=200 if is_ready else 503,
+        )
+
+    return server
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--host", default=MCP_SERVER_HOST)
+    parser.add_argument("--port", type=int, default=MCP_SERVER_PORT)
+    parser.add_argument(
+        "--transport",
+        choices=["streamable-http", "sse", "stdio"],
+        default="streamable-http",
+        help="MCP transport; the HTTP endpoints are only served over HTTP (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--pool-size",
+        type=int,
+        default=SNOWPARK_POOL_SIZE,
+        help="Snowpark sessions shared by all clients (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-concurrency",
+        type=int,
+        default=AGENT_MAX_CONCURRENT_JOBS,
+        help="Requests run at the same time (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--max-queued",
+        type=int,
+        default=AGENT_MAX_QUEUED_JOBS,
+        help="Requests waiting to run before new ones are rejected (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--timeout",
+        type=float,
+        default=AGENT_JOB_TIMEOUT_SECONDS,
+        help="Seconds allowed per request (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--mode",
+        choices=["agent", "fixed"],
+        default=AGENT_PIPELINE_MODE,
+        help="Use the agent or try the fixed pipeline first for ask (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    if not os.getenv("SARVAM_API_KEY"):
+        parser.error("SARVAM_API_KEY environment variable is not set.")
+
+    agent_pool = create_agent_pool(
+        connection_parameters=connection_parameters_from_env(),
+        tool_config=tool_config_from_env(),
+        max_size=args.pool_size,
+    )
+    scheduler = AsyncJobScheduler(
+        loops=AGENT_WORKER_LOOPS,
+        max_concurrency=args.max_concurrency,
+        max_queue_depth=args.max_queued,
+        job_timeout=args.timeout,
+        on_shutdown=aclose_async_client,
+    )
+    server = create_server(PipelineService(agent_pool, scheduler, args.mode))
+    try:
+        if args.transport == "stdio":
+            server.run(transport="stdio")
+        else:
+            server.run(transport=args.transport, host=args.host, port=args.port)
+    finally:
+        scheduler.shutdown()
+        agent_pool.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
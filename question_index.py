@@ -0,0 +1,296 @@
+import json
+import os
+import re
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import NamedTuple
+
+from agent_gateway.tools.logger import gateway_logger
+
+from lang_script_detect import detect_script_language
+from translation_cache import normalize_text
+
+# Files or directories of curated (translated question, English question) pairs, separated by the
+# OS path separator; empty disables the index. Directories are searched for *_questions.txt and
+# *.jsonl files.
+QUESTION_INDEX_PATH = os.getenv(
+    "QUESTION_INDEX_PATH", str(Path(__file__).resolve().parent / "samples")
+)
+# Minimum Jaccard similarity of the character n-grams for a question to be taken as a known one
+QUESTION_INDEX_MIN_SIMILARITY = float(
+    os.getenv("QUESTION_INDEX_MIN_SIMILARITY", "0.85")
+)
+QUESTION_INDEX_NGRAM_SIZE = int(os.getenv("QUESTION_INDEX_NGRAM_SIZE", "3"))
+# How often the files are checked for changes; 0 checks on every lookup
+QUESTION_INDEX_REFRESH_SECONDS = float(
+    os.getenv("QUESTION_INDEX_REFRESH_SECONDS", "30")
+)
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]+")
+_NUMBER_RE = re.compile(r"\d+")
+# Words shorter than this must match exactly; longer ones may differ by one edit, e.g. a nukta
+_MIN_VARIANT_WORD_LENGTH = 4
+
+
+class QuestionPair(NamedTuple):
+    lang_code: str | None
+    question: str
+    english: str
+    source: str
+
+
+class QuestionMatch(NamedTuple):
+    english: str
+    similarity: float
+    source: str
+
+
+def index_text(text: str) -> str:
+    """Normalizes a question for matching: NFC, lower case, punctuation removed and collapsed whitespace."""
+    return " ".join(_PUNCTUATION_RE.sub(" ", normalize_text(text).lower()).split())
+
+
+def _is_spelling_variant(word: str, other: str) -> bool:
+    """Whether two different words are at most one insertion, deletion or substitution apart."""
+    if min(len(word), len(other)) < _MIN_VARIANT_WORD_LENGTH:
+        return False
+    if abs(len(word) - len(other)) > 1:
+        return False
+    if len(word) > len(other):
+        word, other = other, word
+    start = 0
+    while start < len(word) and word[start] == other[start]:
+        start += 1
+    if len(word) == len(other):
+        return word[start + 1 :] == other[start + 1 :]
+    return word[start:] == other[start + 1 :]
+
+
+def same_words(text: str, other: str) -> bool:
+    """
+    Whether two index texts have the same words in the same order, allowing spelling variants.
+
+    An added, removed or replaced word, e.g. "बंद" (closed) in a question about tickets, makes
+    them different questions however similar their characters are.
+    """
+    words, other_words = text.split(), other.split()
+    return len(words) == len(other_words) and all(
+        w == o or _is_spelling_variant(w, o) for w, o in zip(words, other_words)
+    )
+
+
+def read_sample_pairs(path: Path) -> list[tuple[str, str]]:
+    """
+    Reads the ``(English question, translated question)`` pairs of a file in the ``samples/`` format,
+    where each ``Question: <English>`` line is followed by an ``Answer: <translation>`` line.
+    """
+    pairs = []
+    english = None
+    for line in path.read_text(encoding="utf-8").splitlines():
+        line = line.strip()
+        if line.startswith("Question:"):
+            english = line.removeprefix("Question:").strip()
+        elif line.startswith("Answer:") and english is not None:
+            pairs.append((english, line.removeprefix("Answer:").strip()))
+            english = None
+    return pairs
+
+
+def read_question_pairs(path: Path) -> list[QuestionPair]:
+    """
+    Reads curated question pairs from a ``samples/`` format text file or a JSONL file.
+
+    JSONL lines hold the translated ``question``, its ``english`` form and optionally its
+    ``lang_code``; without one the language is detected from the script.
+    """
+    if path.suffix == ".jsonl":
+        records = [
+            json.loads(line)
+            for line in path.read_text(encoding="utf-8").splitlines()
+            if line.strip()
+        ]
+    else:
+        records = [
+            {"question": question, "english": english}
+            for english, question in read_sample_pairs(path)
+        ]
+    return [
+        QuestionPair(
+            record.get("lang_code")
+            or detect_script_language(record["question"], min_confidence=0.0).lang_code,
+            record["question"],
+            record["english"],
+            path.name,
+        )
+        for record in records
+    ]
+
+
+def _index_files(paths: list[Path]) -> list[Path]:
+    files = []
+    for path in paths:
+        if path.is_dir():
+            files.extend(sorted(path.glob("*_questions.txt")))
+            files.extend(sorted(path.glob("*.jsonl")))
+        elif path.exists():
+            files.append(path)
+    return files
+
+
+class QuestionIndex:
+    """
+    In-memory similarity index over curated (translated question, English question) pairs.
+
+    Questions are compared by the Jaccard similarity of their character n-grams, looked up through
+    an inverted index from n-gram to question, so the cost grows with the length of the question and
+    not with the number of pairs. A question matches when it is in the same language, shares all of
+    its numbers with the indexed question, is at least ``min_similarity`` similar to it and has the
+    same words, apart from spelling variants (see ``same_words``).
+
+    The files are reloaded when their modification times change, checked at most once every
+    ``refresh_seconds``, so curated pairs can be added without a restart.
+    """
+
+    def __init__(
+        self,
+        paths: list[str],
+        min_similarity: float = QUESTION_INDEX_MIN_SIMILARITY,
+        ngram_size: int = QUESTION_INDEX_NGRAM_SIZE,
+        refresh_seconds: float = QUESTION_INDEX_REFRESH_SECONDS,
+    ):
+        self.paths = [Path(p) for p in paths]
+        self.min_similarity = min_similarity
+        self.ngram_size = ngram_size
+        self.refresh_seconds = refresh_seconds
+        self._lock = threading.Lock()
+        self._signature = None
+        self._checked_at = None
+        self._pairs = []
+        self._ngrams = []
+        self._exact = {}
+        self._postings = {}
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls) -> "QuestionIndex":
+        return cls([p for p in QUESTION_INDEX_PATH.split(os.pathsep) if p])
+
+    @property
+    def enabled(self) -> bool:
+        return bool(self.paths)
+
+    def _grams(self, text: str) -> frozenset:
+        padded = f" {text} "
+        n = min(self.ngram_size, len(padded))
+        return frozenset(padded[i : i + n] for i in range(len(padded) - n + 1))
+
+    def _files_signature(self) -> tuple:
+        return tuple(
+            (str(f), f.stat().st_mtime_ns, f.stat().st_size)
+            for f in _index_files(self.paths)
+        )
+
+    def load(self, pairs: list[QuestionPair]):
+        """Replaces the indexed pairs."""
+        ngrams = []
+        exact = {}
+        postings = defaultdict(list)
+        for i, pair in enumerate(pairs):
+            text = index_text(pair.question)
+            exact.setdefault((pair.lang_code, text), i)
+            grams = self._grams(text)
+            ngrams.append(grams)
+            for gram in grams:
+                postings[gram].append(i)
+        with self._lock:
+            self._pairs = pairs
+            self._ngrams = ngrams
+            self._exact = exact
+            self._postings = dict(postings)
+
+    def refresh(self, force: bool = False):
+        """Reloads the pairs if the files changed since they were loaded, or always with ``force``."""
+        with self._lock:
+            now = time.monotonic()
+            if (
+                not force
+                and self._checked_at is not None
+                and now - self._checked_at < self.refresh_seconds
+            ):
+                return
+            self._checked_at = now
+        try:
+            signature = self._files_signature()
+            if signature == self._signature and not force:
+                return
+            pairs = []
+            for path, _, _ in signature:
+                pairs.extend(read_question_pairs(Path(path)))
+        except (OSError, ValueError, KeyError) as e:
+            gateway_logger.log("WARNING", f"Question index not reloaded: {e}")
+            return
+        self.load(pairs)
+        self._signature = signature
+        gateway_logger.log(
+            "INFO",
+            f"Question index loaded {len(pairs)} pairs from {len(signature)} files",
+        )
+
+    def lookup(self, lang_code: str, question: str) -> QuestionMatch | None:
+        """Returns the English form of the most similar indexed question, or None if none is close enough."""
+        if not self.enabled:
+            return None
+        self.refresh()
+        text = index_text(question)
+        with self._lock:
+            pairs, ngrams, postings = self._pairs, self._ngrams, self._postings
+            exact = self._exact.get((lang_code, text))
+        if exact is not None:
+            match = QuestionMatch(pairs[exact].english, 1.0, pairs[exact].source)
+        else:
+            match = self._nearest(lang_code, text, pairs, ngrams, postings)
+
+        with self._lock:
+            if match is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return match
+
+    def _nearest(
+        self, lang_code, text, pairs, ngrams, postings
+    ) -> QuestionMatch | None:
+        grams = self._grams(text)
+        shared = defaultdict(int)
+        for gram in grams:
+            for i in postings.get(gram, ()):
+                shared[i] += 1
+
+        numbers = sorted(_NUMBER_RE.findall(text))
+        best, best_similarity = None, self.min_similarity
+        for i, count in shared.items():
+            similarity = count / (len(grams) + len(ngrams[i]) - count)
+            if similarity < best_similarity or pairs[i].lang_code != lang_code:
+                continue
+            # Questions that differ only in a number, e.g. a ticket count, are different questions
+            indexed = index_text(pairs[i].question)
+            if sorted(_NUMBER_RE.findall(indexed)) != numbers:
+                continue
+            if not same_words(text, indexed):
+                continue
+            best, best_similarity = i, similarity
+        if best is None:
+            return None
+        return QuestionMatch(
+            pairs[best].english, round(best_similarity, 4), pairs[best].source
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._pairs)}
+
+
+question_index = QuestionIndex.from_env()
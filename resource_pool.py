@@ -0,0 +1,192 @@
+import asyncio
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Any, Callable
+
+from agent_gateway.tools.logger import gateway_logger
+
+
+class PoolTimeoutError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+class ResourcePool:
+    """
+    Bounded, thread-safe pool of expensive resources such as warmed Snowpark sessions.
+
+    Resources are created lazily with ``create`` up to ``max_size`` (``min_size`` of them eagerly),
+    handed out one caller at a time by ``acquire`` and checked with ``is_healthy`` when they have been
+    idle for longer than ``health_check_interval``; unhealthy resources are closed and replaced.
+
+    Example:
+        >>> pool = ResourcePool(create=create_agent_resources, max_size=4)
+        >>> with pool.acquire() as resources:
+        ...     resources.agent.acall("How many tickets are there?")
+    """
+
+    def __init__(
+        self,
+        create: Callable[[], Any],
+        close: Callable[[Any], None] = lambda resource: None,
+        is_healthy: Callable[[Any], bool] = lambda resource: True,
+        max_size: int = 4,
+        min_size: int = 0,
+        acquire_timeout: float = 60.0,
+        health_check_interval: float = 300.0,
+    ):
+        if max_size < 1:
+            raise ValueError("max_size must be at least 1.")
+        self._create = create
+        self._close = close
+        self._is_healthy = is_healthy
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.health_check_interval = health_check_interval
+
+        self._condition = threading.Condition()
+        # (resource, time it was last known to be healthy)
+        self._idle = []
+        self._size = 0
+        self._in_use = 0
+        self._closed = False
+
+        self.acquired = 0
+        self.timeouts = 0
+        self.reconnects = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+        for _ in range(min(min_size, max_size)):
+            self._idle.append((self._create(), time.monotonic()))
+            self._size += 1
+
+    def _checkout(self, deadline: float) -> tuple[Any, float] | None:
+        """Returns an idle resource, None when a new one may be created, or waits for a release."""
+        with self._condition:
+            while True:
+                if self._closed:
+                    raise RuntimeError("Resource pool is closed.")
+                if self._idle:
+                    self._in_use += 1
+                    return self._idle.pop()
+                if self._size < self.max_size:
+                    self._size += 1
+                    self._in_use += 1
+                    return None
+                remaining = deadline - time.monotonic()
+                if remaining <= 0 or not self._condition.wait(remaining):
+                    if not self._idle and self._size >= self.max_size:
+                        self.timeouts += 1
+                        raise PoolTimeoutError(
+                            f"Timed out after {self.acquire_timeout}s waiting for a pooled resource."
+                        )
+
+    def _discard(self):
+        with self._condition:
+            self._size -= 1
+            self._in_use -= 1
+            self._condition.notify()
+
+    def _checked_resource(self, entry: tuple[Any, float] | None) -> Any:
+        if entry is None:
+            return self._create()
+
+        resource, last_checked = entry
+        if time.monotonic() - last_checked < self.health_check_interval:
+            return resource
+        try:
+            healthy = self._is_healthy(resource)
+        except Exception as e:
+            gateway_logger.log("WARNING", f"Pooled resource health check failed: {e}")
+            healthy = False
+        if healthy:
+            return resource
+
+        self.reconnects += 1
+        try:
+            self._close(resource)
+        except Exception:
+            pass
+        return self._create()
+
+    @contextmanager
+    def acquire(self):
+        """Checks out a resource for the duration of the ``with`` block."""
+        start = time.monotonic()
+        entry = self._checkout(start + self.acquire_timeout)
+        waited = time.monotonic() - start
+        try:
+            resource = self._checked_resource(entry)
+        except BaseException:
+            self._discard()
+            raise
+
+        with self._condition:
+            self.acquired += 1
+            self.wait_seconds_total += waited
+            self.wait_seconds_max = max(self.wait_seconds_max, waited)
+
+        healthy = True
+        try:
+            yield resource
+        finally:
+            with self._condition:
+                self._in_use -= 1
+                if self._closed:
+                    self._size -= 1
+                    healthy = False
+                else:
+                    self._idle.append((resource, time.monotonic()))
+                self._condition.notify()
+            if not healthy:
+                self._close(resource)
+
+    @asynccontextmanager
+    async def aacquire(self):
+        """Checks out a resource without blocking the event loop while waiting for it."""
+        pooled = self.acquire()
+        checkout = asyncio.get_running_loop().run_in_executor(None, pooled.__enter__)
+        try:
+            resource = await asyncio.shield(checkout)
+        except asyncio.CancelledError:
+            # The checkout thread may still succeed; hand the resource straight back
+            checkout.add_done_callback(
+                lambda f: f.cancelled()
+                or f.exception() is not None
+                or pooled.__exit__(None, None, None)
+            )
+            raise
+        try:
+            yield resource
+        finally:
+            pooled.__exit__(None, None, None)
+
+    def close(self):
+        """Closes idle resources; resources still in use are closed when they are released."""
+        with self._condition:
+            self._closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for resource, _ in idle:
+            self._close(resource)
+
+    def stats(self) -> dict:
+        with self._condition:
+            return {
+                "size": self._size,
+                "max_size": self.max_size,
+                "in_use": self._in_use,
+                "idle": len(self._idle),
+                "utilization": self._in_use / self.max_size,
+                "acquired": self.acquired,
+                "timeouts": self.timeouts,
+                "reconnects": self.reconnects,
+                "wait_seconds_avg": (
+                    self.wait_seconds_total / self.acquired if self.acquired else 0.0
+                ),
+                "wait_seconds_max": self.wait_seconds_max,
+            }
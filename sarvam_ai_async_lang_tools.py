@@ -0,0 +1,263 @@
+import asyncio
+
+from agent_gateway.tools.logger import gateway_logger
+
+from answer_structure import ANSWER_TRANSLATION_STRUCTURED, answer_structure
+from lang_script_detect import ScriptDetection, detect_script_language
+from question_index import question_index
+from sarvam_ai_lang_tools import (
+    SARVAM_AI_ANSWER_TRANSLATE_MODE,
+    SARVAM_AI_ANSWER_TRANSLATE_MODEL,
+    SARVAM_AI_MAX_INPUT_CHARS,
+    SARVAM_AI_TRANSLATE_MODEL,
+    SARVAM_TRANSLATE_MAX_CONCURRENCY,
+    join_translations,
+    split_for_translation,
+)
+from sarvam_clients import SARVAM_REQUEST_TIMEOUT_SECONDS, get_async_client
+from sarvam_guard import sarvam_guard
+from tracing import set_request_attributes, set_span_attributes
+from translation_cache import cache_key, normalize_text, translation_cache
+
+# Coroutine versions of the tools in sarvam_ai_lang_tools. They share the translation cache,
+# local language detection and chunking with the synchronous tools but call SarvamAI through
+# the pooled AsyncSarvamAI client of the running event loop, so translation I/O never blocks it.
+# Every request is bounded by SARVAM_REQUEST_TIMEOUT_SECONDS and is cancelled with its task, and
+# shares the rate limit, retries and circuit breaker of sarvam_guard with the synchronous tools.
+
+
+async def _request(coro):
+    return await asyncio.wait_for(coro, timeout=SARVAM_REQUEST_TIMEOUT_SECONDS)
+
+
+async def _translate_chunk(
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None,
+) -> str:
+    key = cache_key(source_lang, target_lang, model, mode, text)
+    translation = translation_cache.get(key)
+    if translation is not None:
+        return translation
+
+    kwargs = {"mode": mode} if mode else {}
+    response = await sarvam_guard.acall(
+        ("translate", key),
+        lambda: _request(
+            get_async_client().text.translate(
+                input=text,
+                source_language_code=source_lang,
+                target_language_code=target_lang,
+                model=model,
+                request_options={"max_retries": 0},
+                **kwargs,
+            )
+        ),
+    )
+
+    translation = response.translated_text
+    translation_cache.put(key, translation)
+    return translation
+
+
+async def translate_text(
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None = None,
+    max_concurrency: int = SARVAM_TRANSLATE_MAX_CONCURRENCY,
+) -> str:
+    """
+    Coroutine version of ``sarvam_ai_lang_tools.translate_text``.
+
+    Chunks are translated as concurrent tasks limited by a semaphore of ``max_concurrency``; if a
+    chunk still fails after its retries the remaining chunks are cancelled and the error is raised.
+    """
+    paragraphs = split_for_translation(text, model)
+    chunks = [chunk for paragraph in paragraphs for chunk in paragraph]
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _translate(chunk):
+        async with semaphore:
+            return await _translate_chunk(chunk, source_lang, target_lang, model, mode)
+
+    if len(chunks) > 1:
+        gateway_logger.log("DEBUG", f"Translating {len(chunks)} chunks concurrently\n")
+    tasks = [asyncio.create_task(_translate(chunk)) for chunk in chunks]
+    try:
+        # The first failed chunk's own error is raised, as by the synchronous translate_text
+        translations = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return join_translations(paragraphs, translations)
+
+
+async def translate_structured(
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None = None,
+    max_concurrency: int = SARVAM_TRANSLATE_MAX_CONCURRENCY,
+) -> str:
+    """
+    Coroutine version of ``sarvam_ai_lang_tools.translate_structured``.
+
+    Batches are translated as concurrent tasks like the chunks of ``translate_text``.
+    """
+    max_length = SARVAM_AI_MAX_INPUT_CHARS.get(model, 1000)
+    plan = answer_structure.plan(text, max_length)
+    set_span_attributes(answer_chars=len(text), translated_chars=plan.translated_chars)
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def _translate(chunk):
+        if len(chunk) <= max_length:
+            async with semaphore:
+                return await _translate_chunk(
+                    chunk, source_lang, target_lang, model, mode
+                )
+        return await translate_text(chunk, source_lang, target_lang, model, mode)
+
+    async def _translate_batch(batch):
+        for index in plan.accept(batch, await _translate(plan.batch_text(batch))):
+            if len(batch) == 1 or not plan.accept_line(
+                index, await _translate(plan.line_text(index))
+            ):
+                plan.accept_line(
+                    index,
+                    await _translate(plan.line_text(index, False)),
+                    protected=False,
+                )
+
+    tasks = [asyncio.create_task(_translate_batch(batch)) for batch in plan.batches]
+    try:
+        await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        raise
+
+    return plan.text()
+
+
+async def lang_detect(question: str) -> str | None:
+    """
+    Detect the language of the given question text, see ``sarvam_ai_lang_tools.lang_detect``.
+
+    Args:
+        question (str): The input text/question for which to detect the language.
+
+    Returns:
+        str | None: The detected language code (e.g., 'en-IN', 'hi-IN', 'ta-IN', etc.) or None if detection fails.
+    """
+    return await resolve_language(question, detect_script_language(question))
+
+
+async def resolve_language(question: str, detection: ScriptDetection) -> str | None:
+    """
+    Returns the language of a question from its local script detection, asking SarvamAI when the
+    script alone was not conclusive.
+
+    Kept apart from ``lang_detect``, whose signature is the agent tool's, so that callers that have
+    already detected the script do not detect it again.
+    """
+    if detection.lang_code is not None:
+        __lang_code = detection.lang_code
+        gateway_logger.log(
+            "DEBUG",
+            f"Detected Language Code (local, confidence {detection.confidence}): {__lang_code}\n",
+        )
+    else:
+        response = await sarvam_guard.acall(
+            ("identify_language", normalize_text(question)),
+            lambda: _request(
+                get_async_client().text.identify_language(
+                    input=question, request_options={"max_retries": 0}
+                )
+            ),
+        )
+        __lang_code = response.language_code
+        gateway_logger.log(
+            "DEBUG",
+            f"Detected Language Code (remote, {detection.fallback_reason}): {__lang_code}\n",
+        )
+
+    set_request_attributes(language=__lang_code)
+    return __lang_code
+
+
+async def translate(
+    lang_code: str,
+    question: str,
+) -> str:
+    """
+    Translate text from a detected language to English, see ``sarvam_ai_lang_tools.translate``.
+
+    Args:
+        lang_code (str): The source language code (e.g., 'hi-IN', 'ta-IN', 'te-IN').
+        question (str): The input text/question to be translated to English.
+
+    Returns:
+        str: The translated text in English.
+    """
+    gateway_logger.log(
+        "DEBUG",
+        f"""\n
+Identified Language Code: {lang_code} \n
+Question: {question}\n""",
+    )
+
+    match = question_index.lookup(lang_code, question)
+    if match is not None:
+        gateway_logger.log(
+            "DEBUG",
+            f"Translation (question index, similarity {match.similarity}):{match.english}\n",
+        )
+        set_span_attributes(question_index_similarity=match.similarity)
+        return match.english
+
+    translation = await translate_text(
+        question,
+        source_lang=lang_code,
+        target_lang="en-IN",
+        model=SARVAM_AI_TRANSLATE_MODEL,
+    )
+    gateway_logger.log("DEBUG", f"Translation:{translation}\n")
+    return translation
+
+
+async def answer_translator(
+    answer: str,
+    lang_code: str,
+) -> str:
+    """
+    Translate an English answer back to the original language, see ``sarvam_ai_lang_tools.answer_translator``.
+
+    Args:
+        answer (str): The English text/answer to be translated to the target language.
+        lang_code (str): The target language code to translate to (e.g., 'hi-IN', 'ta-IN', 'te-IN').
+
+    Returns:
+        str: The translated text in the target language.
+    """
+    gateway_logger.log("DEBUG", f"English answer: \n{answer}\n")
+    translate_answer = (
+        translate_structured if ANSWER_TRANSLATION_STRUCTURED else translate_text
+    )
+    translation = await translate_answer(
+        answer,
+        source_lang="en-IN",
+        target_lang=lang_code,
+        model=SARVAM_AI_ANSWER_TRANSLATE_MODEL,
+        mode=SARVAM_AI_ANSWER_TRANSLATE_MODE,
+    )
+    gateway_logger.log("DEBUG", f"Translation:{translation}\n")
+    return translation
@@ -1,42 +1,238 @@
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
 
 from agent_gateway.tools.logger import gateway_logger
-from sarvamai import SarvamAI
 
-SARVAM_AI_TRANSLATE_MODEL = "sarvam-translate:v1"
+from answer_structure import ANSWER_TRANSLATION_STRUCTURED, answer_structure
+from lang_script_detect import detect_script_language
+from question_index import question_index
+from sarvam_clients import get_client
+from sarvam_guard import sarvam_guard
+from tracing import set_request_attributes, set_span_attributes
+from translation_cache import cache_key, normalize_text, translation_cache
 
-sarvam_api_key = os.getenv("SARVAM_API_KEY")
+SARVAM_AI_TRANSLATE_MODEL = "sarvam-translate:v1"
+SARVAM_AI_ANSWER_TRANSLATE_MODEL = "mayura:v1"
+SARVAM_AI_ANSWER_TRANSLATE_MODE = "modern-colloquial"
 
-if not sarvam_api_key:
-    raise ValueError("SARVAM_API_KEY environment variable is not set.")
+# Maximum input characters per translate request for each model
+SARVAM_AI_MAX_INPUT_CHARS = {
+    SARVAM_AI_TRANSLATE_MODEL: 2000,
+    SARVAM_AI_ANSWER_TRANSLATE_MODEL: 1000,
+}
+SARVAM_TRANSLATE_MAX_CONCURRENCY = int(
+    os.getenv("SARVAM_TRANSLATE_MAX_CONCURRENCY", "4")
+)
 
-__client = SarvamAI(api_subscription_key=sarvam_api_key)
+# Sentence terminators for English and Indic scripts (danda), followed by whitespace
+_SENTENCE_END_RE = re.compile(r"[.!?\u0964\u0965]\s")
 
 
 def chunk_text(text, max_length=1000):
-    """Splits text into chunks of at most max_length characters while preserving word boundaries."""
+    """Splits text into chunks of at most max_length characters while preserving sentence and word boundaries."""
     chunks = []
 
     while len(text) > max_length:
-        split_index = text.rfind(" ", 0, max_length)  # Find the last space within limit
-        if split_index == -1:
+        # Prefer the last sentence end within limit, then the last space
+        sentence_ends = [
+            m.end() for m in _SENTENCE_END_RE.finditer(text, 0, max_length)
+        ]
+        if sentence_ends:
+            split_index = sentence_ends[-1]
+        else:
+            split_index = text.rfind(
+                " ", 0, max_length
+            )  # Find the last space within limit
+        if split_index <= 0:
             split_index = max_length  # No space found, force split at max_length
 
         chunks.append(text[:split_index].strip())  # Trim spaces before adding
         text = text[split_index:].lstrip()  # Remove leading spaces for the next chunk
 
-    if text:
+    if text.strip():
         chunks.append(text.strip())  # Add the last chunk
 
     return chunks
 
 
+def _translate_chunk(
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None,
+) -> str:
+    key = cache_key(source_lang, target_lang, model, mode, text)
+    translation = translation_cache.get(key)
+    if translation is not None:
+        return translation
+
+    kwargs = {"mode": mode} if mode else {}
+    # Retries are done by sarvam_guard, which also coalesces identical concurrent requests
+    response = sarvam_guard.call(
+        ("translate", key),
+        lambda: get_client().text.translate(
+            input=text,
+            source_language_code=source_lang,
+            target_language_code=target_lang,
+            model=model,
+            request_options={"max_retries": 0},
+            **kwargs,
+        ),
+    )
+
+    translation = response.translated_text
+    translation_cache.put(key, translation)
+    return translation
+
+
+def split_for_translation(text: str, model: str) -> list[list[str]]:
+    """
+    Splits text into paragraphs of chunks that fit the model's input limit.
+
+    Text within the limit is a single chunk. Longer text is packed a whole line at a time into
+    chunks of up to the limit, so that lines are translated with their neighbours; only a line
+    longer than the limit is split by ``chunk_text``. Blank lines between chunks are empty
+    paragraphs.
+    """
+    max_length = SARVAM_AI_MAX_INPUT_CHARS.get(model, 1000)
+    if len(text) <= max_length:
+        return [chunk_text(text, max_length)]
+
+    paragraphs = []
+    lines = []
+    size = 0
+
+    def _flush():
+        # Blank lines at the end of a chunk are kept out of it, as empty paragraphs
+        blank = 0
+        while lines and not lines[-1].strip():
+            lines.pop()
+            blank += 1
+        if lines:
+            paragraphs.append(["\n".join(lines)])
+        paragraphs.extend([] for _ in range(blank))
+        lines.clear()
+
+    for line in text.split("\n"):
+        if lines and size + 1 + len(line) > max_length:
+            _flush()
+        if len(line) > max_length:
+            paragraphs.append(chunk_text(line, max_length))
+        elif not lines and not line.strip():
+            paragraphs.append([])
+        else:
+            size = size + 1 + len(line) if lines else len(line)
+            lines.append(line)
+    _flush()
+    return paragraphs
+
+
+def join_translations(paragraphs: list[list[str]], translations: list[str]) -> str:
+    """Reassembles translated chunks, in order, into the paragraph layout of ``split_for_translation``."""
+    translated = iter(translations)
+    return "\n".join(
+        " ".join(next(translated) for _ in paragraph) for paragraph in paragraphs
+    )
+
+
+def translate_text(
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None = None,
+    max_concurrency: int = SARVAM_TRANSLATE_MAX_CONCURRENCY,
+) -> str:
+    """
+    Translate text of any length, splitting it into chunks that are translated concurrently.
+
+    Text within the model's input limit is sent as one request. Longer text is split into chunks
+    of whole lines up to the limit, and lines longer than the limit into chunks of sentences (see
+    ``split_for_translation``). Chunks are translated in parallel (at most ``max_concurrency`` at a
+    time), each one retried on its own on transient errors and cached individually, and then
+    reassembled in their original order and line layout.
+
+    Args:
+        text (str): The text to translate.
+        source_lang (str): The source language code (e.g., 'en-IN').
+        target_lang (str): The target language code (e.g., 'hi-IN').
+        model (str): The SarvamAI translation model.
+        mode (str | None): The translation mode, if the model supports it.
+        max_concurrency (int): Maximum number of chunks translated at the same time.
+
+    Returns:
+        str: The translated text.
+    """
+    paragraphs = split_for_translation(text, model)
+    chunks = [chunk for paragraph in paragraphs for chunk in paragraph]
+
+    def _translate(chunk):
+        return _translate_chunk(chunk, source_lang, target_lang, model, mode)
+
+    if len(chunks) <= 1 or max_concurrency <= 1:
+        translations = list(map(_translate, chunks))
+    else:
+        gateway_logger.log("DEBUG", f"Translating {len(chunks)} chunks concurrently\n")
+        with ThreadPoolExecutor(max_workers=min(max_concurrency, len(chunks))) as pool:
+            translations = list(pool.map(_translate, chunks))
+
+    return join_translations(paragraphs, translations)
+
+
+def translate_structured(
+    text: str,
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None = None,
+    max_concurrency: int = SARVAM_TRANSLATE_MAX_CONCURRENCY,
+) -> str:
+    """
+    Translate only the prose of a text, keeping its tables, SQL, IDs, numbers and glossary terms.
+
+    The text is split by ``answer_structure`` and its prose lines are translated in batches of up
+    to the model's input limit, concurrently like the chunks of ``translate_text``. A line whose
+    translation cannot be matched back to it is translated on its own and, failing that, without
+    its protected spans, as ``translate_text`` would.
+    """
+    max_length = SARVAM_AI_MAX_INPUT_CHARS.get(model, 1000)
+    plan = answer_structure.plan(text, max_length)
+    set_span_attributes(answer_chars=len(text), translated_chars=plan.translated_chars)
+
+    def _translate(chunk):
+        if len(chunk) <= max_length:
+            return _translate_chunk(chunk, source_lang, target_lang, model, mode)
+        return translate_text(chunk, source_lang, target_lang, model, mode, 1)
+
+    def _translate_batch(batch):
+        for index in plan.accept(batch, _translate(plan.batch_text(batch))):
+            if len(batch) == 1 or not plan.accept_line(
+                index, _translate(plan.line_text(index))
+            ):
+                plan.accept_line(
+                    index, _translate(plan.line_text(index, False)), protected=False
+                )
+
+    if len(plan.batches) <= 1 or max_concurrency <= 1:
+        list(map(_translate_batch, plan.batches))
+    else:
+        with ThreadPoolExecutor(
+            max_workers=min(max_concurrency, len(plan.batches))
+        ) as pool:
+            list(pool.map(_translate_batch, plan.batches))
+
+    return plan.text()
+
+
 def lang_detect(question: str) -> str | None:
     """
     Detect the language of the given question text using SarvamAI's language identification service.
 
-    This function uses the SarvamAI client to identify the language of the input text and logs
-    the detected language code for debugging purposes.
+    The language is first detected locally from the Unicode script of the text; the SarvamAI client
+    is only called when the local detection is ambiguous (mixed scripts, Devanagari languages other
+    than Hindi, romanized text). The detected language code is logged for debugging purposes.
 
     Args:
         question (str): The input text/question for which to detect the language.
@@ -60,10 +256,27 @@ def lang_detect(question: str) -> str | None:
         >>> print(lang_code)
         'hi-IN'
     """
-    response = __client.text.identify_language(input=question)
-    __lang_code = response.language_code
-    gateway_logger.log("DEBUG", f"Detected Language Code: {__lang_code}\n")
-
+    detection = detect_script_language(question)
+    if detection.lang_code is not None:
+        __lang_code = detection.lang_code
+        gateway_logger.log(
+            "DEBUG",
+            f"Detected Language Code (local, confidence {detection.confidence}): {__lang_code}\n",
+        )
+    else:
+        response = sarvam_guard.call(
+            ("identify_language", normalize_text(question)),
+            lambda: get_client().text.identify_language(
+                input=question, request_options={"max_retries": 0}
+            ),
+        )
+        __lang_code = response.language_code
+        gateway_logger.log(
+            "DEBUG",
+            f"Detected Language Code (remote, {detection.fallback_reason}): {__lang_code}\n",
+        )
+
+    set_request_attributes(language=__lang_code)
     return __lang_code
 
 
@@ -75,7 +288,8 @@ def translate(
     Translate text from a detected language to English using SarvamAI's translation service.
 
     This function takes a language code and question text, logs the translation process,
-    and returns the English translation using the SarvamAI translation API.
+    and returns the English translation using the SarvamAI translation API. Known questions, and
+    near duplicates of them, are answered from ``question_index`` without calling SarvamAI.
 
     Args:
         lang_code (str): The source language code (e.g., 'hi-IN', 'ta-IN', 'te-IN').
@@ -110,13 +324,21 @@ Identified Language Code: {lang_code} \n
 Question: {question}\n""",
     )
 
-    response = __client.text.translate(
-        input=question,
-        source_language_code=lang_code,
-        target_language_code="en-IN",
+    match = question_index.lookup(lang_code, question)
+    if match is not None:
+        gateway_logger.log(
+            "DEBUG",
+            f"Translation (question index, similarity {match.similarity}):{match.english}\n",
+        )
+        set_span_attributes(question_index_similarity=match.similarity)
+        return match.english
+
+    translation = translate_text(
+        question,
+        source_lang=lang_code,
+        target_lang="en-IN",
         model=SARVAM_AI_TRANSLATE_MODEL,
     )
-    translation = response.translated_text
     gateway_logger.log("DEBUG", f"Translation:{translation}\n")
     return translation
 
@@ -130,7 +352,8 @@ def answer_translator(
 
     This function takes an English answer and translates it back to the specified target language,
     logging the process for debugging purposes. It's typically used to translate responses back
-    to the user's original language after processing.
+    to the user's original language after processing. Unless ``ANSWER_TRANSLATION_STRUCTURED`` is
+    false, only the prose of the answer is translated, see ``translate_structured``.
 
     Args:
         lang_code (str): The target language code to translate to (e.g., 'hi-IN', 'ta-IN', 'te-IN').
@@ -159,13 +382,15 @@ def answer_translator(
         'మీ విచారణకు ధన్యవాదాలు।'
     """
     gateway_logger.log("DEBUG", f"English answer: \n{answer}\n")
-    response = __client.text.translate(
-        input=answer,
-        source_language_code="en-IN",
-        target_language_code=lang_code,
-        mode="modern-colloquial",
-        model="mayura:v1",
+    translate_answer = (
+        translate_structured if ANSWER_TRANSLATION_STRUCTURED else translate_text
+    )
+    translation = translate_answer(
+        answer,
+        source_lang="en-IN",
+        target_lang=lang_code,
+        model=SARVAM_AI_ANSWER_TRANSLATE_MODEL,
+        mode=SARVAM_AI_ANSWER_TRANSLATE_MODE,
     )
-    translation = response.translated_text
     gateway_logger.log("DEBUG", f"Translation:{translation}\n")
     return translation
@@ -0,0 +1,116 @@
+import asyncio
+import atexit
+import os
+import threading
+import weakref
+from typing import TYPE_CHECKING
+
+import httpx
+
+# The SarvamAI SDK is imported when the first client is created, not when the language tools are
+# imported, so processes that never call SarvamAI do not load it.
+if TYPE_CHECKING:
+    from sarvamai import AsyncSarvamAI, SarvamAI
+    from sarvamai.environment import SarvamAIEnvironment
+
+SARVAM_REQUEST_TIMEOUT_SECONDS = float(
+    os.getenv("SARVAM_REQUEST_TIMEOUT_SECONDS", "30")
+)
+SARVAM_HTTP_MAX_CONNECTIONS = int(os.getenv("SARVAM_HTTP_MAX_CONNECTIONS", "20"))
+SARVAM_HTTP_KEEPALIVE_SECONDS = float(os.getenv("SARVAM_HTTP_KEEPALIVE_SECONDS", "30"))
+# Optional base URL of the SarvamAI REST API, e.g. a proxy or a local stand-in
+SARVAM_BASE_URL = os.getenv("SARVAM_BASE_URL")
+
+_client = None
+_http_client = None
+_client_lock = threading.Lock()
+# httpx.AsyncClient connections are bound to the event loop they were opened on,
+# so there is one async client (and its httpx client) per running loop.
+_async_clients = weakref.WeakKeyDictionary()
+
+
+def _api_key() -> str:
+    sarvam_api_key = os.getenv("SARVAM_API_KEY")
+    if not sarvam_api_key:
+        raise ValueError("SARVAM_API_KEY environment variable is not set.")
+    return sarvam_api_key
+
+
+def _environment() -> "SarvamAIEnvironment":
+    from sarvamai.environment import SarvamAIEnvironment
+
+    if not SARVAM_BASE_URL:
+        return SarvamAIEnvironment.PRODUCTION
+    base = SARVAM_BASE_URL.rstrip("/")
+    return SarvamAIEnvironment(
+        base=base,
+        creative=f"{base}/dubbing",
+        production=SarvamAIEnvironment.PRODUCTION.production,
+    )
+
+
+def _limits() -> httpx.Limits:
+    return httpx.Limits(
+        max_connections=SARVAM_HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=SARVAM_HTTP_MAX_CONNECTIONS,
+        keepalive_expiry=SARVAM_HTTP_KEEPALIVE_SECONDS,
+    )
+
+
+def get_client() -> "SarvamAI":
+    """Returns the process-wide SarvamAI client, creating it with a pooled HTTP client on first use."""
+    global _client, _http_client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                from sarvamai import SarvamAI
+
+                api_key = _api_key()
+                _http_client = httpx.Client(
+                    limits=_limits(), timeout=SARVAM_REQUEST_TIMEOUT_SECONDS
+                )
+                _client = SarvamAI(
+                    environment=_environment(),
+                    api_subscription_key=api_key,
+                    httpx_client=_http_client,
+                )
+    return _client
+
+
+def get_async_client() -> "AsyncSarvamAI":
+    """Returns the AsyncSarvamAI client of the running event loop, creating it on first use."""
+    loop = asyncio.get_running_loop()
+    entry = _async_clients.get(loop)
+    if entry is None:
+        from sarvamai import AsyncSarvamAI
+
+        api_key = _api_key()
+        http_client = httpx.AsyncClient(
+            limits=_limits(), timeout=SARVAM_REQUEST_TIMEOUT_SECONDS
+        )
+        client = AsyncSarvamAI(
+            environment=_environment(),
+            api_subscription_key=api_key,
+            httpx_client=http_client,
+        )
+        entry = _async_clients[loop] = (client, http_client)
+    return entry[0]
+
+
+def close_client():
+    """Closes the process-wide SarvamAI client and its connection pool."""
+    global _client, _http_client
+    with _client_lock:
+        if _http_client is not None:
+            _http_client.close()
+        _client = _http_client = None
+
+
+async def aclose_async_client():
+    """Closes the AsyncSarvamAI client of the running event loop; call it before closing the loop."""
+    entry = _async_clients.pop(asyncio.get_running_loop(), None)
+    if entry is not None:
+        await entry[1].aclose()
+
+
+atexit.register(close_client)
@@ -0,0 +1,444 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import CancelledError, Future
+from typing import Any, Awaitable, Callable
+
+import httpx
+from agent_gateway.tools.logger import gateway_logger
+from sarvamai.core.api_error import ApiError
+
+from tracing import Metric, set_span_attributes, tracer
+
+# Requests per second allowed to SarvamAI by our API quota, shared by all sessions; 0 disables the limit
+SARVAM_RATE_LIMIT_PER_SECOND = float(os.getenv("SARVAM_RATE_LIMIT_PER_SECOND", "0"))
+SARVAM_RATE_LIMIT_BURST = int(os.getenv("SARVAM_RATE_LIMIT_BURST", "10"))
+# Requests that would wait longer than this for the rate limit fail instead
+SARVAM_RATE_LIMIT_MAX_WAIT_SECONDS = float(
+    os.getenv("SARVAM_RATE_LIMIT_MAX_WAIT_SECONDS", "10")
+)
+SARVAM_TRANSLATE_CHUNK_RETRIES = int(os.getenv("SARVAM_TRANSLATE_CHUNK_RETRIES", "2"))
+SARVAM_TRANSLATE_RETRY_BACKOFF_SECONDS = 0.5
+# Consecutive throttling, server or network errors after which calls fail fast
+SARVAM_BREAKER_FAILURE_THRESHOLD = int(
+    os.getenv("SARVAM_BREAKER_FAILURE_THRESHOLD", "5")
+)
+# How long calls fail fast before a single trial call is let through
+SARVAM_BREAKER_RESET_SECONDS = float(os.getenv("SARVAM_BREAKER_RESET_SECONDS", "30"))
+
+
+class SarvamUnavailableError(Exception):
+    def __init__(self, message: str):
+        self.message = message
+        super().__init__(self.message)
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """
+    Returns True for errors worth retrying: throttling, server and network errors, and timeouts.
+
+    Anything else, e.g. a missing API key, a rejected request or a response that cannot be parsed,
+    fails the same way when retried and is not counted against the circuit breaker.
+    """
+    if isinstance(error, ApiError):
+        return error.status_code is not None and (
+            error.status_code == 429 or error.status_code >= 500
+        )
+    return isinstance(
+        error,
+        (
+            httpx.TransportError,
+            httpx.TimeoutException,
+            TimeoutError,
+            asyncio.TimeoutError,
+        ),
+    )
+
+
+def retry_delay(attempt: int) -> float:
+    """Returns the jittered exponential backoff delay before the given retry attempt."""
+    return (
+        SARVAM_TRANSLATE_RETRY_BACKOFF_SECONDS * 2**attempt * random.uniform(0.5, 1.5)
+    )
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket refilled at ``rate`` tokens per second up to ``burst`` tokens.
+
+    ``reserve`` takes a token right away and returns how long the caller has to wait for it to be
+    refilled, so sync and async callers on any thread or event loop share one budget without
+    holding a lock while they wait.
+    """
+
+    def __init__(self, rate: float, burst: int, max_wait: float):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.max_wait = max_wait
+        self._tokens = float(self.burst)
+        self._updated_at = time.monotonic()
+        self._lock = threading.Lock()
+        self.throttled = 0
+        self.rejected = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.rate > 0
+
+    def reserve(self) -> float:
+        """Takes a token and returns the seconds to wait before using it."""
+        if not self.enabled:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.burst, self._tokens + (now - self._updated_at) * self.rate
+            )
+            self._updated_at = now
+            delay = max(0.0, (1 - self._tokens) / self.rate)
+            if delay > self.max_wait:
+                self.rejected += 1
+                raise SarvamUnavailableError(
+                    f"SarvamAI rate limit of {self.rate:g} requests per second exceeded, "
+                    f"the request would wait {delay:.1f}s."
+                )
+            self._tokens -= 1
+            if delay > 0:
+                self.throttled += 1
+            return delay
+
+    def available(self) -> float:
+        with self._lock:
+            elapsed = time.monotonic() - self._updated_at
+            return min(self.burst, self._tokens + elapsed * self.rate)
+
+
+class CircuitBreaker:
+    """
+    Fails calls fast after ``failure_threshold`` consecutive failures.
+
+    The breaker is "closed" while calls succeed and "open" after too many failures, rejecting every
+    call for ``reset_seconds``. It is then "half_open" and lets a single trial call through, whose
+    outcome closes it again or re-opens it.
+    """
+
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_running = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+        self.opened = 0
+
+    def before_call(self):
+        """Raises SarvamUnavailableError if the call must fail fast."""
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            if self.state == "open":
+                if time.monotonic() - self._opened_at < self.reset_seconds:
+                    self.rejected += 1
+                    raise SarvamUnavailableError(self._open_message())
+                self.state = "half_open"
+            if self.state == "half_open":
+                if self._trial_running:
+                    self.rejected += 1
+                    raise SarvamUnavailableError(self._open_message())
+                self._trial_running = True
+
+    def _open_message(self) -> str:
+        retry_in = max(0.0, self._opened_at + self.reset_seconds - time.monotonic())
+        return (
+            f"SarvamAI is unavailable after {self.failure_threshold} consecutive failures, "
+            f"calls are failing fast for another {retry_in:.0f}s."
+        )
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._trial_running = False
+            self.state = "closed"
+
+    def record_failure(self):
+        if self.failure_threshold <= 0:
+            return
+        with self._lock:
+            self._failures += 1
+            self._trial_running = False
+            if self.state == "half_open" or (
+                self.state == "closed" and self._failures >= self.failure_threshold
+            ):
+                if self.state == "closed":
+                    gateway_logger.log(
+                        "WARNING",
+                        f"SarvamAI circuit opened after {self._failures} consecutive failures",
+                    )
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self.opened += 1
+
+    def record_ignored(self):
+        """Ends a trial call whose error says nothing about SarvamAI's health, e.g. a bad request."""
+        with self._lock:
+            self._trial_running = False
+
+
+class SarvamGuard:
+    """
+    Shared protection for SarvamAI calls from sync tools, async tools and every event loop.
+
+    Calls with the same key that overlap share a single upstream request (single flight). Every
+    upstream attempt takes a token from the rate limiter and is checked by the circuit breaker;
+    throttling, server and network errors are retried with jittered exponential backoff unless the
+    breaker opens, in which case SarvamUnavailableError is raised without waiting.
+    """
+
+    def __init__(
+        self,
+        limiter: TokenBucket,
+        breaker: CircuitBreaker,
+        retries: int = SARVAM_TRANSLATE_CHUNK_RETRIES,
+    ):
+        self.limiter = limiter
+        self.breaker = breaker
+        self.retries = retries
+        self._flights = {}
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.coalesced = 0
+        self.retried = 0
+
+    @classmethod
+    def from_env(cls) -> "SarvamGuard":
+        return cls(
+            TokenBucket(
+                SARVAM_RATE_LIMIT_PER_SECOND,
+                SARVAM_RATE_LIMIT_BURST,
+                SARVAM_RATE_LIMIT_MAX_WAIT_SECONDS,
+            ),
+            CircuitBreaker(
+                SARVAM_BREAKER_FAILURE_THRESHOLD, SARVAM_BREAKER_RESET_SECONDS
+            ),
+        )
+
+    def _join(self, key) -> tuple[Future, bool]:
+        """Returns the flight for ``key`` and whether the caller leads it."""
+        with self._lock:
+            self.calls += 1
+            flight = self._flights.get(key)
+            if flight is not None:
+                self.coalesced += 1
+                return flight, False
+            flight = self._flights[key] = Future()
+            return flight, True
+
+    def _land(self, key, flight: Future):
+        with self._lock:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+
+    def _record(self, error: Exception | None, attempt: int) -> bool:
+        """Updates the breaker with a call's outcome and returns whether it should be retried."""
+        if error is None:
+            self.breaker.record_success()
+            return False
+        if not is_retryable_error(error):
+            self.breaker.record_ignored()
+            return False
+        self.breaker.record_failure()
+        if attempt == self.retries or self.breaker.state == "open":
+            return False
+        with self._lock:
+            self.retried += 1
+        gateway_logger.log(
+            "DEBUG", f"Retrying SarvamAI request (attempt {attempt + 1}): {error!r}\n"
+        )
+        return True
+
+    def call(self, key, request: Callable[[], Any]) -> Any:
+        """Runs ``request`` with coalescing, rate limiting, retries and the circuit breaker."""
+        while True:
+            flight, leader = self._join(key)
+            if not leader:
+                set_span_attributes(sarvam_coalesced=True)
+                try:
+                    return flight.result()
+                except CancelledError:
+                    # The leader was cancelled; its followers try again on their own
+                    continue
+            try:
+                result = self._call(request)
+            except Exception as e:
+                flight.set_exception(e)
+                raise
+            except BaseException:
+                flight.cancel()
+                raise
+            else:
+                flight.set_result(result)
+                return result
+            finally:
+                self._land(key, flight)
+
+    def _call(self, request: Callable[[], Any]) -> Any:
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                delay = self.limiter.reserve()
+                if delay > 0:
+                    time.sleep(delay)
+                result = request()
+            except Exception as e:
+                if not self._record(e, attempt):
+                    raise
+            except BaseException:
+                self.breaker.record_ignored()
+                raise
+            else:
+                self._record(None, attempt)
+                return result
+            time.sleep(retry_delay(attempt))
+
+    async def acall(self, key, request: Callable[[], Awaitable[Any]]) -> Any:
+        """Coroutine version of ``call``; ``request`` returns a new awaitable for every attempt."""
+        while True:
+            flight, leader = self._join(key)
+            if not leader:
+                set_span_attributes(sarvam_coalesced=True)
+                try:
+                    # Shielded so a cancelled follower does not cancel the shared flight
+                    return await asyncio.shield(asyncio.wrap_future(flight))
+                except asyncio.CancelledError:
+                    if flight.cancelled():
+                        continue
+                    raise
+            try:
+                result = await self._acall(request)
+            except Exception as e:
+                flight.set_exception(e)
+                raise
+            except BaseException:
+                flight.cancel()
+                raise
+            else:
+                flight.set_result(result)
+                return result
+            finally:
+                self._land(key, flight)
+
+    async def _acall(self, request: Callable[[], Awaitable[Any]]) -> Any:
+        for attempt in range(self.retries + 1):
+            self.breaker.before_call()
+            try:
+                delay = self.limiter.reserve()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                result = await request()
+            except Exception as e:
+                if not self._record(e, attempt):
+                    raise
+            except BaseException:
+                self.breaker.record_ignored()
+                raise
+            else:
+                self._record(None, attempt)
+                return result
+            await asyncio.sleep(retry_delay(attempt))
+
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "calls": self.calls,
+                "coalesced": self.coalesced,
+                "retried": self.retried,
+                "in_flight": len(self._flights),
+            }
+        return {
+            **stats,
+            "breaker_state": self.breaker.state,
+            "breaker_opened": self.breaker.opened,
+            "breaker_rejected": self.breaker.rejected,
+            "limiter_tokens": self.limiter.available()
+            if self.limiter.enabled
+            else None,
+            "limiter_throttled": self.limiter.throttled,
+            "limiter_rejected": self.limiter.rejected,
+        }
+
+    def metrics(self) -> list[Metric]:
+        """The guard's state as gauges and counters for ``tracer.register_metrics``."""
+        stats = self.stats()
+        metrics = [
+            Metric("sarvam_calls_total", "counter", "SarvamAI calls.", stats["calls"]),
+            Metric(
+                "sarvam_coalesced_total",
+                "counter",
+                "SarvamAI calls that shared an identical in-flight request.",
+                stats["coalesced"],
+            ),
+            Metric(
+                "sarvam_retries_total",
+                "counter",
+                "SarvamAI requests retried after a transient error.",
+                stats["retried"],
+            ),
+            Metric(
+                "sarvam_in_flight",
+                "gauge",
+                "Distinct SarvamAI requests in flight.",
+                stats["in_flight"],
+            ),
+            Metric(
+                "sarvam_breaker_opened_total",
+                "counter",
+                "Times the SarvamAI circuit breaker opened.",
+                stats["breaker_opened"],
+            ),
+            Metric(
+                "sarvam_breaker_rejected_total",
+                "counter",
+                "SarvamAI calls failed fast by the circuit breaker.",
+                stats["breaker_rejected"],
+            ),
+            Metric(
+                "sarvam_limiter_throttled_total",
+                "counter",
+                "SarvamAI requests delayed by the rate limiter.",
+                stats["limiter_throttled"],
+            ),
+            Metric(
+                "sarvam_limiter_rejected_total",
+                "counter",
+                "SarvamAI requests rejected by the rate limiter.",
+                stats["limiter_rejected"],
+            ),
+        ]
+        for state in ("closed", "open", "half_open"):
+            metrics.append(
+                Metric(
+                    "sarvam_breaker_state",
+                    "gauge",
+                    "1 for the current state of the SarvamAI circuit breaker.",
+                    int(stats["breaker_state"] == state),
+                    {"state": state},
+                )
+            )
+        if stats["limiter_tokens"] is not None:
+            metrics.append(
+                Metric(
+                    "sarvam_limiter_tokens",
+                    "gauge",
+                    "Requests that can be sent to SarvamAI without waiting.",
+                    round(stats["limiter_tokens"], 3),
+                )
+            )
+        return metrics
+
+
+sarvam_guard = SarvamGuard.from_env()
+tracer.register_metrics(sarvam_guard.metrics)
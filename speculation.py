@@ -0,0 +1,115 @@
+import asyncio
+import os
+import threading
+from typing import Any, Awaitable, Callable
+
+from agent_gateway.tools.logger import gateway_logger
+
+from tracing import Metric, tracer
+
+# Run pipeline stages ahead of the stages they depend on, see FixedPipeline
+PIPELINE_SPECULATIVE = os.getenv("PIPELINE_SPECULATIVE", "false").lower() == "true"
+
+
+class SpeculationStats:
+    """
+    Outcomes of speculative stages, per kind of speculation.
+
+    A speculation wins when its result is used and loses when it is thrown away. The latency saved
+    by a win is the time that would have been spent waiting had the stages run one after another.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._kinds = {}
+
+    def record(self, kind: str, won: bool, saved_seconds: float = 0.0):
+        with self._lock:
+            stats = self._kinds.setdefault(
+                kind, {"won": 0, "lost": 0, "saved_seconds": 0.0}
+            )
+            stats["won" if won else "lost"] += 1
+            stats["saved_seconds"] += saved_seconds
+            attempts = stats["won"] + stats["lost"]
+            message = (
+                f"Speculative {kind} {'won' if won else 'lost'}, saved {saved_seconds:.3f}s "
+                f"(win rate {stats['won'] / attempts:.2f} over {attempts}, "
+                f"saved {stats['saved_seconds']:.3f}s in total)"
+            )
+        gateway_logger.log("INFO", message)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                kind: {
+                    **stats,
+                    "win_rate": stats["won"] / (stats["won"] + stats["lost"]),
+                }
+                for kind, stats in self._kinds.items()
+            }
+
+    def metrics(self) -> list[Metric]:
+        """The outcomes as counters for ``tracer.register_metrics``."""
+        metrics = []
+        for kind, stats in self.stats().items():
+            for outcome in ("won", "lost"):
+                metrics.append(
+                    Metric(
+                        "speculation_total",
+                        "counter",
+                        "Speculative stages by outcome.",
+                        stats[outcome],
+                        {"kind": kind, "outcome": outcome},
+                    )
+                )
+            metrics.append(
+                Metric(
+                    "speculation_saved_seconds_total",
+                    "counter",
+                    "Latency saved by speculative stages.",
+                    stats["saved_seconds"],
+                    {"kind": kind},
+                )
+            )
+        return metrics
+
+
+async def preferred_usable(
+    candidates: dict[str, Awaitable],
+    is_usable: Callable[[str, Any], bool],
+) -> tuple[str | None, Any, list[str]]:
+    """
+    Runs the candidates concurrently and returns the usable result of the most preferred one.
+
+    Candidates are given in order of preference. A usable result is returned as soon as every more
+    preferred candidate has failed or returned a result that is not usable, and the less preferred
+    candidates still running are cancelled.
+
+    Returns:
+        tuple: The name and result of the winning candidate, or None and None when no candidate
+        produced a usable result, and the names of the candidates that were cancelled.
+    """
+    tasks = {name: asyncio.ensure_future(c) for name, c in candidates.items()}
+    try:
+        for name, task in tasks.items():
+            try:
+                result = await task
+            except Exception as e:
+                gateway_logger.log("DEBUG", f"Speculative {name} failed: {e}")
+                continue
+            if is_usable(name, result):
+                return (
+                    name,
+                    result,
+                    [n for n, t in tasks.items() if not t.done()],
+                )
+        return None, None, []
+    finally:
+        pending = [t for t in tasks.values() if not t.done()]
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+
+
+speculation_stats = SpeculationStats()
+tracer.register_metrics(speculation_stats.metrics)
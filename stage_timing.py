@@ -0,0 +1,96 @@
+import contextvars
+import time
+from contextlib import contextmanager
+
+from agent_gateway.tools import CortexSearchTool
+
+from tracing import tracer
+
+# Seconds spent per stage by the request the current task is working on, None when not collected
+_stage_timings = contextvars.ContextVar("stage_timings", default=None)
+
+
+@contextmanager
+def collect_stage_timings():
+    """
+    Collects the time spent in each stage by the current task and the tasks it starts.
+
+    Example:
+        >>> with collect_stage_timings() as timings:
+        ...     await agent.acall("How many tickets are there?")
+        >>> timings
+        {'lang_detect': 0.41, 'translate': 0.62, 'cortex_analyst': 3.1, ...}
+    """
+    timings = {}
+    token = _stage_timings.set(timings)
+    try:
+        yield timings
+    finally:
+        _stage_timings.reset(token)
+
+
+@contextmanager
+def record_stage(name: str, **attributes):
+    """
+    Adds the time spent in the ``with`` block to stage ``name``, if timings are being collected, and
+    records the block as a span with ``attributes`` when tracing is enabled.
+
+    Yields the span, or None when tracing is disabled, so payload sizes and other attributes known
+    only inside the block can be added with ``span.set(...)``.
+    """
+    timings = _stage_timings.get()
+    if timings is None and not tracer.enabled:
+        yield None
+        return
+    start = time.perf_counter()
+    try:
+        with tracer.span(name, **attributes) as span:
+            yield span
+    finally:
+        if timings is not None:
+            timings[name] = timings.get(name, 0.0) + time.perf_counter() - start
+
+
+class TimedCortexSearchTool(CortexSearchTool):
+    """
+    CortexSearchTool that records its searches as the ``cortex_search`` stage.
+
+    The search column used for citations is looked up with ``SHOW CORTEX SEARCH SERVICES`` on the
+    first search and reused afterwards, instead of on every search.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._search_column = None
+
+    def _get_search_column(self, search_service_name: str) -> list[str]:
+        if self._search_column is None:
+            self._search_column = super()._get_search_column(search_service_name)
+        return self._search_column
+
+    async def asearch(self, query: str):
+        with record_stage("cortex_search", input_chars=len(query)) as span:
+            result = await super().asearch(query)
+            if span is not None:
+                span.set(results=len(result["output"]))
+            return result
+
+
+class StageTimedProxy:
+    """Proxy for ``target`` that records the calls of its coroutine method ``method`` as stage ``stage``."""
+
+    def __init__(self, target, method: str, stage: str):
+        self._target = target
+        self._method = method
+        self._stage = stage
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if name != self._method:
+            return attr
+
+        async def timed(*args, **kwargs):
+            with record_stage(self._stage):
+                return await attr(*args, **kwargs)
+
+        return timed
@@ -0,0 +1,488 @@
+import ast
+import contextvars
+import datetime
+import math
+import os
+import re
+import threading
+from collections import Counter
+from contextlib import contextmanager
+
+from agent_gateway.tools.logger import gateway_logger
+
+from tracing import Metric, set_span_attributes, tracer
+
+# Shrink Cortex tool outputs before the agent's fusion LLM reads them, see ToolOutputBudget
+TOOL_BUDGET_ENABLED = os.getenv("TOOL_BUDGET_ENABLED", "true").lower() == "true"
+# Tokens of tool output given to the fusion LLM per prompt, shared by all its tool calls
+TOOL_BUDGET_PROMPT_TOKENS = int(os.getenv("TOOL_BUDGET_PROMPT_TOKENS", "3000"))
+# Cortex Search passages kept per search after re-ranking, and tokens kept per passage
+TOOL_BUDGET_MAX_PASSAGES = int(os.getenv("TOOL_BUDGET_MAX_PASSAGES", "5"))
+TOOL_BUDGET_PASSAGE_TOKENS = int(os.getenv("TOOL_BUDGET_PASSAGE_TOKENS", "300"))
+# Minimum similarity (Jaccard of word 3-grams) of two passages of a document to keep only the first
+TOOL_BUDGET_DUPLICATE_SIMILARITY = float(
+    os.getenv("TOOL_BUDGET_DUPLICATE_SIMILARITY", "0.9")
+)
+# Cortex Analyst result sets with more rows are summarized as aggregates and a sample of rows
+TOOL_BUDGET_MAX_ROWS = int(os.getenv("TOOL_BUDGET_MAX_ROWS", "20"))
+TOOL_BUDGET_SAMPLE_ROWS = int(os.getenv("TOOL_BUDGET_SAMPLE_ROWS", "5"))
+# Tokens are estimated from the length of the text, about 4 characters per token for English
+TOOL_BUDGET_CHARS_PER_TOKEN = float(os.getenv("TOOL_BUDGET_CHARS_PER_TOKEN", "4"))
+
+STAGES = ("dedupe", "rerank", "trim", "summarize", "budget")
+
+# Shortest text two overlapping chunks of a document must share to be taken as an overlap
+MIN_OVERLAP_CHARS = 32
+
+_WORD_RE = re.compile(r"\w+")
+# Sentence ends and line breaks, where passages are trimmed
+_UNIT_RE = re.compile(r"(?<=[.!?])\s+|\s*\n\s*")
+_STOPWORDS = frozenset(
+    "a an and are as at be by can could do does for from has have how i in is it me my of on or "
+    "show tell than that the their there these this to was we were what when where which who "
+    "why will with you your".split()
+)
+
+# Budget of the request the current task is working on, None outside agent runs
+_current_budget = contextvars.ContextVar("tool_output_budget", default=None)
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / TOOL_BUDGET_CHARS_PER_TOKEN)
+
+
+def _max_chars(tokens: int) -> int:
+    return max(0, int(tokens * TOOL_BUDGET_CHARS_PER_TOKEN))
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    """Cuts text to at most ``max_chars`` characters at a word boundary, marking the cut."""
+    if len(text) <= max_chars:
+        return text
+    if max_chars < 2:
+        return ""
+    cut = text.rfind(" ", 0, max_chars - 1)
+    return text[: cut if cut > 0 else max_chars - 1].rstrip() + "…"
+
+
+def query_terms(text: str) -> set[str]:
+    """The lower case words of a query without stop words, which passages are ranked by."""
+    return {
+        w for w in _WORD_RE.findall(text.lower()) if len(w) > 1 and w not in _STOPWORDS
+    }
+
+
+def _shingles(text: str) -> set[tuple]:
+    words = _WORD_RE.findall(text.lower())
+    return {tuple(words[i : i + 3]) for i in range(max(1, len(words) - 2))}
+
+
+def _overlap(head: str, tail: str) -> int:
+    """Length of the longest end of ``head`` that ``tail`` starts with, 0 if shorter than MIN_OVERLAP_CHARS."""
+    probe = tail[:MIN_OVERLAP_CHARS]
+    if len(probe) < MIN_OVERLAP_CHARS:
+        return 0
+    start = head.find(probe)
+    while start != -1:
+        if tail.startswith(head[start:]):
+            return len(head) - start
+        start = head.find(probe, start + 1)
+    return 0
+
+
+def dedupe_passages(
+    passages: list[tuple[str, object]],
+    similarity: float = TOOL_BUDGET_DUPLICATE_SIMILARITY,
+) -> list[tuple[int, str]]:
+    """
+    Drops repeated passages and the text that passages of the same document share.
+
+    Passages are ``(text, source)`` pairs in search order. A passage is dropped when its text,
+    whitespace aside, was already seen, or when it is at least ``similarity`` similar to an earlier
+    passage of the same source. The overlap of consecutive chunks of a document, at the start or
+    end of a passage, is cut from the later one. Only passages of the same source are compared
+    for similarity, as documents made from one template, e.g. invoices, differ in few words.
+
+    Returns:
+        list: The index and the remaining text of the kept passages, in search order.
+    """
+    kept = []
+    seen = set()
+    for index, (text, source) in enumerate(passages):
+        text = text.strip()
+        normalized = " ".join(text.split())
+        if normalized in seen:
+            continue
+        seen.add(normalized)
+        shingles = _shingles(normalized)
+        same_source = [k for k in kept if k[2] == source]
+        if any(
+            len(shingles & k[3]) >= similarity * len(shingles | k[3])
+            for k in same_source
+        ):
+            continue
+        for _, other, _, _ in same_source:
+            text = text[_overlap(other, text) :]
+            text = text[: len(text) - _overlap(text, other)].strip()
+        if text:
+            kept.append((index, text, source, shingles))
+    return [(index, text) for index, text, _, _ in kept]
+
+
+def rank_passages(query: str, texts: list[str]) -> list[int]:
+    """
+    Orders passages by the query terms they contain, each weighted by its inverse document
+    frequency among the passages, keeping the search order of passages with the same score.
+    """
+    terms = query_terms(query)
+    matched = [terms.intersection(_WORD_RE.findall(text.lower())) for text in texts]
+    frequencies = Counter(term for words in matched for term in words)
+    weights = {t: math.log(1 + len(texts) / f) for t, f in frequencies.items()}
+    scores = [sum(weights[t] for t in words) for words in matched]
+    return sorted(range(len(texts)), key=lambda i: -scores[i])
+
+
+def trim_passage(query: str, text: str, max_tokens: int) -> str:
+    """
+    Keeps the sentences and lines of a passage with the most query terms, in their order, up to
+    ``max_tokens``. Gaps are marked with an ellipsis.
+    """
+    max_chars = _max_chars(max_tokens)
+    if len(text) <= max_chars:
+        return text
+    units = [u for u in _UNIT_RE.split(text) if u.strip()]
+    terms = query_terms(query)
+    scores = [len(terms.intersection(_WORD_RE.findall(u.lower()))) for u in units]
+    chosen = set()
+    size = 0
+    for i in sorted(range(len(units)), key=lambda i: -scores[i]):
+        if size + len(units[i]) + 2 <= max_chars:
+            chosen.add(i)
+            size += len(units[i]) + 2
+    if not chosen:
+        return _truncate(
+            units[max(range(len(units)), key=lambda i: scores[i])], max_chars
+        )
+    pieces = []
+    for i in sorted(chosen):
+        if pieces and i - 1 not in chosen:
+            pieces.append("…")
+        pieces.append(units[i])
+    return " ".join(pieces)
+
+
+def _literal(node: ast.AST):
+    if isinstance(node, ast.Dict):
+        return {_literal(k): _literal(v) for k, v in zip(node.keys, node.values)}
+    if isinstance(node, (ast.List, ast.Tuple)):
+        return [_literal(e) for e in node.elts]
+    if isinstance(node, ast.Call):
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", "")
+        args = [_literal(a) for a in node.args]
+        if name == "Decimal":
+            return float(args[0])
+        if name in ("date", "datetime", "time"):
+            return getattr(datetime, name)(*args).isoformat()
+        raise ValueError(f"Unexpected value {name} in result set")
+    return ast.literal_eval(node)
+
+
+def parse_result_set(output) -> dict | None:
+    """
+    The columns of a Cortex Analyst result set, ``str(table.to_pydict())``, or None for text answers.
+
+    Decimals are read as floats and dates and times as ISO strings, which ``ast.literal_eval``
+    alone cannot read.
+    """
+    if not isinstance(output, str):
+        return None
+    try:
+        columns = _literal(ast.parse(output, mode="eval").body)
+    except (ValueError, TypeError, SyntaxError):
+        return None
+    if not isinstance(columns, dict) or not all(
+        isinstance(v, list) for v in columns.values()
+    ):
+        return None
+    return columns
+
+
+def _number(value) -> str:
+    return str(round(value, 4)) if isinstance(value, float) else str(value)
+
+
+def summarize_result_set(columns: dict, sample_rows: int) -> str:
+    """Describes a result set by the aggregates of its columns and its first ``sample_rows`` rows."""
+    rows = max((len(v) for v in columns.values()), default=0)
+    lines = [
+        f"Result set of {rows} rows, summarized by column, followed by its first {sample_rows} rows:"
+        if sample_rows
+        else f"Result set of {rows} rows, summarized by column:"
+    ]
+    for name, values in columns.items():
+        present = [v for v in values if v is not None]
+        if present and all(
+            isinstance(v, (int, float)) and not isinstance(v, bool) for v in present
+        ):
+            total = sum(present)
+            description = (
+                f"min {_number(min(present))}, max {_number(max(present))}, "
+                f"sum {_number(total)}, mean {_number(total / len(present))}"
+            )
+        else:
+            counts = Counter(map(str, present))
+            top = ", ".join(f"{v} ({c})" for v, c in counts.most_common(5))
+            description = (
+                f"{len(counts)} distinct value{'s' if len(counts) != 1 else ''}, "
+                f"most frequent: {top}"
+            )
+        if len(present) < len(values):
+            description += f", {len(values) - len(present)} empty"
+        lines.append(f"- {name}: {description}")
+    if sample_rows:
+        lines.append(
+            str({name: values[:sample_rows] for name, values in columns.items()})
+        )
+    return "\n".join(lines)
+
+
+class ToolBudgetStats:
+    """Estimated tokens of tool output before and after budgeting, and the tokens saved per stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._saved = Counter()
+        self._tools = {}
+
+    def record(self, tool: str, tokens_in: int, tokens_out: int, saved: dict):
+        with self._lock:
+            self._saved.update(saved)
+            tokens = self._tools.setdefault(tool, {"outputs": 0, "in": 0, "out": 0})
+            tokens["outputs"] += 1
+            tokens["in"] += tokens_in
+            tokens["out"] += tokens_out
+        set_span_attributes(tokens_in=tokens_in, tokens_out=tokens_out)
+        gateway_logger.log(
+            "DEBUG",
+            f"Budgeted {tool} output from {tokens_in} to {tokens_out} tokens, saved {dict(saved)}",
+        )
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "tokens_saved": {stage: self._saved[stage] for stage in STAGES},
+                "tools": {tool: dict(tokens) for tool, tokens in self._tools.items()},
+            }
+
+    def metrics(self) -> list[Metric]:
+        """The token counts as counters for ``tracer.register_metrics``."""
+        stats = self.stats()
+        metrics = [
+            Metric(
+                "tool_budget_tokens_saved_total",
+                "counter",
+                "Estimated tokens of tool output removed before the fusion LLM, by stage.",
+                saved,
+                {"stage": stage},
+            )
+            for stage, saved in stats["tokens_saved"].items()
+        ]
+        for tool, tokens in stats["tools"].items():
+            for direction in ("in", "out"):
+                metrics.append(
+                    Metric(
+                        f"tool_budget_tokens_{direction}_total",
+                        "counter",
+                        f"Estimated tokens of tool output {'before' if direction == 'in' else 'after'} budgeting.",
+                        tokens[direction],
+                        {"tool": tool},
+                    )
+                )
+        return metrics
+
+
+class ToolOutputBudget:
+    """
+    The tokens of Cortex tool output the agent's fusion LLM is given for one prompt.
+
+    Cortex Search passages are deduplicated (``dedupe_passages``), re-ranked by query-term overlap
+    and cut to the best ``max_passages`` (``rank_passages``), and trimmed to ``passage_tokens``
+    each (``trim_passage``). Cortex Analyst result sets of more than ``max_rows`` rows are replaced
+    by the aggregates of their columns and a sample of ``sample_rows`` rows. What is left is then
+    fitted to the tokens remaining in the budget, which all the tool calls of the prompt share:
+    the lowest ranked passages are dropped first, and summaries give up sample rows. Result sets
+    are never cut, so that the fusion LLM is not given partial numbers. The tokens saved by each
+    stage are recorded in ``stats``.
+    """
+
+    def __init__(
+        self,
+        tokens: int = TOOL_BUDGET_PROMPT_TOKENS,
+        max_passages: int = TOOL_BUDGET_MAX_PASSAGES,
+        passage_tokens: int = TOOL_BUDGET_PASSAGE_TOKENS,
+        duplicate_similarity: float = TOOL_BUDGET_DUPLICATE_SIMILARITY,
+        max_rows: int = TOOL_BUDGET_MAX_ROWS,
+        sample_rows: int = TOOL_BUDGET_SAMPLE_ROWS,
+        stats: ToolBudgetStats | None = None,
+    ):
+        self.remaining = tokens
+        self.max_passages = max_passages
+        self.passage_tokens = passage_tokens
+        self.duplicate_similarity = duplicate_similarity
+        self.max_rows = max_rows
+        self.sample_rows = sample_rows
+        self.stats = stats or tool_budget_stats
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _tokens(rows: list[dict]) -> int:
+        return sum(estimate_tokens(str(row)) for row in rows)
+
+    def _fit_passages(self, rows: list[dict], text_column: str) -> list[dict]:
+        with self._lock:
+            fitted = []
+            used = 0
+            for row in rows:
+                cost = estimate_tokens(str(row))
+                if used + cost > self.remaining:
+                    # The best passage is cut rather than dropped when it does not fit whole
+                    room = self.remaining - cost + estimate_tokens(row[text_column])
+                    if not fitted and room > 0:
+                        text = _truncate(row[text_column], _max_chars(room))
+                        fitted.append({**row, text_column: text})
+                        used += estimate_tokens(str(fitted[-1]))
+                    break
+                fitted.append(row)
+                used += cost
+            self.remaining = max(0, self.remaining - used)
+            return fitted
+
+    def search_result(self, query: str, result: dict, text_column: str) -> dict:
+        """Budgets the passages of a Cortex Search result, whose text is in ``text_column``."""
+        output = result.get("output")
+        if not isinstance(output, list) or not output:
+            return result
+
+        def _source(row):
+            return tuple(
+                sorted((k, str(v)) for k, v in row.items() if k != text_column)
+            )
+
+        saved = {}
+        tokens_in = self._tokens(output)
+        passages = [(str(row.get(text_column, "")), _source(row)) for row in output]
+        rows = [
+            {**output[i], text_column: text}
+            for i, text in dedupe_passages(passages, self.duplicate_similarity)
+        ]
+        saved["dedupe"] = tokens_in - self._tokens(rows)
+
+        ranked = [
+            rows[i] for i in rank_passages(query, [r[text_column] for r in rows])
+        ][: self.max_passages]
+        saved["rerank"] = self._tokens(rows) - self._tokens(ranked)
+
+        trimmed = [
+            {
+                **row,
+                text_column: trim_passage(query, row[text_column], self.passage_tokens),
+            }
+            for row in ranked
+        ]
+        saved["trim"] = self._tokens(ranked) - self._tokens(trimmed)
+
+        fitted = self._fit_passages(trimmed, text_column)
+        tokens_out = self._tokens(fitted)
+        saved["budget"] = self._tokens(trimmed) - tokens_out
+        self.stats.record("cortex_search", tokens_in, tokens_out, saved)
+
+        # Cite only the documents of the passages that are kept
+        sources = result.get("sources")
+        if isinstance(sources, dict) and any(len(row) > 1 for row in fitted):
+            sources = {
+                **sources,
+                "metadata": [dict(s) for s in dict.fromkeys(map(_source, fitted))],
+            }
+        return {**result, "output": fitted, "sources": sources}
+
+    def analyst_result(self, result: dict) -> dict:
+        """Budgets a Cortex Analyst result set; text answers, e.g. requests to rephrase, are kept."""
+        output = result.get("output")
+        if not isinstance(output, str):
+            return result
+
+        saved = {}
+        tokens_in = estimate_tokens(output)
+        text = output
+        columns = parse_result_set(output)
+        with self._lock:
+            summarized = None
+            if columns and max(map(len, columns.values()), default=0) > self.max_rows:
+                summary = summarize_result_set(columns, self.sample_rows)
+                if len(summary) < len(output):
+                    text = summarized = summary
+                    saved["summarize"] = tokens_in - estimate_tokens(text)
+            # Result sets are never cut: summaries give up sample rows to fit the remaining tokens
+            # and the aggregates are always kept, small result sets are kept whole
+            sample_rows = self.sample_rows
+            while (
+                summarized
+                and sample_rows > 0
+                and estimate_tokens(text) > self.remaining
+            ):
+                sample_rows -= 1
+                text = summarize_result_set(columns, sample_rows)
+            self.remaining = max(0, self.remaining - estimate_tokens(text))
+        saved["budget"] = estimate_tokens(summarized or text) - estimate_tokens(text)
+        self.stats.record("cortex_analyst", tokens_in, estimate_tokens(text), saved)
+        return {**result, "output": text}
+
+
+@contextmanager
+def tool_output_budget(tokens: int = TOOL_BUDGET_PROMPT_TOKENS):
+    """
+    Budgets the Cortex tool outputs of the current task and the tasks it starts, i.e. of one agent
+    run, with a shared ``ToolOutputBudget``. Yields None and budgets nothing when disabled.
+    """
+    if not TOOL_BUDGET_ENABLED:
+        yield None
+        return
+    budget = ToolOutputBudget(tokens)
+    token = _current_budget.set(budget)
+    try:
+        yield budget
+    finally:
+        _current_budget.reset(token)
+
+
+def budget_search_result(query: str, result: dict, text_column: str) -> dict:
+    """Budgets a Cortex Search result when the current task runs within ``tool_output_budget``."""
+    budget = _current_budget.get()
+    if budget is None:
+        return result
+    return budget.search_result(query, result, text_column)
+
+
+class BudgetedSearchMixin:
+    """
+    Budgets the results of a ``CortexSearchTool`` subclass's ``asearch`` within an agent run, see
+    ``tool_output_budget``. Listed before the tool class, e.g.
+    ``class Tool(BudgetedSearchMixin, TimedCortexSearchTool)``.
+    """
+
+    async def asearch(self, query: str):
+        result = await super().asearch(query)
+        return budget_search_result(query, result, self.retrieval_columns[0])
+
+
+def budget_analyst_result(result: dict) -> dict:
+    """Budgets a Cortex Analyst result when the current task runs within ``tool_output_budget``."""
+    budget = _current_budget.get()
+    if budget is None:
+        return result
+    return budget.analyst_result(result)
+
+
+tool_budget_stats = ToolBudgetStats()
+tracer.register_metrics(tool_budget_stats.metrics)
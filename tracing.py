@@ -0,0 +1,455 @@
+import asyncio
+import atexit
+import bisect
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from typing import Callable, NamedTuple
+
+import httpx
+from agent_gateway.tools.logger import gateway_logger
+
+from logging_util import current_log_request
+
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "false").lower() == "true"
+# "prometheus" for the latency histograms in the Prometheus text format, "otlp" for OTLP/JSON spans and metrics
+TRACING_EXPORT_FORMAT = os.getenv("TRACING_EXPORT_FORMAT", "prometheus").lower()
+# Local file the export is written to, and/or an HTTP endpoint it is sent to
+TRACING_EXPORT_PATH = os.getenv("TRACING_EXPORT_PATH")
+TRACING_EXPORT_ENDPOINT = os.getenv("TRACING_EXPORT_ENDPOINT")
+TRACING_EXPORT_INTERVAL_SECONDS = float(
+    os.getenv("TRACING_EXPORT_INTERVAL_SECONDS", "30")
+)
+TRACING_MAX_BUFFERED_SPANS = int(os.getenv("TRACING_MAX_BUFFERED_SPANS", "10000"))
+TRACING_SERVICE_NAME = os.getenv("TRACING_SERVICE_NAME", "linguatics-agents-demo")
+
+# Upper bounds, in seconds, of the latency histogram buckets
+LATENCY_BUCKETS = (
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    A timed stage of a request.
+
+    Spans started while another span is active become its children. The request wide attributes,
+    such as the request id and language, are shared by all spans of a request.
+    """
+
+    __slots__ = (
+        "name",
+        "trace_id",
+        "span_id",
+        "parent",
+        "attributes",
+        "request_attributes",
+        "start_ns",
+        "end_ns",
+        "outcome",
+    )
+
+    def __init__(self, name: str, parent: "Span | None", attributes: dict):
+        self.name = name
+        self.parent = parent
+        self.attributes = attributes
+        self.span_id = os.urandom(8).hex()
+        if parent is not None:
+            self.trace_id = parent.trace_id
+            self.request_attributes = parent.request_attributes
+        else:
+            request_id = current_log_request()
+            self.request_attributes = {"request_id": request_id}
+            try:
+                self.trace_id = uuid.UUID(str(request_id)).hex
+            except ValueError:
+                self.trace_id = uuid.uuid4().hex
+        self.start_ns = time.time_ns()
+        self.end_ns = None
+        self.outcome = None
+
+    def set(self, **attributes):
+        """Adds attributes to this span."""
+        self.attributes.update(attributes)
+
+    def set_request(self, **attributes):
+        """Adds attributes to every span of the request, including the ones already ended."""
+        self.request_attributes.update(attributes)
+
+    @property
+    def duration_seconds(self) -> float:
+        return (self.end_ns - self.start_ns) / 1e9
+
+    def all_attributes(self) -> dict:
+        return {**self.request_attributes, **self.attributes}
+
+
+def set_span_attributes(**attributes):
+    """Adds attributes to the innermost span the current task is in."""
+    span = _current_span.get()
+    if span is not None:
+        span.set(**attributes)
+
+
+def set_request_attributes(**attributes):
+    """Adds attributes, such as the detected language, to the spans of the current request."""
+    span = _current_span.get()
+    if span is not None:
+        span.set_request(**attributes)
+
+
+class Metric(NamedTuple):
+    """A gauge or counter sample collected at export time, see ``Tracer.register_metrics``."""
+
+    name: str
+    kind: str
+    description: str
+    value: float
+    labels: dict = {}
+
+
+class _Histogram:
+    __slots__ = ("buckets", "total", "count")
+
+    def __init__(self):
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float):
+        self.buckets[bisect.bisect_left(LATENCY_BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.count += 1
+
+
+def _otlp_value(value) -> dict:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: dict) -> list:
+    return [
+        {"key": key, "value": _otlp_value(value)}
+        for key, value in attributes.items()
+        if value is not None
+    ]
+
+
+class Tracer:
+    """
+    Records spans into per stage latency histograms and exports them periodically.
+
+    With the "prometheus" format the histograms are written to ``export_path`` in the Prometheus text
+    format (e.g. for a node exporter textfile collector) and/or PUT to ``export_endpoint`` (e.g. a
+    Pushgateway). With the "otlp" format the spans and histograms are appended to ``export_path`` as
+    OTLP/JSON lines and/or POSTed to the ``/v1/traces`` and ``/v1/metrics`` paths of ``export_endpoint``.
+    Gauges and counters of the callbacks added with ``register_metrics`` are exported along with the
+    histograms. When disabled, ``span`` does nothing beyond one attribute check.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = TRACING_ENABLED,
+        export_format: str = TRACING_EXPORT_FORMAT,
+        export_path: str | None = TRACING_EXPORT_PATH,
+        export_endpoint: str | None = TRACING_EXPORT_ENDPOINT,
+        export_interval: float = TRACING_EXPORT_INTERVAL_SECONDS,
+        max_buffered_spans: int = TRACING_MAX_BUFFERED_SPANS,
+        service_name: str = TRACING_SERVICE_NAME,
+    ):
+        if export_format not in ("prometheus", "otlp"):
+            raise ValueError(
+                f"Unknown tracing export format {export_format!r}, use 'prometheus' or 'otlp'."
+            )
+        self.enabled = enabled
+        self.export_format = export_format
+        self.export_path = export_path
+        self.export_endpoint = export_endpoint
+        self.export_interval = export_interval
+        self.service_name = service_name
+        self._histograms = {}
+        self._spans = deque(maxlen=max_buffered_spans)
+        self._lock = threading.Lock()
+        self._exporter = None
+        self._collectors = []
+        self.dropped_spans = 0
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Times the ``with`` block as a span; yields None when tracing is disabled."""
+        if not self.enabled:
+            yield None
+            return
+
+        span = Span(name, _current_span.get(), attributes)
+        token = _current_span.set(span)
+        outcome = "error"
+        try:
+            yield span
+            outcome = "ok"
+        except (asyncio.CancelledError, GeneratorExit):
+            outcome = "cancelled"
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end_ns = time.time_ns()
+            span.outcome = outcome
+            self._record(span)
+
+    def register_metrics(self, collect: Callable[[], list[Metric]]):
+        """Adds a callback whose gauges and counters are exported along with the latency histograms."""
+        with self._lock:
+            self._collectors.append(collect)
+
+    def _collect_metrics(self) -> list[Metric]:
+        with self._lock:
+            collectors = list(self._collectors)
+        metrics = []
+        for collect in collectors:
+            try:
+                metrics.extend(collect())
+            except Exception as e:
+                gateway_logger.log("WARNING", f"Metrics collection failed: {e}")
+        return metrics
+
+    def _record(self, span: Span):
+        with self._lock:
+            key = (span.name, span.outcome)
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = _Histogram()
+            histogram.observe(span.duration_seconds)
+            if self.export_format == "otlp":
+                if len(self._spans) == self._spans.maxlen:
+                    self.dropped_spans += 1
+                self._spans.append(span)
+            if self._exporter is None and (self.export_path or self.export_endpoint):
+                self._start_exporter()
+
+    def _start_exporter(self):
+        stop = threading.Event()
+
+        def run():
+            while not stop.wait(self.export_interval):
+                self.export()
+
+        self._exporter = threading.Thread(
+            target=run, name="tracing-export", daemon=True
+        )
+        self._exporter.start()
+        atexit.register(lambda: (stop.set(), self.export()))
+
+    def prometheus_text(self) -> str:
+        """The latency histograms in the Prometheus text exposition format."""
+        metric = "linguatics_stage_duration_seconds"
+        lines = [
+            f"# HELP {metric} Time spent per request stage.",
+            f"# TYPE {metric} histogram",
+        ]
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            for (stage, outcome), histogram in histograms:
+                labels = f'stage="{stage}",outcome="{outcome}"'
+                cumulative = 0
+                for bound, count in zip(LATENCY_BUCKETS, histogram.buckets):
+                    cumulative += count
+                    lines.append(
+                        f'{metric}_bucket{{{labels},le="{bound}"}} {cumulative}'
+                    )
+                lines.append(f'{metric}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+                lines.append(f"{metric}_sum{{{labels}}} {histogram.total}")
+                lines.append(f"{metric}_count{{{labels}}} {histogram.count}")
+            dropped_spans = self.dropped_spans
+        metrics = [
+            Metric(
+                "linguatics_dropped_spans_total",
+                "counter",
+                "Spans dropped because the export buffer was full.",
+                dropped_spans,
+            ),
+            *self._collect_metrics(),
+        ]
+        described = set()
+        for metric in metrics:
+            if metric.name not in described:
+                described.add(metric.name)
+                lines.append(f"# HELP {metric.name} {metric.description}")
+                lines.append(f"# TYPE {metric.name} {metric.kind}")
+            labels = ",".join(f'{k}="{v}"' for k, v in metric.labels.items())
+            lines.append(
+                f"{metric.name}{{{labels}}} {metric.value}"
+                if labels
+                else f"{metric.name} {metric.value}"
+            )
+        return "\n".join(lines) + "\n"
+
+    def _resource(self) -> dict:
+        return {"attributes": _otlp_attributes({"service.name": self.service_name})}
+
+    def otlp_traces(self, spans: list[Span]) -> dict:
+        """The given spans as an OTLP/JSON ExportTraceServiceRequest."""
+        return {
+            "resourceSpans": [
+                {
+                    "resource": self._resource(),
+                    "scopeSpans": [
+                        {
+                            "scope": {"name": "tracing"},
+                            "spans": [
+                                {
+                                    "traceId": span.trace_id,
+                                    "spanId": span.span_id,
+                                    "parentSpanId": span.parent.span_id
+                                    if span.parent is not None
+                                    else "",
+                                    "name": span.name,
+                                    "kind": 1,
+                                    "startTimeUnixNano": str(span.start_ns),
+                                    "endTimeUnixNano": str(span.end_ns),
+                                    "attributes": _otlp_attributes(
+                                        {
+                                            **span.all_attributes(),
+                                            "outcome": span.outcome,
+                                        }
+                                    ),
+                                    # 1 is OK, 2 is ERROR
+                                    "status": {
+                                        "code": 1 if span.outcome == "ok" else 2
+                                    },
+                                }
+                                for span in spans
+                            ],
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def otlp_metrics(self) -> dict:
+        """The latency histograms and registered metrics as an OTLP/JSON ExportMetricsServiceRequest."""
+        now = str(time.time_ns())
+        with self._lock:
+            data_points = [
+                {
+                    "attributes": _otlp_attributes(
+                        {"stage": stage, "outcome": outcome}
+                    ),
+                    "timeUnixNano": now,
+                    "count": str(histogram.count),
+                    "sum": histogram.total,
+                    "bucketCounts": [str(c) for c in histogram.buckets],
+                    "explicitBounds": list(LATENCY_BUCKETS),
+                }
+                for (stage, outcome), histogram in sorted(self._histograms.items())
+            ]
+        metrics = [
+            {
+                "name": "linguatics.stage.duration",
+                "unit": "s",
+                "histogram": {
+                    # 2 is AGGREGATION_TEMPORALITY_CUMULATIVE
+                    "aggregationTemporality": 2,
+                    "dataPoints": data_points,
+                },
+            }
+        ]
+        for metric in self._collect_metrics():
+            data_point = {
+                "attributes": _otlp_attributes(metric.labels),
+                "timeUnixNano": now,
+                "asDouble": float(metric.value),
+            }
+            if metric.kind == "counter":
+                data = {
+                    "sum": {
+                        "aggregationTemporality": 2,
+                        "isMonotonic": True,
+                        "dataPoints": [data_point],
+                    }
+                }
+            else:
+                data = {"gauge": {"dataPoints": [data_point]}}
+            metrics.append(
+                {"name": metric.name, "description": metric.description, **data}
+            )
+        return {
+            "resourceMetrics": [
+                {
+                    "resource": self._resource(),
+                    "scopeMetrics": [
+                        {
+                            "scope": {"name": "tracing"},
+                            "metrics": metrics,
+                        }
+                    ],
+                }
+            ]
+        }
+
+    def export(self):
+        """Writes and sends the current metrics, and the spans ended since the last export."""
+        try:
+            if self.export_format == "prometheus":
+                self._export_prometheus()
+            else:
+                self._export_otlp()
+        except Exception as e:
+            gateway_logger.log("WARNING", f"Tracing export failed: {e}")
+
+    def _export_prometheus(self):
+        text = self.prometheus_text()
+        if self.export_path:
+            # Written to a temporary file first so scrapers never read a partial file
+            tmp_path = f"{self.export_path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write(text)
+            os.replace(tmp_path, self.export_path)
+        if self.export_endpoint:
+            httpx.put(
+                self.export_endpoint,
+                content=text,
+                headers={"Content-Type": "text/plain; version=0.0.4"},
+            ).raise_for_status()
+
+    def _export_otlp(self):
+        with self._lock:
+            spans = list(self._spans)
+            self._spans.clear()
+        documents = [("metrics", self.otlp_metrics())]
+        if spans:
+            documents.insert(0, ("traces", self.otlp_traces(spans)))
+        if self.export_path:
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                for _, document in documents:
+                    f.write(json.dumps(document) + "\n")
+        if self.export_endpoint:
+            base = self.export_endpoint.rstrip("/")
+            for signal, document in documents:
+                httpx.post(f"{base}/v1/{signal}", json=document).raise_for_status()
+
+
+tracer = Tracer()
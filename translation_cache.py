@@ -0,0 +1,198 @@
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+TRANSLATION_CACHE_MAX_ENTRIES = int(os.getenv("TRANSLATION_CACHE_MAX_ENTRIES", "1024"))
+TRANSLATION_CACHE_TTL_SECONDS = float(
+    os.getenv("TRANSLATION_CACHE_TTL_SECONDS", "86400")
+)
+# Optional path to a SQLite file; when unset only the in-memory tier is used
+TRANSLATION_CACHE_DB = os.getenv("TRANSLATION_CACHE_DB")
+TRANSLATION_CACHE_DB_MAX_ENTRIES = int(
+    os.getenv("TRANSLATION_CACHE_DB_MAX_ENTRIES", "100000")
+)
+# Writes between trims of the SQLite tier, which may exceed its maximum by as many entries
+TRANSLATION_CACHE_DB_TRIM_INTERVAL = 100
+
+_SPACES_RE = re.compile(r"[ \t\f\v]+")
+_LINE_BREAK_RE = re.compile(r" ?(?:\r\n|\r|\n) ?")
+
+
+def normalize_text(text: str) -> str:
+    """
+    Normalizes text for cache lookups: NFC form, runs of spaces and tabs collapsed, stripped ends.
+
+    Line breaks are kept, so texts that only differ in their line or markdown layout, which the
+    translation keeps, have different keys.
+    """
+    text = _SPACES_RE.sub(" ", unicodedata.normalize("NFC", text))
+    return _LINE_BREAK_RE.sub("\n", text).strip()
+
+
+def cache_key(
+    source_lang: str,
+    target_lang: str,
+    model: str,
+    mode: str | None,
+    text: str,
+) -> str:
+    """
+    Build the cache key for a translation request.
+
+    Args:
+        source_lang (str): The source language code (e.g., 'hi-IN').
+        target_lang (str): The target language code (e.g., 'en-IN').
+        model (str): The SarvamAI model used for the translation.
+        mode (str | None): The translation mode, if any (e.g., 'modern-colloquial').
+        text (str): The text being translated; it is normalized before keying.
+
+    Returns:
+        str: A key that is identical for requests that would produce the same translation.
+    """
+    return "\x1f".join(
+        [source_lang, target_lang, model, mode or "", normalize_text(text)]
+    )
+
+
+class TranslationCache:
+    """
+    Two tier cache for translations.
+
+    The first tier is an in-memory LRU bounded by ``max_entries`` with a per entry TTL.
+    The optional second tier is a SQLite file so translations survive Streamlit restarts;
+    entries found on disk are promoted back into memory.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = TRANSLATION_CACHE_MAX_ENTRIES,
+        ttl_seconds: float = TRANSLATION_CACHE_TTL_SECONDS,
+        db_path: str | None = None,
+        db_max_entries: int = TRANSLATION_CACHE_DB_MAX_ENTRIES,
+    ):
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.db_max_entries = db_max_entries
+        self._writes_since_trim = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._db = None
+        if db_path:
+            self._db = sqlite3.connect(db_path, check_same_thread=False)
+            self._db.execute(
+                """CREATE TABLE IF NOT EXISTS translations (
+                    key TEXT PRIMARY KEY,
+                    value TEXT NOT NULL,
+                    expires_at REAL NOT NULL,
+                    last_used REAL NOT NULL
+                )"""
+            )
+            self._db.execute(
+                "CREATE INDEX IF NOT EXISTS translations_last_used ON translations (last_used)"
+            )
+            self._db.commit()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @classmethod
+    def from_env(cls) -> "TranslationCache":
+        return cls(db_path=TRANSLATION_CACHE_DB)
+
+    def get(self, key: str) -> str | None:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+                self.expirations += 1
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM translations WHERE key = ?", (key,)
+                ).fetchone()
+                if row is not None:
+                    value, expires_at = row
+                    if expires_at > now:
+                        self._db.execute(
+                            "UPDATE translations SET last_used = ? WHERE key = ?",
+                            (now, key),
+                        )
+                        self._db.commit()
+                        self._store(key, value, expires_at)
+                        self.disk_hits += 1
+                        return value
+                    self._db.execute("DELETE FROM translations WHERE key = ?", (key,))
+                    self._db.commit()
+                    self.expirations += 1
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, value: str):
+        now = time.time()
+        expires_at = now + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO translations (key, value, expires_at, last_used) VALUES (?, ?, ?, ?)",
+                    (key, value, expires_at, now),
+                )
+                self._writes_since_trim += 1
+                if self._writes_since_trim >= TRANSLATION_CACHE_DB_TRIM_INTERVAL:
+                    self._trim_db(now)
+                self._db.commit()
+
+    def _store(self, key: str, value: str, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def _trim_db(self, now: float):
+        self._writes_since_trim = 0
+        self._db.execute("DELETE FROM translations WHERE expires_at <= ?", (now,))
+        (count,) = self._db.execute("SELECT COUNT(*) FROM translations").fetchone()
+        overflow = count - self.db_max_entries
+        if overflow > 0:
+            self._db.execute(
+                "DELETE FROM translations WHERE rowid IN (SELECT rowid FROM translations ORDER BY last_used LIMIT ?)",
+                (overflow,),
+            )
+            self.evictions += overflow
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM translations")
+                self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "size": len(self._entries),
+            }
+
+
+translation_cache = TranslationCache.from_env()